@@ -0,0 +1,204 @@
+"""
+Synthetic dataset for benchmarks.
+
+Rows are generated lazily and written with bulk_create in chunks so large
+datasets never sit in memory as model instances. Every user gets the same
+password (BENCHMARK_PASSWORD) so the login endpoint can be exercised.
+"""
+import random
+from datetime import timedelta
+from itertools import islice
+from django.contrib.auth.hashers import make_password
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from competitions.models import Competition, Participant, CompetitionInvitation
+from competitions.services import CompetitionService
+from friendships.models import FriendList
+from screentime.models import ScreenTimeEntry
+from screentime.services import ScreenTimeService
+from users.models import User, Profile
+
+BENCHMARK_PASSWORD = 'benchmark-password'
+
+
+def chunked(iterable, size):
+    """Yield lists of at most size items from iterable"""
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def bulk_insert(model, rows, chunk_size):
+    """bulk_create the rows of a generator chunk by chunk; return the created objects' pks"""
+    pks = []
+    for chunk in chunked(rows, chunk_size):
+        pks.extend(obj.pk for obj in model.objects.bulk_create(chunk))
+    return pks
+
+
+def power_law_edges(user_ids, edges_per_user, rng):
+    """
+    Undirected friendships by preferential attachment: each user befriends
+    edges_per_user earlier users picked proportionally to their degree, so
+    a few users end up with many friends and most with few.
+    """
+    # Every user appears in `weighted` once per friendship it is part of
+    weighted = []
+    for index, user_id in enumerate(user_ids):
+        wanted = min(edges_per_user, index)
+        chosen = set()
+        while len(chosen) < wanted:
+            pool = weighted if weighted and rng.random() < 0.9 else user_ids[:index]
+            chosen.add(rng.choice(pool))
+        for friend_id in chosen:
+            weighted.extend((user_id, friend_id))
+            yield user_id, friend_id
+
+
+def competition_size(rng, user_count):
+    """Participant count from a heavy-tailed distribution: mostly small groups, a few large ones"""
+    return max(2, min(user_count, int(rng.paretovariate(1.2) * 2)))
+
+
+class DatasetGenerator:
+    """Write a synthetic dataset; counts of created rows are kept in self.created"""
+
+    def __init__(self, users, competitions, days, chunk_size=1000, edges_per_user=3, prefix='bench', seed=0):
+        self.user_count = users
+        self.competition_count = competitions
+        self.days = days
+        self.chunk_size = chunk_size
+        self.edges_per_user = edges_per_user
+        self.prefix = prefix
+        self.rng = random.Random(seed)
+        self.now = timezone.now()
+        self.created = {}
+
+    def generate(self):
+        user_ids = self.create_users()
+        friends = self.create_friendships(user_ids)
+        competitions = self.create_competitions(user_ids)
+        self.create_invitations(competitions, friends)
+        self.create_screen_time(competitions)
+        return self.created
+
+    def create_users(self):
+        password = make_password(BENCHMARK_PASSWORD)
+        users = (
+            User(username=f'{self.prefix}{i}', email=f'{self.prefix}{i}@example.com', password=password)
+            for i in range(self.user_count)
+        )
+        user_ids = bulk_insert(User, users, self.chunk_size)
+        bulk_insert(Profile, (Profile(user_id=user_id, name=f'User {user_id}') for user_id in user_ids), self.chunk_size)
+        bulk_insert(Token, (Token(user_id=user_id, key=Token.generate_key()) for user_id in user_ids), self.chunk_size)
+        self.created['users'] = len(user_ids)
+        return user_ids
+
+    def create_friendships(self, user_ids):
+        """Friend lists of every user; returns {user_id: set of friend ids}"""
+        list_ids = dict(zip(
+            user_ids,
+            bulk_insert(FriendList, (FriendList(user_id=user_id) for user_id in user_ids), self.chunk_size),
+        ))
+        friends = {user_id: set() for user_id in user_ids}
+        through = FriendList.friends.through
+
+        def rows():
+            for user_id, friend_id in power_law_edges(user_ids, self.edges_per_user, self.rng):
+                friends[user_id].add(friend_id)
+                friends[friend_id].add(user_id)
+                yield through(friendlist_id=list_ids[user_id], user_id=friend_id)
+                yield through(friendlist_id=list_ids[friend_id], user_id=user_id)
+
+        self.created['friendships'] = len(bulk_insert(through, rows(), self.chunk_size)) // 2
+        return friends
+
+    def create_competitions(self, user_ids):
+        """Past, running and upcoming competitions; returns [(competition, participant ids)]"""
+        specs = []
+        for i in range(self.competition_count):
+            start = self.now + timedelta(days=self.rng.randint(-self.days, self.days // 2 or 1))
+            end = start + timedelta(days=self.rng.choice((7, 14, 30)))
+            members = self.rng.sample(user_ids, competition_size(self.rng, len(user_ids)))
+            specs.append((Competition(
+                title=f'Benchmark competition {i}',
+                description='Synthetic benchmark data',
+                creator_id=members[0],
+                start_date=start,
+                end_date=end,
+                status='upcoming' if start > self.now else 'completed' if end < self.now else 'active',
+            ), members))
+
+        competitions = []
+        for chunk in chunked(specs, self.chunk_size):
+            created = Competition.objects.bulk_create([competition for competition, members in chunk])
+            competitions.extend(zip(created, (members for competition, members in chunk)))
+
+        participants = (
+            Participant(user_id=user_id, competition_id=competition.id)
+            for competition, members in competitions for user_id in members
+        )
+        self.created['competitions'] = len(competitions)
+        self.created['participants'] = len(bulk_insert(Participant, participants, self.chunk_size))
+        return competitions
+
+    def create_invitations(self, competitions, friends):
+        """Pending invitations from creators of upcoming competitions to a few of their friends"""
+        def rows():
+            for competition, members in competitions:
+                if competition.start_date <= self.now:
+                    continue
+                candidates = sorted(friends[competition.creator_id] - set(members))
+                for receiver_id in self.rng.sample(candidates, min(3, len(candidates))):
+                    yield CompetitionInvitation(
+                        competition_id=competition.id, sender_id=competition.creator_id, receiver_id=receiver_id
+                    )
+
+        self.created['invitations'] = len(bulk_insert(CompetitionInvitation, rows(), self.chunk_size))
+
+    def create_screen_time(self, competitions):
+        """
+        Record a daily screen-time series for every participant of a started
+        competition, build the rollups and usage summaries from it, fold the
+        days inside each competition into average_daily_usage the way
+        update_user_screen_time does, and rank.
+        """
+        started = [competition.id for competition, members in competitions if competition.start_date <= self.now]
+        user_ids = set()
+        for chunk in chunked(started, self.chunk_size):
+            user_ids.update(Participant.objects.filter(competition_id__in=chunk).values_list('user_id', flat=True))
+        user_ids = sorted(user_ids)
+        dates = [self.now.date() - timedelta(days=offset) for offset in range(self.days - 1, -1, -1)]
+        entries = updated = 0
+        for chunk in chunked(user_ids, self.chunk_size):
+            series = {}
+            for user_id in chunk:
+                mean = self.rng.lognormvariate(5, 0.4)
+                series[user_id] = [(date, round(max(0.0, self.rng.gauss(mean, mean / 4)), 1)) for date in dates]
+            entries += len(bulk_insert(ScreenTimeEntry, (
+                ScreenTimeEntry(user_id=user_id, date=date, minutes=minutes)
+                for user_id, days in series.items() for date, minutes in days
+            ), self.chunk_size))
+            participants = list(Participant.objects.filter(
+                user_id__in=chunk, competition__start_date__lte=self.now
+            ).select_related('competition'))
+            for participant in participants:
+                competition = participant.competition
+                last_day = min(self.now, competition.end_date).date()
+                days = series[participant.user_id]
+                window = [minutes for date, minutes in days if competition.start_date.date() <= date <= last_day]
+                usage = None
+                for minutes in window or [days[-1][1]]:
+                    usage = minutes if usage is None else (usage + minutes) / 2
+                participant.average_daily_usage = round(usage, 1)
+            Participant.objects.bulk_update(participants, ['average_daily_usage'], batch_size=self.chunk_size)
+            updated += len(participants)
+        for chunk in chunked(started, self.chunk_size):
+            CompetitionService.recalculate_rankings(chunk)
+        self.created['screen_time_entries'] = entries
+        self.created['screen_time_rollups'] = ScreenTimeService.rebuild_rollups(user_ids, batch_size=self.chunk_size)
+        self.created['usage_summaries'] = ScreenTimeService.rebuild_summaries(user_ids, batch_size=self.chunk_size)
+        self.created['screen_time_participants'] = updated
@@ -0,0 +1,178 @@
+"""Helpers shared by the benchmark commands: ports, servers, load and stats"""
+import http.client
+import os
+import re
+import socket
+import threading
+import time
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers (None if empty)"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def latency_summary(latencies):
+    """p50/p95/p99/max in milliseconds from a list of seconds"""
+    return {
+        f'{name}_ms': round(value * 1000, 2) if value is not None else None
+        for name, value in (
+            ('p50', percentile(latencies, 50)),
+            ('p95', percentile(latencies, 95)),
+            ('p99', percentile(latencies, 99)),
+            ('max', max(latencies) if latencies else None),
+        )
+    }
+
+
+def wait_for_http(port, path, timeout=60.0, process=None):
+    """Poll until the server answers 200 on path; return elapsed seconds"""
+    started = time.perf_counter()
+    while time.perf_counter() - started < timeout:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(f"Server exited with code {process.returncode}")
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=2)
+            conn.request('GET', path)
+            if conn.getresponse().status == 200:
+                return time.perf_counter() - started
+        except OSError:
+            pass
+        time.sleep(0.02)
+    raise RuntimeError("Server did not become ready before the timeout")
+
+
+_QUERY_COUNT = re.compile(r'sql;[^,]*desc="(\d+) queries')
+
+
+def server_timing_queries(header):
+    """Query count from the Server-Timing header of SQLInstrumentationMiddleware (None if unsampled)"""
+    match = _QUERY_COUNT.search(header or '')
+    return int(match.group(1)) if match else None
+
+
+class HTTPTransport:
+    """Keep-alive HTTP connections to a local server"""
+
+    def __init__(self, port, headers=None):
+        self.port = port
+        self.headers = headers or {}
+
+    def connect(self):
+        return http.client.HTTPConnection('127.0.0.1', self.port, timeout=30)
+
+    def send(self, conn, method, path, body=None, content_type=None):
+        """Perform one request; return (status, query count or None)"""
+        headers = dict(self.headers)
+        if content_type:
+            headers['Content-Type'] = content_type
+        conn.request(method, path, body=body, headers=headers)
+        response = conn.getresponse()
+        response.read()
+        return response.status, server_timing_queries(response.getheader('Server-Timing'))
+
+    def close(self, conn):
+        conn.close()
+
+
+def run_load(transport, requests, duration, concurrency):
+    """
+    Replay (method, path, body, content_type) requests round-robin from
+    `concurrency` threads, each with its own transport connection, for
+    `duration` seconds. Responses >= 500 and transport errors count as errors.
+
+    Returns (samples, error count, elapsed seconds) where samples are
+    (latency in seconds, status, query count) tuples.
+    """
+    samples = []
+    errors = [0]
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def client(offset):
+        conn = transport.connect()
+        local, failed, i = [], 0, offset
+        try:
+            while time.perf_counter() < deadline:
+                request = requests[i % len(requests)]
+                i += 1
+                started = time.perf_counter()
+                try:
+                    status, queries = transport.send(conn, *request)
+                except (OSError, http.client.HTTPException):
+                    failed += 1
+                    transport.close(conn)
+                    conn = transport.connect()
+                    continue
+                if status >= 500:
+                    failed += 1
+                local.append((time.perf_counter() - started, status, queries))
+        finally:
+            transport.close(conn)
+            with lock:
+                samples.extend(local)
+                errors[0] += failed
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=client, args=(n,)) for n in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return samples, errors[0], time.perf_counter() - started
+
+
+def run_http_load(port, requests, duration, concurrency, headers=None):
+    """
+    run_load against a local HTTP server.
+
+    Returns (latencies in seconds, error count, elapsed seconds).
+    """
+    samples, errors, elapsed = run_load(HTTPTransport(port, headers), requests, duration, concurrency)
+    return [sample[0] for sample in samples], errors, elapsed
+
+
+def process_tree(pid):
+    """pid and all its descendants (Linux /proc)"""
+    children = {}
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as stat:
+                ppid = int(stat.read().rsplit(')', 1)[1].split()[1])
+        except (OSError, ValueError, IndexError):
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+    tree, pending = [], [pid]
+    while pending:
+        current = pending.pop()
+        tree.append(current)
+        pending.extend(children.get(current, []))
+    return tree
+
+
+def memory_mb(pids):
+    """Summed RSS and PSS (proportional, counts shared pages once) in MB"""
+    rss = pss = 0
+    for pid in pids:
+        try:
+            with open(f'/proc/{pid}/smaps_rollup') as rollup:
+                for line in rollup:
+                    if line.startswith('Rss:'):
+                        rss += int(line.split()[1])
+                    elif line.startswith('Pss:'):
+                        pss += int(line.split()[1])
+        except OSError:
+            continue
+    return round(rss / 1024, 1), round(pss / 1024, 1)
@@ -0,0 +1,59 @@
+import json
+import shlex
+import statistics
+import subprocess
+import time
+import urllib.error
+import urllib.request
+from django.core.management.base import BaseCommand, CommandError
+from benchmarks.load import free_port
+
+
+class Command(BaseCommand):
+    help = "Measure time from server start to first HTTP response (cold start)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=5)
+        parser.add_argument('--path', default='/isauth/', help="Path requested once the server is started")
+        parser.add_argument(
+            '--command',
+            default='gunicorn -c gunicorn.conf.py --bind 127.0.0.1:{port} --workers 1',
+            help="Server command; {port} is replaced with a free port",
+        )
+        parser.add_argument('--timeout', type=float, default=60.0)
+
+    def handle(self, *args, **options):
+        timings = [self.measure(options) for _ in range(options['runs'])]
+        report = {
+            'command': options['command'],
+            'path': options['path'],
+            'runs_ms': [round(t * 1000, 1) for t in timings],
+            'min_ms': round(min(timings) * 1000, 1),
+            'median_ms': round(statistics.median(timings) * 1000, 1),
+            'max_ms': round(max(timings) * 1000, 1),
+        }
+        self.stdout.write(json.dumps(report, indent=2))
+
+    def measure(self, options):
+        """Start the server and poll until it answers; return elapsed seconds"""
+        port = free_port()
+        url = f"http://127.0.0.1:{port}{options['path']}"
+        command = shlex.split(options['command'].format(port=port))
+        started = time.perf_counter()
+        process = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            while time.perf_counter() - started < options['timeout']:
+                if process.poll() is not None:
+                    raise CommandError(f"Server exited with code {process.returncode}")
+                try:
+                    urllib.request.urlopen(url, timeout=1)
+                except urllib.error.HTTPError:
+                    pass  # Any HTTP status means the app answered
+                except (urllib.error.URLError, ConnectionError):
+                    time.sleep(0.01)
+                    continue
+                return time.perf_counter() - started
+            raise CommandError("Server did not answer before the timeout")
+        finally:
+            process.terminate()
+            process.wait()
@@ -0,0 +1,71 @@
+import json
+import os
+import subprocess
+from django.core.management.base import BaseCommand, CommandError
+from benchmarks.load import free_port, wait_for_http, run_http_load, latency_summary, process_tree, memory_mb
+from users.models import Profile, User
+from users.services import UserService
+
+DEFAULT_PATHS = ['/profile/', '/friendships/', '/competitions/', '/competitions/invitations/']
+
+
+class Command(BaseCommand):
+    help = "Load-test each gunicorn.conf.py preset and report throughput against memory"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--presets', nargs='+', default=['sync', 'gthread', 'asgi'])
+        parser.add_argument('--duration', type=float, default=10.0, help="Seconds of load per preset")
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument('--paths', nargs='+', default=DEFAULT_PATHS)
+        parser.add_argument('--workers', type=int, help="Override the preset's worker count")
+
+    def handle(self, *args, **options):
+        token = self.benchmark_token()
+        requests = [('GET', path, None, None) for path in options['paths']]
+        results = [self.run_preset(preset, token, requests, options) for preset in options['presets']]
+        self.stdout.write(json.dumps(results, indent=2))
+
+    def benchmark_token(self):
+        user, created = User.objects.get_or_create(
+            username='bench_gunicorn', defaults={'email': 'bench_gunicorn@example.com'}
+        )
+        Profile.objects.get_or_create(user=user, defaults={'name': user.username})
+        return UserService.get_or_create_auth_token(user).key
+
+    def run_preset(self, preset, token, requests, options):
+        port = free_port()
+        env = dict(
+            os.environ,
+            GUNICORN_PRESET=preset,
+            GUNICORN_BIND=f'127.0.0.1:{port}',
+            GUNICORN_MAX_WORKER_RSS_MB='0',
+            GUNICORN_LOG_LEVEL='warning',
+        )
+        if options['workers']:
+            env['GUNICORN_WORKERS'] = str(options['workers'])
+        process = subprocess.Popen(['gunicorn', '-c', 'gunicorn.conf.py'], env=env)
+        try:
+            try:
+                wait_for_http(port, '/internal/ready/', process=process)
+            except RuntimeError as exc:
+                raise CommandError(f"{preset}: {exc}")
+            idle_rss, idle_pss = memory_mb(process_tree(process.pid))
+            latencies, errors, elapsed = run_http_load(
+                port, requests, options['duration'], options['concurrency'],
+                headers={'Authorization': f'Token {token}'},
+            )
+            rss, pss = memory_mb(process_tree(process.pid))
+        finally:
+            process.terminate()
+            process.wait()
+        return {
+            'preset': preset,
+            'requests': len(latencies),
+            'errors': errors,
+            'throughput_rps': round(len(latencies) / elapsed, 1),
+            **latency_summary(latencies),
+            'idle_rss_mb': idle_rss,
+            'idle_pss_mb': idle_pss,
+            'loaded_rss_mb': rss,
+            'loaded_pss_mb': pss,
+        }
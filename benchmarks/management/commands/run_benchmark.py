@@ -0,0 +1,100 @@
+import json
+import os
+import subprocess
+from django.core.management.base import BaseCommand, CommandError
+from django.test import override_settings
+from benchmarks.load import free_port, wait_for_http, HTTPTransport
+from benchmarks.runner import ClientTransport, benchmark_context, plan, measure, compare
+from users.models import User
+from users.services import UserService
+
+
+class Command(BaseCommand):
+    help = (
+        "Drive every URL of the project under concurrency (test client or a local "
+        "gunicorn) and report throughput, latency percentiles and query counts as JSON"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--username', default='bench0', help="User the requests are made as (see seed_benchmark_data)")
+        parser.add_argument('--duration', type=float, default=5.0, help="Seconds of load per endpoint")
+        parser.add_argument('--concurrency', type=int, default=4)
+        parser.add_argument('--endpoints', nargs='+', help="Only these URL names")
+        parser.add_argument('--server', action='store_true', help="Start gunicorn on a free port instead of using the test client")
+        parser.add_argument('--preset', default='gthread', help="gunicorn.conf.py preset for --server")
+        parser.add_argument('--output', help="Write the JSON report to this file")
+        parser.add_argument('--compare', help="Baseline report to compare against")
+        parser.add_argument('--threshold', type=float, default=20.0, help="Allowed p95 growth in percent before failing")
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.select_related('profile').get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError(f"User {options['username']} not found; run seed_benchmark_data first")
+        token = UserService.get_or_create_auth_token(user).key
+
+        requests, skipped = plan(benchmark_context(user))
+        if options['endpoints']:
+            unknown = set(options['endpoints']) - set(requests)
+            if unknown:
+                raise CommandError(f"Cannot benchmark: {', '.join(sorted(unknown))}")
+            requests = {name: requests[name] for name in options['endpoints']}
+
+        report = {
+            'mode': 'server' if options['server'] else 'client',
+            'duration': options['duration'],
+            'concurrency': options['concurrency'],
+            'users': User.objects.count(),
+            'skipped': skipped,
+        }
+        if options['server']:
+            report['preset'] = options['preset']
+            report['endpoints'] = self.run_server(token, requests, options)
+        else:
+            # One user hammering each endpoint is what the write throttles refuse
+            with override_settings(THROTTLE_ENABLED=False):
+                report['endpoints'] = self.run(ClientTransport(token), requests, options)
+
+        if options['compare']:
+            with open(options['compare']) as baseline:
+                report['comparison'] = compare(report, json.load(baseline), options['threshold'])
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as out:
+                out.write(output)
+        self.stdout.write(output)
+
+        regressed = sorted(name for name, change in report.get('comparison', {}).items() if change['regressed'])
+        if regressed:
+            raise CommandError(f"Regressed against the baseline: {', '.join(regressed)}")
+
+    def run(self, transport, requests, options):
+        results = {}
+        for name, request in requests.items():
+            results[name] = measure(transport, request, options['duration'], options['concurrency'])
+            self.stderr.write(f"{name}: {results[name]['throughput_rps']} req/s, p95 {results[name]['p95_ms']} ms")
+        return results
+
+    def run_server(self, token, requests, options):
+        port = free_port()
+        env = dict(
+            os.environ,
+            GUNICORN_PRESET=options['preset'],
+            GUNICORN_BIND=f'127.0.0.1:{port}',
+            GUNICORN_LOG_LEVEL='warning',
+            # Every response carries its query count in Server-Timing
+            SQL_INSTRUMENTATION_SAMPLE_RATE='1.0',
+            MONITORING_LOG_LEVEL='WARNING',
+            THROTTLE_ENABLED='false',
+        )
+        process = subprocess.Popen(['gunicorn', '-c', 'gunicorn.conf.py'], env=env)
+        try:
+            try:
+                wait_for_http(port, '/internal/ready/', process=process)
+            except RuntimeError as exc:
+                raise CommandError(str(exc))
+            return self.run(HTTPTransport(port, {'Authorization': f'Token {token}'}), requests, options)
+        finally:
+            process.terminate()
+            process.wait()
@@ -0,0 +1,41 @@
+import json
+import re
+import time
+from django.core.management.base import BaseCommand, CommandError
+from benchmarks.data import DatasetGenerator
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = "Generate a synthetic dataset (users, friend graph, competitions, invitations, screen time) for benchmarks"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--competitions', type=int, default=200)
+        parser.add_argument('--days', type=int, default=30, help="Days of screen-time history")
+        parser.add_argument('--friends-per-user', type=int, default=3, help="Edges added per user by preferential attachment")
+        parser.add_argument('--chunk-size', type=int, default=1000, help="Rows per bulk_create")
+        parser.add_argument('--prefix', default='bench', help="Username prefix of the generated users")
+        parser.add_argument('--seed', type=int, default=0, help="Random seed, for reproducible datasets")
+        parser.add_argument('--flush', action='store_true', help="Delete a previous dataset with the same prefix first")
+
+    def handle(self, *args, **options):
+        existing = User.objects.filter(username__regex=rf"^{re.escape(options['prefix'])}[0-9]+$")
+        if existing.exists():
+            if not options['flush']:
+                raise CommandError(f"Users named {options['prefix']}* already exist; pass --flush to replace them")
+            # Cascades to profiles, tokens, friend lists and created competitions
+            existing.delete()
+
+        started = time.perf_counter()
+        created = DatasetGenerator(
+            users=options['users'],
+            competitions=options['competitions'],
+            days=options['days'],
+            chunk_size=options['chunk_size'],
+            edges_per_user=options['friends_per_user'],
+            prefix=options['prefix'],
+            seed=options['seed'],
+        ).generate()
+        created['seconds'] = round(time.perf_counter() - started, 1)
+        self.stdout.write(json.dumps(created, indent=2))
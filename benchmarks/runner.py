@@ -0,0 +1,169 @@
+"""
+Endpoint benchmark: every URL pattern of the project is mapped to a
+repeatable request, driven under concurrency and summarised as JSON.
+"""
+import json
+from urllib.parse import urlencode
+from django.db import connections
+from django.db.models import Count
+from django.test import Client
+from django.urls import get_resolver, reverse, URLPattern
+from benchmarks.data import BENCHMARK_PASSWORD
+from benchmarks.load import run_load, latency_summary
+from competitions.models import Participant
+from monitoring.sql import record_queries
+
+JSON = 'application/json'
+FORM = 'application/x-www-form-urlencoded'
+
+# Endpoints that change the dataset on every call, so repeating them
+# would measure a different request each time (or fail after the first)
+WRITES = frozenset([
+    'signup', 'delete_user', 'send_friend_request', 'handle_friend_request', 'delete_friend',
+    'create_competition', 'leave_competition', 'send_competition_invitation',
+    'send_bulk_competition_invitations', 'handle_competition_invitation',
+])
+
+
+def _get(name):
+    return lambda context: ('GET', reverse(name), None, None)
+
+
+def _competition_detail(context):
+    if context['competition_id'] is None:
+        return None
+    return ('GET', reverse('get_competition_detail', args=[context['competition_id']]), None, None)
+
+
+def _batch(context):
+    """The home screen's five reads as one batch, to compare with home/"""
+    names = ['profile', 'friendships', 'friend_requests', 'get_competition_invitations', 'get_active_competitions']
+    body = {'requests': [{'path': reverse(name)} for name in names]}
+    return ('POST', reverse('batch'), json.dumps(body), JSON)
+
+
+SCENARIOS = {
+    'readiness': _get('readiness'),
+    'login': lambda context: (
+        'POST', reverse('login'),
+        json.dumps({'username': context['user'].username, 'password': BENCHMARK_PASSWORD}), JSON,
+    ),
+    'is_authenticated': _get('is_authenticated'),
+    'profile': _get('profile'),
+    'update_profile': lambda context: (
+        'PUT', reverse('update_profile'), urlencode({'name': context['user'].profile.name}), FORM,
+    ),
+    'get_friend_requests': _get('get_friend_requests'),
+    'friend_requests': _get('friend_requests'),
+    'friendships': _get('friendships'),
+    'get_competitions': _get('get_competitions'),
+    'get_active_competitions': _get('get_active_competitions'),
+    'get_future_competitions': _get('get_future_competitions'),
+    'get_competition_detail': _competition_detail,
+    'get_competition_invitations': _get('get_competition_invitations'),
+    'sync': _get('sync'),
+    'home': _get('home'),
+    'batch': _batch,
+    'update_screen_time': lambda context: (
+        'POST', reverse('update_screen_time'), json.dumps({'screen_time_minutes': 120}), JSON,
+    ),
+    'screen_time_history': lambda context: (
+        'GET', reverse('screen_time_history') + '?' + urlencode({'period': 'week'}), None, None,
+    ),
+    'friends_leaderboard': _get('friends_leaderboard'),
+}
+
+
+def url_names():
+    """(name, pattern) for every root URL; unnamed ones and included URLconfs by route"""
+    for pattern in get_resolver().url_patterns:
+        name = pattern.name if isinstance(pattern, URLPattern) else None
+        yield name or str(pattern.pattern), pattern
+
+
+def benchmark_context(user):
+    """Objects the scenarios need: the user and the largest competition they are in"""
+    participation = Participant.objects.filter(user=user).annotate(
+        size=Count('competition__participant')
+    ).order_by('-size').first()
+    return {
+        'user': user,
+        'competition_id': participation.competition_id if participation else None,
+    }
+
+
+def plan(context):
+    """(requests by endpoint name, {skipped name: reason}) for every URL of the project"""
+    requests, skipped = {}, {}
+    for name, pattern in url_names():
+        if not isinstance(pattern, URLPattern):
+            skipped[name] = 'included URLconf'
+        elif name in WRITES:
+            skipped[name] = 'changes the dataset on every call'
+        elif name not in SCENARIOS:
+            skipped[name] = 'no scenario'
+        else:
+            request = SCENARIOS[name](context)
+            if request is None:
+                skipped[name] = 'no data for this user'
+            else:
+                requests[name] = request
+    return requests, skipped
+
+
+class ClientTransport:
+    """In-process requests through the Django test client; exact query counts"""
+
+    def __init__(self, token):
+        self.token = token
+
+    def connect(self):
+        return Client(HTTP_AUTHORIZATION=f'Token {self.token}', raise_request_exception=False)
+
+    def send(self, client, method, path, body=None, content_type=None):
+        with record_queries() as recorder:
+            response = client.generic(method, path, data=body or '', content_type=content_type or JSON)
+        return response.status_code, recorder.count
+
+    def close(self, client):
+        # Database connections are per thread
+        connections.close_all()
+
+
+def measure(transport, request, duration, concurrency):
+    """Load one request; return throughput, latency percentiles and query counts"""
+    samples, errors, elapsed = run_load(transport, [request], duration, concurrency)
+    queries = [sample[2] for sample in samples if sample[2] is not None]
+    return {
+        'requests': len(samples),
+        'errors': errors,
+        'client_errors': sum(1 for sample in samples if 400 <= sample[1] < 500),
+        'throughput_rps': round(len(samples) / elapsed, 1),
+        **latency_summary([sample[0] for sample in samples]),
+        'avg_queries': round(sum(queries) / len(queries), 2) if queries else None,
+        'max_queries': max(queries) if queries else None,
+    }
+
+
+def compare(report, baseline, threshold):
+    """
+    Per-endpoint changes against a baseline report. An endpoint regresses
+    when its p95 grows by more than threshold percent or it runs more queries.
+    """
+    changes = {}
+    for name, current in report['endpoints'].items():
+        previous = baseline.get('endpoints', {}).get(name)
+        if previous is None:
+            continue
+        change = {}
+        for key in ('p95_ms', 'throughput_rps'):
+            if previous.get(key) and current.get(key) is not None:
+                change[f'{key}_change_pct'] = round((current[key] - previous[key]) / previous[key] * 100, 1)
+        if previous.get('avg_queries') is not None and current.get('avg_queries') is not None:
+            change['queries_delta'] = round(current['avg_queries'] - previous['avg_queries'], 2)
+        change['regressed'] = (
+            change.get('p95_ms_change_pct', 0) > threshold
+            or change.get('queries_delta', 0) > 0.5
+        )
+        changes[name] = change
+    return changes
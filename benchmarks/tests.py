@@ -0,0 +1,81 @@
+from django.test import TestCase, TransactionTestCase
+from rest_framework.authtoken.models import Token
+from competitions.models import Competition, Participant
+from friendships.models import FriendList
+from screentime.models import ScreenTimeEntry, ScreenTimeRollup, UserUsageSummary
+from users.models import User, Profile
+from .data import DatasetGenerator, power_law_edges
+from .runner import ClientTransport, benchmark_context, plan, measure, compare, WRITES
+import random
+
+class DatasetGeneratorTest(TestCase):
+    """Tests for the synthetic benchmark dataset"""
+
+    def test_generates_linked_rows(self):
+        generator = DatasetGenerator(users=50, competitions=10, days=5, chunk_size=7)
+        created = generator.generate()
+
+        self.assertEqual(created['users'], 50)
+        self.assertEqual(Profile.objects.count(), 50)
+        self.assertEqual(Token.objects.count(), 50)
+        self.assertEqual(FriendList.objects.count(), 50)
+        self.assertEqual(Competition.objects.count(), 10)
+        self.assertEqual(Participant.objects.count(), created['participants'])
+        # Friendships are symmetric
+        bench0 = User.objects.get(username='bench0')
+        for friend in FriendList.objects.get(user=bench0).friends.all():
+            self.assertTrue(FriendList.objects.get(user=friend).friends.filter(id=bench0.id).exists())
+        # Started competitions are ranked from the generated history
+        started = Participant.objects.filter(competition__start_date__lte=generator.now)
+        self.assertEqual(started.count(), created['screen_time_participants'])
+        self.assertFalse(started.filter(position__isnull=True).exists())
+        # Every ranked user has a daily history, its rollups and a usage summary
+        ranked = started.values('user_id').distinct().count()
+        self.assertEqual(ScreenTimeEntry.objects.count(), created['screen_time_entries'])
+        self.assertEqual(created['screen_time_entries'], ranked * 5)
+        self.assertEqual(ScreenTimeRollup.objects.count(), created['screen_time_rollups'])
+        self.assertGreater(created['screen_time_rollups'], 0)
+        self.assertEqual(UserUsageSummary.objects.count(), ranked)
+
+    def test_power_law_degrees(self):
+        degrees = {}
+        for user_id, friend_id in power_law_edges(list(range(2000)), 2, random.Random(1)):
+            degrees[user_id] = degrees.get(user_id, 0) + 1
+            degrees[friend_id] = degrees.get(friend_id, 0) + 1
+        ordered = sorted(degrees.values())
+        # A few hubs, while the median user keeps a handful of friends
+        self.assertGreater(ordered[-1], 10 * ordered[len(ordered) // 2])
+
+class BenchmarkRunnerTest(TransactionTestCase):
+    """Tests for the endpoint benchmark runner"""
+
+    def setUp(self):
+        DatasetGenerator(users=20, competitions=5, days=3).generate()
+        self.user = User.objects.get(username='bench0')
+
+    def test_plan_covers_every_url(self):
+        requests, skipped = plan(benchmark_context(self.user))
+        self.assertIn('friendships', requests)
+        self.assertIn('login', requests)
+        self.assertTrue(WRITES <= set(skipped))
+        self.assertNotIn('signup', requests)
+
+    def test_measure_with_test_client(self):
+        requests, skipped = plan(benchmark_context(self.user))
+        token = Token.objects.get(user=self.user).key
+        result = measure(ClientTransport(token), requests['friendships'], duration=0.2, concurrency=2)
+
+        self.assertGreater(result['requests'], 0)
+        self.assertEqual(result['errors'], 0)
+        self.assertEqual(result['client_errors'], 0)
+        self.assertIsNotNone(result['p95_ms'])
+        self.assertGreater(result['avg_queries'], 0)
+
+    def test_compare_flags_regressions(self):
+        baseline = {'endpoints': {'profile': {'p95_ms': 10.0, 'throughput_rps': 100.0, 'avg_queries': 3}}}
+        slower = {'endpoints': {'profile': {'p95_ms': 15.0, 'throughput_rps': 80.0, 'avg_queries': 3}}}
+        more_queries = {'endpoints': {'profile': {'p95_ms': 10.0, 'throughput_rps': 100.0, 'avg_queries': 5}}}
+
+        self.assertTrue(compare(slower, baseline, threshold=20)['profile']['regressed'])
+        self.assertFalse(compare(slower, baseline, threshold=60)['profile']['regressed'])
+        self.assertTrue(compare(more_queries, baseline, threshold=20)['profile']['regressed'])
@@ -0,0 +1,28 @@
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from competitions.services import CompetitionService
+
+
+class Command(BaseCommand):
+    help = "Close ended competitions into final-standings snapshots and archive old participants"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100, help="Competitions closed per transaction")
+        parser.add_argument(
+            '--archive-after-days', type=float, default=settings.COMPETITION_ARCHIVE_AFTER_DAYS,
+            help="Participant rows of competitions that ended longer ago move to the archive"
+        )
+        parser.add_argument('--loop', action='store_true', help="Keep closing periodically")
+        parser.add_argument('--interval', type=float, default=3600.0, help="Seconds between runs with --loop")
+
+    def handle(self, *args, **options):
+        archive_after = timedelta(days=options['archive_after_days'])
+        while True:
+            closed = CompetitionService.close_competitions(batch_size=options['batch_size'])
+            archived = CompetitionService.archive_participants(archive_after)
+            self.stdout.write(f"Closed {closed} competitions, archived {archived} participants")
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,20 @@
+import time
+from django.core.management.base import BaseCommand
+from competitions.services import CompetitionService
+
+
+class Command(BaseCommand):
+    help = "Expire pending invitations to competitions that have ended"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help="Invitations updated per statement")
+        parser.add_argument('--loop', action='store_true', help="Keep sweeping periodically")
+        parser.add_argument('--interval', type=float, default=300.0, help="Seconds between sweeps with --loop")
+
+    def handle(self, *args, **options):
+        while True:
+            expired = CompetitionService.expire_invitations(batch_size=options['batch_size'])
+            self.stdout.write(f"Expired {expired} invitations")
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
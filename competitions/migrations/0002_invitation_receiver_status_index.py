@@ -0,0 +1,19 @@
+# Generated by Django 5.2 on 2026-10-19 17:53
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('competitions', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='competitioninvitation',
+            index=models.Index(fields=['receiver', 'status', 'created_at'], name='invitation_receiver_status'),
+        ),
+    ]
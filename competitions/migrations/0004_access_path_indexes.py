@@ -0,0 +1,35 @@
+# Generated by Django 5.2 on 2026-10-19 18:41
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('competitions', '0003_competition_snapshots'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='competition',
+            index=models.Index(fields=['end_date', 'start_date'], name='competition_dates'),
+        ),
+        migrations.AddIndex(
+            model_name='competition',
+            index=models.Index(condition=models.Q(('status__in', ['active', 'upcoming'])), fields=['end_date'], name='competition_open_end'),
+        ),
+        migrations.AddIndex(
+            model_name='competitioninvitation',
+            index=models.Index(condition=models.Q(('status', 'pending')), fields=['competition'], name='invitation_pending'),
+        ),
+        migrations.AddIndex(
+            model_name='participant',
+            index=models.Index(fields=['competition', 'average_daily_usage'], name='participant_usage'),
+        ),
+        migrations.AddIndex(
+            model_name='participant',
+            index=models.Index(condition=models.Q(('average_daily_usage__isnull', False), ('position__isnull', False)), fields=['competition', 'position'], name='participant_ranked'),
+        ),
+    ]
@@ -1,4 +1,5 @@
 from django.db import models
+from django.db.models import Q
 from django.conf import settings
 
 class Competition(models.Model):
@@ -39,6 +40,13 @@ class Competition(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Running competitions (start_date <= now <= end_date); most have ended
+            models.Index(fields=['end_date', 'start_date'], name='competition_dates'),
+            # Competitions not closed yet, by end (close_competitions, future lists)
+            models.Index(fields=['end_date'], name='competition_open_end',
+                         condition=Q(status__in=['active', 'upcoming'])),
+        ]
     
     def __str__(self):
         return self.title
@@ -51,11 +59,48 @@ class Participant(models.Model):
     average_daily_usage = models.FloatField(null=True, blank=True)
 
     class Meta:
+        # Also the index of a user's participations (user, competition)
         unique_together = ('user', 'competition')
+        indexes = [
+            # Ranking a competition by usage
+            models.Index(fields=['competition', 'average_daily_usage'], name='participant_usage'),
+            # A competition's ranked participants in leaderboard order
+            models.Index(fields=['competition', 'position'], name='participant_ranked',
+                         condition=Q(average_daily_usage__isnull=False, position__isnull=False)),
+        ]
 
     def __str__(self):
         return f"{self.user} in {self.competition.title}"
     
+class CompetitionSnapshot(models.Model):
+    """
+    Final standings of a completed competition, written once when it is
+    closed. standings lists [participant_id, user_id, joined_at, position,
+    average_daily_usage] in leaderboard order: the first ranked_count rows
+    are ranked, the rest never reported screen time.
+    """
+    competition = models.OneToOneField(
+        Competition, on_delete=models.CASCADE, primary_key=True, related_name='snapshot'
+    )
+    standings = models.JSONField()
+    participant_count = models.PositiveIntegerField()
+    ranked_count = models.PositiveIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Final standings of {self.competition_id}"
+
+class ArchivedParticipant(models.Model):
+    """Membership in a closed competition whose Participant rows were archived"""
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='+')
+    competition = models.ForeignKey(Competition, on_delete=models.CASCADE, related_name='archived_participants')
+
+    class Meta:
+        unique_together = ('user', 'competition')
+
+    def __str__(self):
+        return f"{self.user_id} in {self.competition_id} (archived)"
+
 class CompetitionInvitation(models.Model):
     STATUS_CHOICES = (
         ('pending', 'Pending'),
@@ -74,6 +119,13 @@ class CompetitionInvitation(models.Model):
     class Meta:
         unique_together = ['competition', 'receiver']
         ordering = ['-created_at']
+        indexes = [
+            # A user's pending invitations, newest first
+            models.Index(fields=['receiver', 'status', 'created_at'], name='invitation_receiver_status'),
+            # Pending invitations of ended competitions (expire_invitations)
+            models.Index(fields=['competition'], name='invitation_pending',
+                         condition=Q(status='pending')),
+        ]
     
     def __str__(self):
         return f"Invitation to {self.competition.title} for {self.receiver.username}"
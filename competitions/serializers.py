@@ -26,12 +26,16 @@ class CompetitionListSerializer(serializers.ModelSerializer):
         return obj.get_status()
 
     def get_participant_count(self, obj):
-        return Participant.objects.filter(competition=obj).count()
+        # Annotated by CompetitionService.with_list_data
+        count = getattr(obj, 'participant_count', None)
+        if count is None:
+            count = Participant.objects.filter(competition=obj).count()
+        return count
     
     def get_is_creator(self, obj):
         request = self.context.get('request')
         if request and hasattr(request, 'user'):
-            return obj.creator.id == request.user.id
+            return obj.creator_id == request.user.id
         return False
     
 class CompetitionDetailSerializer(serializers.ModelSerializer):
@@ -52,13 +56,17 @@ class CompetitionDetailSerializer(serializers.ModelSerializer):
         return obj.get_status()
 
     def get_participants(self, obj):
-        participants = obj.participant_set.all()
-        return ParticipantSerializer(participants, many=True).data
+        # Closed competitions pass theirs in, rebuilt from the snapshot
+        participants = self.context.get('participants')
+        if participants is None:
+            participants = obj.participant_set.select_related('user__profile')
+        context = {**self.context, 'avatar_context': 'leaderboard'}
+        return ParticipantSerializer(participants, many=True, context=context).data
     
     def get_is_creator(self, obj):
         request = self.context.get('request')
         if request and hasattr(request, 'user'):
-            return obj.creator.id == request.user.id
+            return obj.creator_id == request.user.id
         return False
     
 class CompetitionInvitationSerializer(serializers.ModelSerializer):
@@ -1,63 +1,123 @@
 from django.utils import timezone
-from django.db.models import Q
+from django.db import transaction
+from django.db.models import Q, F, Count, IntegerField, Prefetch
+from django.db.models.functions import Coalesce
+from django.utils.dateparse import parse_datetime
 from django.contrib.auth import get_user_model
-from .models import Competition, Participant, CompetitionInvitation
+from .models import Competition, Participant, CompetitionInvitation, CompetitionSnapshot, ArchivedParticipant
 from friendships.services import FriendshipService
+from realtime import events
+from screentime.services import ScreenTimeService
+from sync import changes
+from monitoring.metrics import (
+    instrument_service, RANKING_RECOMPUTE_SECONDS, RANKING_PARTICIPANTS,
+    RANKING_POSITIONS_CHANGED, SCREEN_TIME_UPDATES, INVITATIONS_SENT, INVITATIONS_EXPIRED,
+    COMPETITIONS_CLOSED, PARTICIPANTS_ARCHIVED,
+)
 
 User = get_user_model()
 
+@instrument_service
 class CompetitionService:
-    
+
+    @staticmethod
+    def with_list_data(competitions):
+        """Load what CompetitionListSerializer needs in the same query"""
+        return competitions.select_related('creator__profile').annotate(
+            # Archived competitions have no Participant rows left to count
+            participant_count=Coalesce(
+                'snapshot__participant_count', Count('participant', distinct=True), output_field=IntegerField()
+            )
+        )
+
     @staticmethod
     def get_competitions_for_user(user):
-        """Get all competitions where the user participates"""
-        return Competition.objects.filter(
-            participant__user=user
-        ).distinct().order_by('-created_at')
+        """Get all competitions where the user participates, archived ones included"""
+        return CompetitionService.with_list_data(Competition.objects.filter(
+            Q(id__in=Participant.objects.filter(user=user).values('competition_id'))
+            | Q(id__in=ArchivedParticipant.objects.filter(user=user).values('competition_id'))
+        )).order_by('-created_at')
     
     @staticmethod
     def get_future_competitions_for_user(user):
         """Get active and upcoming competitions for user"""
         now = timezone.now()
-        return Competition.objects.filter(
-            participant__user=user,
+        return CompetitionService.with_list_data(Competition.objects.filter(
+            id__in=Participant.objects.filter(user=user).values('competition_id'),
             end_date__gt=now,
             status__in=['active', 'upcoming']
-        ).distinct().order_by('start_date')
+        )).order_by('start_date')
+    
+    @staticmethod
+    def get_active_competitions():
+        """Get all competitions currently running (by date range)"""
+        now = timezone.now()
+        return Competition.objects.filter(
+            start_date__lte=now,
+            end_date__gte=now
+        )
     
     @staticmethod
     def get_user_competition_invitations(user):
         """Get all pending invitations for user"""
-        return CompetitionInvitation.objects.filter(
+        return CompetitionService.with_invitation_data(CompetitionInvitation.objects.filter(
             receiver=user,
-            status='pending'
-        ).order_by('-created_at')
+            status='pending',
+            # Not swept by expire_invitations yet
+            competition__end_date__gte=timezone.now()
+        )).order_by('-created_at')
     
     @staticmethod
     def get_user_sent_invitations(user):
         """Get invitations sent by user"""
-        return CompetitionInvitation.objects.filter(
+        return CompetitionService.with_invitation_data(CompetitionInvitation.objects.filter(
             sender=user
-        ).order_by('-created_at')
+        )).order_by('-created_at')
+
+    @staticmethod
+    def with_invitation_data(invitations):
+        """Load what CompetitionInvitationSerializer needs up front"""
+        return invitations.select_related('sender', 'receiver').prefetch_related(
+            Prefetch('competition', queryset=CompetitionService.with_list_data(Competition.objects.all()))
+        )
     
     @staticmethod
     def create_competition(title, description, start_date, end_date, creator):
         """Create a new competition"""
-        competition = Competition.objects.create(
-            title=title,
-            description=description,
-            start_date=start_date,
-            end_date=end_date,
-            creator=creator
-        )
-        
-        # Add creator as a participant
-        Participant.objects.create(
-            user=creator,
-            competition=competition
-        )
-        
+        with transaction.atomic():
+            competition = Competition.objects.create(
+                title=title,
+                description=description,
+                start_date=start_date,
+                end_date=end_date,
+                creator=creator
+            )
+
+            # Add creator as a participant
+            Participant.objects.create(
+                user=creator,
+                competition=competition
+            )
+            changes.record('competitions', [(creator.id, competition.id)])
+
         return competition
+
+    @staticmethod
+    def create_competition_with_invitees(title, description, start_date, end_date, creator, invitees):
+        """
+        Create a competition and invite friends in one transaction. Returns
+        (competition, {username: result}); when any invitee cannot be invited
+        nothing is written and competition is None.
+        """
+        with transaction.atomic():
+            competition = CompetitionService.create_competition(
+                title, description, start_date, end_date, creator
+            )
+            results = CompetitionService._invite_users(competition, creator, invitees, strict=True)
+            if any('error' in result for result in results.values()):
+                transaction.set_rollback(True)
+                return None, results
+        return competition, results
         
     @staticmethod
     def send_competition_invitation(competition_id, sender, username):
@@ -85,11 +145,15 @@ class CompetitionService:
             ).exists():
                 return None, "User already participating"
             
-            invitation = CompetitionInvitation.objects.create(
-                competition=competition,
-                sender=sender,
-                receiver=receiver
-            )
+            with transaction.atomic():
+                invitation = CompetitionInvitation.objects.create(
+                    competition=competition,
+                    sender=sender,
+                    receiver=receiver
+                )
+                changes.record('competition_invitations', [(receiver.id, invitation.id)])
+            INVITATIONS_SENT.inc()
+            events.publish([receiver.id], 'competition_invitation.received', competition_id=competition.id)
             
             return invitation, None
         except Competition.DoesNotExist:
@@ -97,33 +161,243 @@ class CompetitionService:
         except User.DoesNotExist:
             return None, "User not found"
             
+    @staticmethod
+    def send_competition_invitations(competition_id, sender, usernames):
+        """
+        Invite several users at once. Returns ({username: result}, None)
+        where result has 'invitation' or 'error', or (None, error) when the
+        competition itself cannot take invitations from sender.
+        """
+        try:
+            competition = Competition.objects.get(id=competition_id)
+        except Competition.DoesNotExist:
+            return None, "Competition not found"
+        if competition.creator_id != sender.id:
+            return None, "Only the creator of the competition can send invitations"
+
+        with transaction.atomic():
+            results = CompetitionService._invite_users(competition, sender, usernames)
+        return results, None
+
+    @staticmethod
+    def _invite_users(competition, sender, usernames, strict=False):
+        """
+        Validate usernames against a constant number of queries (users,
+        friends, invitations, participants) and write the valid invitations
+        in bulk; with strict, nothing is written if any username fails.
+        Callers provide the transaction.
+        """
+        usernames = list(dict.fromkeys(usernames))
+        users = {user.username: user for user in User.objects.filter(username__in=usernames)}
+        friend_ids = FriendshipService.get_friend_ids(sender)
+        user_ids = [user.id for user in users.values()]
+        # (competition, receiver) is unique, so answered invitations are reopened instead of recreated
+        existing = {
+            invitation.receiver_id: invitation
+            for invitation in CompetitionInvitation.objects.filter(competition=competition, receiver_id__in=user_ids)
+        }
+        participating = set(Participant.objects.filter(
+            competition=competition, user_id__in=user_ids
+        ).values_list('user_id', flat=True))
+
+        results, new, reopened = {}, [], []
+        for username in usernames:
+            receiver = users.get(username)
+            if receiver is None:
+                error = "User not found"
+            elif receiver.id not in friend_ids:
+                error = "You can only invite friends to competitions"
+            elif receiver.id in participating:
+                error = "User already participating"
+            elif receiver.id in existing and existing[receiver.id].status == 'pending':
+                error = "User already invited"
+            else:
+                error = None
+            if error:
+                results[username] = {'error': error}
+                continue
+            invitation = existing.get(receiver.id)
+            if invitation is None:
+                invitation = CompetitionInvitation(competition=competition, sender=sender, receiver=receiver)
+                new.append(invitation)
+            else:
+                invitation.sender = sender
+                invitation.status = 'pending'
+                invitation.updated_at = timezone.now()
+                reopened.append(invitation)
+            results[username] = {'invitation': invitation}
+
+        if strict and len(new) + len(reopened) < len(usernames):
+            return results
+        CompetitionInvitation.objects.bulk_create(new)
+        CompetitionInvitation.objects.bulk_update(reopened, ['sender', 'status', 'updated_at'])
+        changes.record(
+            'competition_invitations', [(invitation.receiver_id, invitation.id) for invitation in new + reopened]
+        )
+        INVITATIONS_SENT.inc(len(new) + len(reopened))
+        events.publish(
+            [invitation.receiver_id for invitation in new + reopened],
+            'competition_invitation.received', competition_id=competition.id
+        )
+        return results
+
     @staticmethod
     def handle_invitation_response(invitation_id, user, action):
         """Accept or decline invitation based on action parameter"""
         try:
-            invitation = CompetitionInvitation.objects.get(
+            invitation = CompetitionInvitation.objects.select_related('competition').get(
                 id=invitation_id,
                 receiver=user,
-                status='pending'
+                status='pending',
+                competition__end_date__gte=timezone.now()
             )
             
-            if action == 'accept':
-                # Create participant
-                Participant.objects.create(
-                    user=user,
-                    competition=invitation.competition
+            with transaction.atomic():
+                if action == 'accept':
+                    # Create participant
+                    Participant.objects.create(
+                        user=user,
+                        competition=invitation.competition
+                    )
+                    invitation.status = 'accepted'
+                elif action == 'decline':
+                    invitation.status = 'declined'
+                else:
+                    return None, "Action must be 'accept' or 'decline'"
+
+                invitation.save()
+                changes.record('competition_invitations', [(user.id, invitation.id)], deleted=True)
+                events.publish(
+                    [invitation.sender_id], 'competition_invitation.answered',
+                    invitation_id=invitation.id, competition_id=invitation.competition_id, status=invitation.status
                 )
-                invitation.status = 'accepted'
-            elif action == 'decline':
-                invitation.status = 'declined'
-            else:
-                return None, "Action must be 'accept' or 'decline'"
-            
-            invitation.save()
-            return invitation, None
+                if action == 'accept':
+                    CompetitionService._participants_changed(invitation.competition_id)
+                return invitation, None
         except CompetitionInvitation.DoesNotExist:
             return None, "Invitation not found or already handled"
         
+    @staticmethod
+    def expire_invitations(batch_size=1000):
+        """
+        Mark pending invitations to competitions that have ended as expired,
+        one UPDATE of at most batch_size rows per transaction. Returns the
+        number of invitations expired.
+        """
+        now = timezone.now()
+        expired = 0
+        while True:
+            with transaction.atomic():
+                # Unordered, so the plan can start from the ended competitions
+                rows = list(CompetitionInvitation.objects.filter(
+                    status='pending',
+                    competition__end_date__lt=now
+                ).order_by().values_list('receiver_id', 'id')[:batch_size])
+                if not rows:
+                    break
+                # update() skips auto_now, so updated_at is set explicitly
+                count = CompetitionInvitation.objects.filter(
+                    id__in=[invitation_id for receiver_id, invitation_id in rows], status='pending'
+                ).update(status='expired', updated_at=now)
+                changes.record('competition_invitations', rows, deleted=True)
+            expired += count
+            INVITATIONS_EXPIRED.inc(count)
+        return expired
+
+    @staticmethod
+    def close_competitions(batch_size=100):
+        """
+        Close competitions that have ended: rank them a last time, write their
+        CompetitionSnapshot and set status and winner. Runs one transaction per
+        batch_size competitions; returns how many were closed.
+        """
+        now = timezone.now()
+        closed = 0
+        while True:
+            with transaction.atomic():
+                # Only closing sets 'completed'. Filtering on it and leaving the
+                # batch unordered lets the plan use competition_open_end.
+                competitions = list(Competition.objects.filter(
+                    end_date__lt=now, status__in=['active', 'upcoming'], snapshot__isnull=True
+                ).order_by()[:batch_size])
+                if not competitions:
+                    return closed
+                participants, changed = CompetitionService._rank([competition.id for competition in competitions])
+                members = {}
+                for participant in participants:
+                    members.setdefault(participant.competition_id, []).append(participant)
+
+                snapshots = []
+                for competition in competitions:
+                    # _rank orders ranked participants by position, then the others by id
+                    standings = members.get(competition.id, [])
+                    ranked = [p for p in standings if p.average_daily_usage is not None]
+                    competition.status = 'completed'
+                    competition.winner_id = ranked[0].user_id if ranked else None
+                    snapshots.append(CompetitionSnapshot(
+                        competition=competition,
+                        standings=[
+                            # Full precision: the JSON encoder would cut joined_at to milliseconds
+                            [p.id, p.user_id, p.joined_at.isoformat(), p.position, p.average_daily_usage]
+                            for p in standings
+                        ],
+                        participant_count=len(standings),
+                        ranked_count=len(ranked),
+                    ))
+                CompetitionSnapshot.objects.bulk_create(snapshots)
+                Competition.objects.bulk_update(competitions, ['status', 'winner'])
+            closed += len(competitions)
+            COMPETITIONS_CLOSED.inc(len(competitions))
+
+    @staticmethod
+    def archive_participants(older_than, batch_size=1000):
+        """
+        Move the Participant rows of competitions closed and ended more than
+        older_than (a timedelta) ago to ArchivedParticipant, which keeps only
+        membership; standings stay in the snapshot. Returns how many moved.
+        """
+        cutoff = timezone.now() - older_than
+        moved = 0
+        while True:
+            with transaction.atomic():
+                # Unordered, so the plan can start from the ended competitions
+                rows = list(Participant.objects.filter(
+                    competition__end_date__lt=cutoff, competition__snapshot__isnull=False
+                ).values_list('id', 'user_id', 'competition_id')[:batch_size])
+                if not rows:
+                    return moved
+                ArchivedParticipant.objects.bulk_create([
+                    ArchivedParticipant(user_id=user_id, competition_id=competition_id)
+                    for participant_id, user_id, competition_id in rows
+                ], ignore_conflicts=True)
+                Participant.objects.filter(id__in=[row[0] for row in rows]).delete()
+            moved += len(rows)
+            PARTICIPANTS_ARCHIVED.inc(len(rows))
+
+    @staticmethod
+    def get_snapshot_leaderboard(snapshot):
+        """
+        (ranked, unranked) participants of a closed competition, rebuilt from
+        its snapshot as unsaved Participant objects with user and profile
+        loaded in one query. Users deleted since are left out.
+        """
+        users = User.objects.select_related('profile').in_bulk(
+            [user_id for participant_id, user_id, joined_at, position, usage in snapshot.standings]
+        )
+        participants = [
+            Participant(
+                id=participant_id, user=users[user_id], competition_id=snapshot.competition_id,
+                joined_at=parse_datetime(joined_at), position=position, average_daily_usage=usage,
+            )
+            for participant_id, user_id, joined_at, position, usage in snapshot.standings
+            if user_id in users
+        ]
+        ranked_ids = {row[0] for row in snapshot.standings[:snapshot.ranked_count]}
+        return (
+            [participant for participant in participants if participant.id in ranked_ids],
+            [participant for participant in participants if participant.id not in ranked_ids],
+        )
+
     @staticmethod
     def get_competition_leaderboard(competition):
         """
@@ -135,14 +409,14 @@ class CompetitionService:
             competition=competition,
             average_daily_usage__isnull=False,
             position__isnull=False
-        ).select_related('user').order_by('position')
+        ).select_related('user__profile').order_by('position')
         
         # Get participants without screen time
         unranked = Participant.objects.filter(
             competition=competition
         ).filter(
             Q(average_daily_usage__isnull=True) | Q(position__isnull=True)
-        ).select_related('user')
+        ).select_related('user__profile')
         
         # Use iterator instead of list for better memory efficiency
         return ranked, unranked
@@ -160,29 +434,30 @@ class CompetitionService:
         Returns:
             List of competitions where ranking was updated
         """
-        # Get all active competitions where the user is a participant (use only date range, not DB status)
+        # The user's own history, kept whether or not they compete
+        ScreenTimeService.record(user, date, screen_time_minutes)
+
+        # Participant rows of the active competitions (by date range, not DB status)
         now = timezone.now()
-        active_competitions = Competition.objects.filter(
-            participant__user=user,
-            start_date__lte=now,
-            end_date__gte=now
-        ).distinct()
-        updated_competitions = []
-        for competition in active_competitions:
-            # Get participant record for this user in this competition
-            participant = Participant.objects.get(user=user, competition=competition)
-            old_usage = participant.average_daily_usage
-            # Update average daily usage (you might want a more sophisticated algorithm here)
+        participants = list(Participant.objects.filter(
+            user=user,
+            competition__start_date__lte=now,
+            competition__end_date__gte=now
+        ))
+        for participant in participants:
             if participant.average_daily_usage is None:
                 participant.average_daily_usage = screen_time_minutes
             else:
                 # Simple moving average (could be improved with more historical data)
                 participant.average_daily_usage = (participant.average_daily_usage + screen_time_minutes) / 2
-            participant.save()
-            updated_competitions.append(competition)
-            # Recalculate rankings for all participants in this competition
-            CompetitionService.recalculate_competition_rankings(competition)
-        return updated_competitions
+        Participant.objects.bulk_update(participants, ['average_daily_usage'])
+        SCREEN_TIME_UPDATES.inc()
+
+        competition_ids = [participant.competition_id for participant in participants]
+        CompetitionService.recalculate_rankings(competition_ids)
+        return list(CompetitionService.with_list_data(
+            Competition.objects.filter(id__in=competition_ids)
+        ))
 
     @staticmethod
     def recalculate_competition_rankings(competition):
@@ -193,25 +468,62 @@ class CompetitionService:
         Args:
             competition: The competition to recalculate rankings for
         """
-        # Get all participants ordered by average_daily_usage (ascending - less is better)
-        participants = Participant.objects.filter(
-            competition=competition,
-            average_daily_usage__isnull=False
-        ).order_by('average_daily_usage')
-        
-        # Update positions
-        for i, participant in enumerate(participants, 1):
-            participant.position = i
-            participant.save()
-        
-        # Handle participants with no data yet (place them at the end)
-        participants_no_data = Participant.objects.filter(
-            competition=competition,
-            average_daily_usage__isnull=True
-        )
-        
-        last_position = participants.count() + 1
-        
-        for participant in participants_no_data:
-            participant.position = last_position
-            participant.save()
\ No newline at end of file
+        CompetitionService.recalculate_rankings([competition.id])
+
+    @staticmethod
+    def recalculate_rankings(competition_ids):
+        """
+        Recalculate rankings of several competitions with one read and one
+        bulk update. Participants without data are placed after the ranked ones.
+        """
+        with RANKING_RECOMPUTE_SECONDS.time():
+            participants, changed = CompetitionService._rank(competition_ids)
+        RANKING_POSITIONS_CHANGED.inc(len(changed))
+        CompetitionService.publish_leaderboards(participants)
+
+    @staticmethod
+    def remove_participant(participant):
+        """Remove a participant from their competition"""
+        with transaction.atomic():
+            participant.delete()
+            changes.record('competitions', [(participant.user_id, participant.competition_id)], deleted=True)
+            CompetitionService._participants_changed(participant.competition_id)
+
+    @staticmethod
+    def _participants_changed(competition_id):
+        """The participant count of every member's competition list and the leaderboard changed"""
+        participants = list(Participant.objects.filter(competition_id=competition_id).only('competition_id', 'user_id'))
+        changes.record('competitions', [(participant.user_id, competition_id) for participant in participants])
+        CompetitionService.publish_leaderboards(participants)
+
+    @staticmethod
+    def publish_leaderboards(participants):
+        """Tell the participants of every competition in participants that its leaderboard changed"""
+        members = {}
+        for participant in participants:
+            members.setdefault(participant.competition_id, []).append(participant.user_id)
+        for competition_id, user_ids in members.items():
+            events.publish(user_ids, 'competition.leaderboard', competition_id=competition_id)
+
+    @staticmethod
+    def _rank(competition_ids):
+        """Assign positions in memory and save the changed ones; returns (participants, changed)"""
+        participants = list(Participant.objects.filter(
+            competition_id__in=competition_ids
+        ).order_by('competition_id', F('average_daily_usage').asc(nulls_last=True), 'id'))
+        RANKING_PARTICIPANTS.inc(len(participants))
+
+        changed = []
+        ranked = {}
+        for participant in participants:
+            competition_id = participant.competition_id
+            if participant.average_daily_usage is not None:
+                ranked[competition_id] = ranked.get(competition_id, 0) + 1
+                new_position = ranked[competition_id]
+            else:
+                new_position = ranked.get(competition_id, 0) + 1
+            if participant.position != new_position:
+                participant.position = new_position
+                changed.append(participant)
+        Participant.objects.bulk_update(changed, ['position'])
+        return participants, changed
@@ -1,4 +1,7 @@
+from django.db import connection
 from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.core.management import call_command
 from django.urls import reverse
 from django.utils import timezone
 from rest_framework.test import APITestCase, APIClient
@@ -6,10 +9,13 @@ from rest_framework.authtoken.models import Token
 from rest_framework import status
 from django.contrib.auth import get_user_model
 from datetime import timedelta
-from .models import Competition, Participant, CompetitionInvitation
+from io import StringIO
+from .models import Competition, Participant, CompetitionInvitation, CompetitionSnapshot, ArchivedParticipant
 from .services import CompetitionService
 from .serializers import CompetitionListSerializer, CompetitionDetailSerializer
 from friendships.models import FriendList
+from monitoring.testing import QueryBudgetMixin, QueryPlanMixin, make_users
+from users.models import Profile
 
 User = get_user_model()
 
@@ -222,6 +228,33 @@ class CompetitionServiceTest(TestCase):
             competition=competition
         ).exists())
         
+    def test_create_competition_with_invitees(self):
+        """Test creating a competition together with its invitations"""
+        start_date = self.now + timedelta(days=2)
+        end_date = self.now + timedelta(days=9)
+
+        competition, results = CompetitionService.create_competition_with_invitees(
+            'With friends', '', start_date, end_date, self.user1, ['testuser2']
+        )
+
+        self.assertEqual(competition.creator, self.user1)
+        self.assertTrue(Participant.objects.filter(user=self.user1, competition=competition).exists())
+        invitation = results['testuser2']['invitation']
+        self.assertEqual(invitation.competition, competition)
+        self.assertEqual(invitation.status, 'pending')
+
+        # A single invalid invitee rolls the whole creation back
+        competition_count = Competition.objects.count()
+        competition, results = CompetitionService.create_competition_with_invitees(
+            'Not with strangers', '', start_date, end_date, self.user1, ['testuser2', 'testuser3']
+        )
+
+        self.assertIsNone(competition)
+        self.assertIn('invitation', results['testuser2'])
+        self.assertEqual(results['testuser3']['error'], "You can only invite friends to competitions")
+        self.assertEqual(Competition.objects.count(), competition_count)
+        self.assertFalse(CompetitionInvitation.objects.filter(competition__title='Not with strangers').exists())
+
     def test_send_competition_invitation(self):
         """Test sending a competition invitation"""
         # Test successful invitation
@@ -271,6 +304,87 @@ class CompetitionServiceTest(TestCase):
         self.assertIsNone(invitation)
         self.assertIsNotNone(error)
         
+    def test_send_competition_invitations(self):
+        """Test inviting several users at once"""
+        user4 = User.objects.create_user(username='testuser4', email='test4@example.com', password='testpassword123')
+        self.friend_list1.friends.add(user4)
+        CompetitionInvitation.objects.create(
+            competition=self.active_competition, sender=self.user1, receiver=user4, status='declined'
+        )
+        Participant.objects.create(user=user4, competition=self.upcoming_competition)
+
+        results, error = CompetitionService.send_competition_invitations(
+            competition_id=self.upcoming_competition.id,
+            sender=self.user1,
+            usernames=['testuser2', 'testuser3', 'testuser4', 'nobody', 'testuser2']
+        )
+
+        self.assertIsNone(error)
+        self.assertEqual(list(results), ['testuser2', 'testuser3', 'testuser4', 'nobody'])
+        self.assertEqual(results['testuser2']['invitation'].receiver, self.user2)
+        self.assertEqual(results['testuser3']['error'], "You can only invite friends to competitions")
+        self.assertEqual(results['testuser4']['error'], "User already participating")
+        self.assertEqual(results['nobody']['error'], "User not found")
+        self.assertTrue(CompetitionInvitation.objects.filter(
+            competition=self.upcoming_competition, receiver=self.user2, status='pending'
+        ).exists())
+
+        # Invited again while pending
+        results, error = CompetitionService.send_competition_invitations(
+            self.upcoming_competition.id, self.user1, ['testuser2']
+        )
+        self.assertEqual(results['testuser2']['error'], "User already invited")
+
+        # A declined invitation is reopened rather than duplicated
+        results, error = CompetitionService.send_competition_invitations(
+            self.active_competition.id, self.user1, ['testuser4']
+        )
+        self.assertEqual(results['testuser4']['invitation'].status, 'pending')
+        self.assertEqual(CompetitionInvitation.objects.filter(
+            competition=self.active_competition, receiver=user4
+        ).count(), 1)
+
+        # Only the creator can invite
+        results, error = CompetitionService.send_competition_invitations(
+            self.upcoming_competition.id, self.user2, ['testuser1']
+        )
+        self.assertIsNone(results)
+        self.assertEqual(error, "Only the creator of the competition can send invitations")
+
+    def test_expire_invitations(self):
+        """Test expiring pending invitations to ended competitions"""
+        pending = [
+            CompetitionInvitation.objects.create(
+                competition=self.completed_competition, sender=self.user1, receiver=receiver
+            )
+            for receiver in (self.user2, self.user3)
+        ]
+        declined = CompetitionInvitation.objects.create(
+            competition=self.active_competition, sender=self.user1, receiver=self.user3, status='declined'
+        )
+        open_invitation = CompetitionInvitation.objects.create(
+            competition=self.upcoming_competition, sender=self.user1, receiver=self.user2
+        )
+
+        # Ended invitations are hidden before the sweep runs
+        self.assertEqual(list(CompetitionService.get_user_competition_invitations(self.user2)), [open_invitation])
+        invitation, error = CompetitionService.handle_invitation_response(pending[0].id, self.user2, 'accept')
+        self.assertIsNone(invitation)
+
+        self.assertEqual(CompetitionService.expire_invitations(batch_size=1), 2)
+
+        for invitation in pending:
+            invitation.refresh_from_db()
+            self.assertEqual(invitation.status, 'expired')
+        declined.refresh_from_db()
+        open_invitation.refresh_from_db()
+        self.assertEqual(declined.status, 'declined')
+        self.assertEqual(open_invitation.status, 'pending')
+
+        out = StringIO()
+        call_command('expire_invitations', stdout=out)
+        self.assertIn("Expired 0 invitations", out.getvalue())
+
     def test_handle_invitation_response(self):
         """Test handling invitation responses"""
         # Create an invitation
@@ -581,6 +695,20 @@ class CompetitionAPITest(APITestCase):
         url = self.get_competition_detail_url(999)
         response = self.client.get(url)
         self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_competition_detail_avatar_sizes(self):
+        """The creator gets the profile-sized avatar, leaderboard rows the small one"""
+        urls = {'64': 'https://cdn.example.com/64.webp', '512': 'https://cdn.example.com/512.webp'}
+        Profile.objects.create(user=self.user1, name='User One', avatar_urls=urls)
+        Profile.objects.create(user=self.user2, name='User Two', avatar_urls=urls)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token1.key}')
+
+        response = self.client.get(self.get_competition_detail_url(self.active_competition.id))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['creator']['avatar'], urls['512'])
+        self.assertEqual({row['user']['avatar'] for row in response.data['leaderboard']}, {urls['64']})
+        self.assertEqual({row['user']['avatar'] for row in response.data['participants']}, {urls['64']})
         
     def test_create_competition(self):
         """Test creating a competition"""
@@ -612,6 +740,38 @@ class CompetitionAPITest(APITestCase):
             competition_id=competition_id
         ).exists())
         
+    def test_create_competition_with_invitees(self):
+        """Test creating a competition and inviting friends in one request"""
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token1.key}')
+        data = {
+            'title': 'With Friends',
+            'start_date': (self.now + timedelta(days=2)).isoformat(),
+            'end_date': (self.now + timedelta(days=9)).isoformat(),
+            'invitees': ['testuser2'],
+        }
+
+        response = self.client.post(self.create_competition_url, data, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['title'], 'With Friends')
+        self.assertEqual(len(response.data['participants']), 1)
+        invitation = CompetitionInvitation.objects.get(id=response.data['invitations']['testuser2']['invitation_id'])
+        self.assertEqual(invitation.competition_id, response.data['id'])
+        self.assertEqual(invitation.receiver, self.user2)
+
+        # Nothing is created when an invitee is not a friend
+        data.update(title='With Strangers', invitees=['testuser2', 'testuser3'])
+        response = self.client.post(self.create_competition_url, data, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('error', response.data['invitations']['testuser3'])
+        self.assertEqual(response.data['invitations']['testuser2'], {'status': 'ok'})
+        self.assertFalse(Competition.objects.filter(title='With Strangers').exists())
+
+        data['invitees'] = 'testuser2'
+        response = self.client.post(self.create_competition_url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
     def test_send_invitation(self):
         """Test sending a competition invitation"""
         # Authenticate as user1
@@ -639,6 +799,35 @@ class CompetitionAPITest(APITestCase):
         response = self.client.post(self.send_invitation_url, data, format='json')
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
         
+    def test_send_bulk_invitations(self):
+        """Test inviting a list of usernames in one request"""
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token1.key}')
+        url = reverse('send_bulk_competition_invitations')
+
+        response = self.client.post(url, {
+            'competition_id': self.upcoming_competition.id,
+            'usernames': ['testuser2', 'testuser3']
+        }, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['invited'], 1)
+        invitation_id = response.data['results']['testuser2']['invitation_id']
+        self.assertEqual(CompetitionInvitation.objects.get(id=invitation_id).receiver, self.user2)
+        self.assertIn('error', response.data['results']['testuser3'])
+
+        # A list is required
+        response = self.client.post(url, {
+            'competition_id': self.upcoming_competition.id, 'usernames': 'testuser2'
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        # Only the creator can invite
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token2.key}')
+        response = self.client.post(url, {
+            'competition_id': self.upcoming_competition.id, 'usernames': ['testuser1']
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
     def test_handle_invitation(self):
         """Test handling a competition invitation"""
         # Create invitation
@@ -756,4 +945,322 @@ class CompetitionAPITest(APITestCase):
         }
         
         response = self.client.post(self.screen_time_url, data, format='json')
-        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
\ No newline at end of file
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class CompetitionQueryBudgetTest(QueryBudgetMixin, APITestCase):
+    """Competition endpoints must run a constant number of queries"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser1',
+            email='test1@example.com',
+            password='testpassword123'
+        )
+        Profile.objects.create(user=self.user, name='Test User')
+        token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        self.now = timezone.now()
+
+    def create_competitions(self, size, creators=None):
+        """size active competitions the user takes part in, each with a few other participants"""
+        creators = creators or make_users(size, 'creator')
+        competitions = Competition.objects.bulk_create([
+            Competition(
+                title=f'Competition {i}',
+                creator=creators[i % len(creators)],
+                start_date=self.now - timedelta(days=1),
+                end_date=self.now + timedelta(days=7),
+                status='active'
+            )
+            for i in range(size)
+        ])
+        participants = [Participant(user=self.user, competition=competition) for competition in competitions]
+        for competition in competitions:
+            participants.append(Participant(user=competition.creator, competition=competition, average_daily_usage=60.0))
+        Participant.objects.bulk_create(participants)
+        return competitions
+
+    def test_get_competitions(self):
+        self.assertConstantQueries(
+            self.create_competitions, lambda state: self.client.get(reverse('get_competitions'))
+        )
+
+    def test_get_future_competitions(self):
+        self.assertConstantQueries(
+            self.create_competitions, lambda state: self.client.get(reverse('get_future_competitions'))
+        )
+
+    def test_get_competition_detail(self):
+        def seed(size):
+            competition = self.create_competitions(1)[0]
+            Participant.objects.bulk_create([
+                Participant(user=user, competition=competition, average_daily_usage=i if i % 2 else None)
+                for i, user in enumerate(make_users(size, 'participant'))
+            ])
+            return competition
+
+        self.assertConstantQueries(
+            seed,
+            lambda competition: self.client.get(reverse('get_competition_detail', args=[competition.id])),
+        )
+
+    def test_get_invitations(self):
+        def seed(size):
+            senders = make_users(size, 'sender')
+            competitions = Competition.objects.bulk_create([
+                Competition(
+                    title=f'Invite {i}', creator=sender,
+                    start_date=self.now + timedelta(days=1), end_date=self.now + timedelta(days=8)
+                )
+                for i, sender in enumerate(senders)
+            ])
+            CompetitionInvitation.objects.bulk_create([
+                CompetitionInvitation(competition=competition, sender=competition.creator, receiver=self.user)
+                for competition in competitions
+            ])
+
+        self.assertConstantQueries(seed, lambda state: self.client.get(reverse('get_competition_invitations')))
+
+    def test_get_active_competitions(self):
+        self.assertConstantQueries(
+            self.create_competitions, lambda state: self.client.get(reverse('get_active_competitions'))
+        )
+
+    def create_own_competition(self, size):
+        """An upcoming competition created by the user, with size other participants and size friends"""
+        competition = Competition.objects.create(
+            title='Own competition', creator=self.user, status='upcoming',
+            start_date=self.now + timedelta(days=1), end_date=self.now + timedelta(days=8)
+        )
+        Participant.objects.bulk_create(
+            [Participant(user=self.user, competition=competition)]
+            + [Participant(user=user, competition=competition) for user in make_users(size, 'participant')]
+        )
+        friends = make_users(size, 'friend')
+        FriendList.objects.create(user=self.user).friends.add(*friends)
+        return competition, friends
+
+    def test_send_invitation(self):
+        self.assertConstantQueries(
+            self.create_own_competition,
+            lambda state: self.client.post(
+                reverse('send_competition_invitation'),
+                {'competition_id': state[0].id, 'username': state[1][0].username}, format='json'
+            ),
+        )
+
+    def test_handle_invitation(self):
+        def seed(size):
+            creator = make_users(1, 'creator')[0]
+            competition = Competition.objects.create(
+                title='Invited', creator=creator, status='upcoming',
+                start_date=self.now + timedelta(days=1), end_date=self.now + timedelta(days=8)
+            )
+            Participant.objects.bulk_create(
+                [Participant(user=creator, competition=competition)]
+                + [Participant(user=user, competition=competition) for user in make_users(size, 'participant')]
+            )
+            return CompetitionInvitation.objects.create(competition=competition, sender=creator, receiver=self.user)
+
+        self.assertConstantQueries(
+            seed,
+            lambda invitation: self.client.post(
+                reverse('handle_competition_invitation'),
+                {'invitation_id': invitation.id, 'action': 'accept'}, format='json'
+            ),
+        )
+
+    def test_leave_competition(self):
+        def seed(size):
+            competition = self.create_competitions(1)[0]
+            Participant.objects.bulk_create([
+                Participant(user=user, competition=competition, average_daily_usage=float(i))
+                for i, user in enumerate(make_users(size, 'participant'))
+            ])
+            return competition
+
+        self.assertConstantQueries(
+            seed,
+            lambda competition: self.client.post(reverse('leave_competition', args=[competition.id])),
+        )
+
+    def test_create_competition(self):
+        def seed(size):
+            friends = make_users(size, 'friend')
+            FriendList.objects.create(user=self.user).friends.add(*friends)
+            return [friend.username for friend in friends]
+
+        self.assertConstantQueries(
+            seed,
+            lambda usernames: self.client.post(reverse('create_competition'), {
+                'title': 'New competition',
+                'start_date': (self.now + timedelta(days=1)).isoformat(),
+                'end_date': (self.now + timedelta(days=8)).isoformat(),
+                'invitees': usernames,
+            }, format='json'),
+            sizes=(1, 10, 50),
+        )
+
+    def test_update_screen_time(self):
+        self.assertConstantQueries(
+            self.create_competitions,
+            lambda state: self.client.post(
+                reverse('update_screen_time'), {'screen_time_minutes': 30.0}, format='json'
+            ),
+        )
+
+    def test_send_bulk_invitations(self):
+        def seed(size):
+            competition = Competition.objects.create(
+                title='Invite friends', creator=self.user, status='upcoming',
+                start_date=self.now + timedelta(days=1), end_date=self.now + timedelta(days=8)
+            )
+            Participant.objects.create(user=self.user, competition=competition)
+            friends = make_users(size, 'friend')
+            FriendList.objects.create(user=self.user).friends.add(*friends)
+            return competition, [friend.username for friend in friends] + ['nobody']
+
+        self.assertConstantQueries(
+            seed,
+            lambda state: self.client.post(
+                reverse('send_bulk_competition_invitations'),
+                {'competition_id': state[0].id, 'usernames': state[1]}, format='json'
+            ),
+            sizes=(1, 10, 50),
+        )
+
+    def test_update_screen_time_ranks_in_bulk(self):
+        """Rankings of every active competition are recalculated by the bulk path"""
+        competitions = self.create_competitions(3)
+        response = self.client.post(reverse('update_screen_time'), {'screen_time_minutes': 30.0}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['updated_competitions']), 3)
+        for data in response.data['updated_competitions']:
+            self.assertEqual(data['user_position'], 1)
+            self.assertEqual(data['participant_count'], 2)
+        for competition in competitions:
+            creator = Participant.objects.get(competition=competition, user=competition.creator)
+            self.assertEqual(creator.position, 2)
+
+
+class CompetitionCloseOutTest(APITestCase):
+    """Tests for closing ended competitions into snapshots and archiving their participants"""
+
+    def setUp(self):
+        self.users = [
+            User.objects.create_user(username=f'testuser{i}', email=f'test{i}@example.com', password='testpassword123')
+            for i in range(1, 5)
+        ]
+        for user in self.users:
+            Profile.objects.create(user=user, name=user.username.title())
+        now = timezone.now()
+        self.competition = CompetitionService.create_competition(
+            'Ended', '', now - timedelta(days=8), now - timedelta(days=1), self.users[0]
+        )
+        for user, usage in zip(self.users[1:3], [120.0, 60.0]):
+            Participant.objects.create(user=user, competition=self.competition, average_daily_usage=usage)
+        CompetitionService.recalculate_rankings([self.competition.id])
+        self.url = reverse('get_competition_detail', args=[self.competition.id])
+        self.client.force_authenticate(self.users[0])
+
+    def detail(self):
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.json(), len(captured)
+
+    def test_close_writes_final_standings(self):
+        self.assertEqual(CompetitionService.close_competitions(), 1)
+        self.assertEqual(CompetitionService.close_competitions(), 0)
+
+        snapshot = CompetitionSnapshot.objects.get(competition=self.competition)
+        self.assertEqual([row[1] for row in snapshot.standings], [self.users[2].id, self.users[1].id, self.users[0].id])
+        self.assertEqual([row[3] for row in snapshot.standings], [1, 2, 3])
+        self.assertEqual((snapshot.participant_count, snapshot.ranked_count), (3, 2))
+        self.competition.refresh_from_db()
+        self.assertEqual(self.competition.status, 'completed')
+        self.assertEqual(self.competition.winner, self.users[2])
+
+    def test_detail_is_served_from_the_snapshot(self):
+        live, live_queries = self.detail()
+        CompetitionService.close_competitions()
+
+        closed, closed_queries = self.detail()
+        # The only difference: a winner once the competition is closed
+        self.assertEqual(closed.pop('winner')['user']['id'], self.users[2].id)
+        self.assertEqual(closed, live)
+        self.assertLess(closed_queries, live_queries)
+
+        # Still the same once the participants are archived
+        self.assertEqual(CompetitionService.archive_participants(timedelta(0)), 3)
+        self.assertFalse(Participant.objects.filter(competition=self.competition).exists())
+        self.assertEqual(ArchivedParticipant.objects.filter(competition=self.competition).count(), 3)
+        archived, archived_queries = self.detail()
+        self.assertEqual(archived_queries, closed_queries)
+        archived.pop('winner')
+        self.assertEqual(archived, live)
+
+        self.client.force_authenticate(self.users[3])
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_archived_competitions_stay_listed(self):
+        call_command('close_competitions', '--archive-after-days', '0', stdout=StringIO())
+
+        self.client.force_authenticate(self.users[1])
+        response = self.client.get(reverse('get_competitions'))
+        self.assertEqual([(row['id'], row['participant_count']) for row in response.data], [(self.competition.id, 3)])
+
+    def test_command(self):
+        out = StringIO()
+        call_command('close_competitions', stdout=out)
+        self.assertIn("Closed 1 competitions, archived 0 participants", out.getvalue())
+
+
+class CompetitionQueryPlanTest(QueryPlanMixin, TestCase):
+    """The service queries must be served by indexes, not full table scans"""
+
+    def setUp(self):
+        self.user, self.friend, self.other = make_users(3)
+        now = timezone.now()
+        self.active = CompetitionService.create_competition(
+            'Active', '', now - timedelta(days=1), now + timedelta(days=6), self.user
+        )
+        self.ended = CompetitionService.create_competition(
+            'Ended', '', now - timedelta(days=40), now - timedelta(days=33), self.friend
+        )
+        for competition in (self.active, self.ended):
+            Participant.objects.create(user=self.other, competition=competition, average_daily_usage=60)
+        Participant.objects.create(user=self.user, competition=self.ended)
+        CompetitionInvitation.objects.create(competition=self.active, sender=self.user, receiver=self.friend)
+        CompetitionInvitation.objects.create(competition=self.ended, sender=self.friend, receiver=self.other)
+
+    def test_lists(self):
+        for call in [
+            lambda: list(CompetitionService.get_competitions_for_user(self.user)),
+            lambda: list(CompetitionService.get_future_competitions_for_user(self.user)),
+            lambda: list(CompetitionService.get_active_competitions()),
+            lambda: list(CompetitionService.get_user_competition_invitations(self.friend)),
+            lambda: list(CompetitionService.get_user_sent_invitations(self.user)),
+        ]:
+            with self.subTest(call=call):
+                self.assertIndexedQueries(call)
+
+    def test_leaderboard(self):
+        ranked, unranked = CompetitionService.get_competition_leaderboard(self.active)
+        self.assertIndexedQueries(lambda: (list(ranked), list(unranked)))
+
+    def test_screen_time_update(self):
+        self.assertIndexedQueries(lambda: CompetitionService.update_user_screen_time(
+            self.other, timezone.now().date(), 90
+        ))
+
+    def test_close_out(self):
+        # The partial index holds only pending invitations, which are expired
+        # as their competitions end, while most competitions have ended
+        self.assertEqual(self.assertIndexedQueries(
+            CompetitionService.expire_invitations, allowed_indexes=['invitation_pending']
+        ), 1)
+        self.assertEqual(self.assertIndexedQueries(CompetitionService.close_competitions), 1)
+        self.assertEqual(self.assertIndexedQueries(lambda: CompetitionService.archive_participants(timedelta(days=30))), 3)
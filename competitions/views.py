@@ -6,15 +6,20 @@ from rest_framework import status
 from .models import Competition, Participant, CompetitionInvitation
 from .serializers import CompetitionListSerializer, CompetitionDetailSerializer, ParticipantSerializer, CompetitionInvitationSerializer
 from .services import CompetitionService
+from idempotency.decorators import idempotent
 from django.utils import timezone
 
+MAX_BULK_INVITATIONS = 100
+
 @api_view(['GET'])
 @authentication_classes([TokenAuthentication])
 @permission_classes([IsAuthenticated])
 def get_competitions(request):
     """Get all competitions for the authenticated user"""
     competitions = CompetitionService.get_competitions_for_user(request.user)
-    serializer = CompetitionListSerializer(competitions, many=True)
+    serializer = CompetitionListSerializer(
+        competitions, many=True, context={'request': request, 'avatar_context': 'list'}
+    )
     return Response(serializer.data, status=status.HTTP_200_OK)
 
 @api_view(['GET'])
@@ -23,7 +28,9 @@ def get_competitions(request):
 def get_future_competitions(request):
     """Get all active and upcoming competitions for the authenticated user"""
     competitions = CompetitionService.get_future_competitions_for_user(request.user)
-    serializer = CompetitionListSerializer(competitions, many=True)
+    serializer = CompetitionListSerializer(
+        competitions, many=True, context={'request': request, 'avatar_context': 'list'}
+    )
     return Response(serializer.data, status=status.HTTP_200_OK)
 
 @api_view(['GET'])
@@ -31,28 +38,43 @@ def get_future_competitions(request):
 @permission_classes([IsAuthenticated])
 def get_competition_detail(request, competition_id):
     try:
-        competition = Competition.objects.get(id=competition_id)
-        
-        # Check if user is a participant
-        if not Participant.objects.filter(competition=competition, user=request.user).exists():
-            return Response({"error": "You don't have access to this competition"}, 
-                          status=status.HTTP_403_FORBIDDEN)
-        
+        competition = Competition.objects.select_related(
+            'creator__profile', 'winner__profile', 'snapshot'
+        ).get(id=competition_id)
+        context = {'request': request, 'avatar_context': 'leaderboard'}
+
+        snapshot = getattr(competition, 'snapshot', None)
+        if snapshot is not None:
+            # Closed: served from the final standings, whose rows may be archived
+            ranked, unranked = CompetitionService.get_snapshot_leaderboard(snapshot)
+            all_participants = ranked + unranked
+            if not any(participant.user_id == request.user.id for participant in all_participants):
+                return Response({"error": "You don't have access to this competition"},
+                              status=status.HTTP_403_FORBIDDEN)
+            context['participants'] = sorted(all_participants, key=lambda participant: participant.id)
+        else:
+            # Check if user is a participant
+            if not Participant.objects.filter(competition=competition, user=request.user).exists():
+                return Response({"error": "You don't have access to this competition"}, 
+                              status=status.HTTP_403_FORBIDDEN)
+
+            # Get leaderboard using service method (most efficient approach)
+            ranked, unranked = CompetitionService.get_competition_leaderboard(competition)
+            ranked, unranked = list(ranked), list(unranked)
+            all_participants = ranked + unranked
+
         # Get competition data
-        comp_serializer = CompetitionDetailSerializer(competition)
+        # The creator and winner are shown large; the participant rows stay leaderboard-sized
+        comp_serializer = CompetitionDetailSerializer(competition, context={**context, 'avatar_context': 'profile'})
         response_data = comp_serializer.data
-        
-        # Get leaderboard using service method (most efficient approach)
-        ranked, unranked = CompetitionService.get_competition_leaderboard(competition)
-        all_participants = list(ranked) + list(unranked)
-        
+
         # Serialize participants
-        part_serializer = ParticipantSerializer(all_participants, many=True)
+        part_serializer = ParticipantSerializer(all_participants, many=True, context=context)
         response_data['leaderboard'] = part_serializer.data
         
         # Add summary stats
         response_data['total_participants'] = len(all_participants)
-        response_data['ranked_participants'] = ranked.count()
+        response_data['ranked_participants'] = len(ranked)
         
         return Response(response_data, status=status.HTTP_200_OK)
     except Competition.DoesNotExist:
@@ -64,29 +86,52 @@ def get_competition_detail(request, competition_id):
 def get_active_competitions(request):
     """Get all active competitions for the user"""
     competitions = CompetitionService.get_future_competitions_for_user(request.user)
-    serializer = CompetitionListSerializer(competitions, many=True)
+    serializer = CompetitionListSerializer(
+        competitions, many=True, context={'request': request, 'avatar_context': 'list'}
+    )
     return Response(serializer.data, status=status.HTTP_200_OK)
 
 @api_view(['POST'])
 @authentication_classes([TokenAuthentication])
 @permission_classes([IsAuthenticated])
+@idempotent
 def create_competition(request):
     """Create a new competition"""
     serializer = CompetitionDetailSerializer(data=request.data)
-    
+    invitees = request.data.get('invitees')
+
+    if invitees is not None and (not isinstance(invitees, list) or len(invitees) > MAX_BULK_INVITATIONS):
+        return Response(
+            {"error": f"Invitees must be a list of at most {MAX_BULK_INVITATIONS} usernames"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
     if serializer.is_valid():
+        fields = {
+            'title': serializer.validated_data['title'],
+            'description': serializer.validated_data.get('description', ''),
+            'start_date': serializer.validated_data['start_date'],
+            'end_date': serializer.validated_data['end_date'],
+            'creator': request.user,
+        }
         # Create competition using service
-        competition = CompetitionService.create_competition(
-            title=serializer.validated_data['title'],
-            description=serializer.validated_data.get('description', ''),
-            start_date=serializer.validated_data['start_date'],
-            end_date=serializer.validated_data['end_date'],
-            creator=request.user
-        )
-        
+        if invitees:
+            competition, results = CompetitionService.create_competition_with_invitees(
+                invitees=[str(username) for username in invitees], **fields
+            )
+            if competition is None:
+                return Response({
+                    "error": "Some invitees cannot be invited",
+                    "invitations": invitation_results(results, committed=False),
+                }, status=status.HTTP_400_BAD_REQUEST)
+        else:
+            competition, results = CompetitionService.create_competition(**fields), {}
+
         # Return the created competition
-        result = CompetitionDetailSerializer(competition)
-        return Response(result.data, status=status.HTTP_201_CREATED)
+        result = CompetitionDetailSerializer(competition, context={'request': request, 'avatar_context': 'profile'})
+        return Response(
+            {**result.data, 'invitations': invitation_results(results)}, status=status.HTTP_201_CREATED
+        )
     
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -96,7 +141,9 @@ def create_competition(request):
 def get_invitations(request):
     """Get all pending invitations for the user"""
     invitations = CompetitionService.get_user_competition_invitations(request.user)
-    serializer = CompetitionInvitationSerializer(invitations, many=True)
+    serializer = CompetitionInvitationSerializer(
+        invitations, many=True, context={'request': request, 'avatar_context': 'list'}
+    )
     return Response(serializer.data, status=status.HTTP_200_OK)
 
 @api_view(['POST'])
@@ -104,7 +151,6 @@ def get_invitations(request):
 @permission_classes([IsAuthenticated])
 def send_invitation(request):
     """Send invitation to join competition"""
-    print("Request Data:", request.data)
     competition_id = request.data.get('competition_id')
     username = request.data.get('username')
     
@@ -123,9 +169,57 @@ def send_invitation(request):
     if error:
         return Response({"error": error}, status=status.HTTP_400_BAD_REQUEST)
     
-    serializer = CompetitionInvitationSerializer(invitation)
+    serializer = CompetitionInvitationSerializer(invitation, context={'request': request, 'avatar_context': 'list'})
     return Response(serializer.data, status=status.HTTP_201_CREATED)
 
+@api_view(['POST'])
+@authentication_classes([TokenAuthentication])
+@permission_classes([IsAuthenticated])
+def send_bulk_invitations(request):
+    """Invite a list of friends to a competition; returns a result per username"""
+    competition_id = request.data.get('competition_id')
+    usernames = request.data.get('usernames')
+
+    if not competition_id or not isinstance(usernames, list) or not usernames:
+        return Response(
+            {"error": "Competition ID and a list of usernames are required"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    if len(usernames) > MAX_BULK_INVITATIONS:
+        return Response(
+            {"error": f"At most {MAX_BULK_INVITATIONS} usernames per request"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    results, error = CompetitionService.send_competition_invitations(
+        competition_id=competition_id,
+        sender=request.user,
+        usernames=[str(username) for username in usernames]
+    )
+
+    if error:
+        return Response({"error": error}, status=status.HTTP_400_BAD_REQUEST)
+
+    return Response({
+        "invited": sum(1 for result in results.values() if 'invitation' in result),
+        "results": invitation_results(results),
+    }, status=status.HTTP_200_OK)
+
+def invitation_results(results, committed=True):
+    """
+    {username: {'invitation_id': id} or {'error': message}} from a service
+    result. When the invitations were rolled back their ids point to nothing,
+    so the valid invitees are reported as {'status': 'ok'} instead.
+    """
+    return {
+        username: (
+            result if 'invitation' not in result
+            else {'invitation_id': result['invitation'].id} if committed
+            else {'status': 'ok'}
+        )
+        for username, result in results.items()
+    }
+
 @api_view(['POST'])
 @authentication_classes([TokenAuthentication])
 @permission_classes([IsAuthenticated])
@@ -149,7 +243,7 @@ def handle_invitation(request):
     if error:
         return Response({"error": error}, status=status.HTTP_400_BAD_REQUEST)
     
-    serializer = CompetitionInvitationSerializer(invitation)
+    serializer = CompetitionInvitationSerializer(invitation, context={'request': request, 'avatar_context': 'list'})
     return Response({
         "success": f"Invitation {action}ed",
         "invitation": serializer.data
@@ -180,7 +274,7 @@ def leave_competition(request, competition_id):
             )
         
         # Delete participant entry
-        participant.delete()
+        CompetitionService.remove_participant(participant)
         
         return Response(
             {"success": f"You have left the competition '{competition.title}'"}, 
@@ -192,6 +286,7 @@ def leave_competition(request, competition_id):
 @api_view(['POST'])
 @authentication_classes([TokenAuthentication])
 @permission_classes([IsAuthenticated])
+@idempotent
 def update_screen_time(request):
     """Update user's screen time and recalculate competition rankings"""
     screen_time_minutes = request.data.get('screen_time_minutes')
@@ -230,18 +325,22 @@ def update_screen_time(request):
     
     # Return the updated competitions with rankings
     competitions_data = []
+    participants = {
+        participant.competition_id: participant
+        for participant in Participant.objects.filter(
+            user=request.user, competition__in=updated_competitions
+        )
+    }
     
     for competition in updated_competitions:
-        comp_data = CompetitionListSerializer(competition).data
+        comp_data = CompetitionListSerializer(
+            competition, context={'request': request, 'avatar_context': 'list'}
+        ).data
         
         # Get user's ranking
-        try:
-            participant = Participant.objects.get(user=request.user, competition=competition)
-            comp_data['user_position'] = participant.position
-            comp_data['user_screen_time'] = participant.average_daily_usage
-        except Participant.DoesNotExist:
-            comp_data['user_position'] = None
-            comp_data['user_screen_time'] = None
+        participant = participants.get(competition.id)
+        comp_data['user_position'] = participant.position if participant else None
+        comp_data['user_screen_time'] = participant.average_daily_usage if participant else None
         
         competitions_data.append(comp_data)
     
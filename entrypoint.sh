@@ -1,4 +1,30 @@
 #!/bin/sh
-python manage.py collectstatic --noinput
-python manage.py migrate --noinput
-gunicorn --bind 0.0.0.0:8000 --workers 2 exizt.wsgi
\ No newline at end of file
+set -e
+
+# Skip booting Django for `migrate` when neither the migrations nor the
+# database changed since the last successful run on this volume.
+MIGRATIONS_STAMP="${MIGRATIONS_STAMP:-/data/.migrations-applied}"
+# The shared cache table (SHARED_CACHE_URL) is created along with them.
+migrations_hash=$( { echo "$DATABASE_URL $SHARED_CACHE_URL"; cat requirements.txt */migrations/0*.py; } | sha1sum | cut -d ' ' -f 1)
+if [ "$(cat "$MIGRATIONS_STAMP" 2>/dev/null)" != "$migrations_hash" ]; then
+    python manage.py migrate --noinput
+    python manage.py createcachetable
+    echo "$migrations_hash" > "$MIGRATIONS_STAMP" || true
+fi
+
+# Prometheus samples of every process (gunicorn workers and the periodic
+# jobs) are files in one directory, merged at scrape time. It is emptied
+# here, before any of them starts: files of a previous boot would be added
+# to the new totals.
+export PROMETHEUS_MULTIPROC_DIR="${PROMETHEUS_MULTIPROC_DIR:-/tmp/exizt-prometheus}"
+rm -rf "$PROMETHEUS_MULTIPROC_DIR"
+mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+
+# Maintenance jobs (PERIODIC_JOBS) run beside the server on this machine,
+# whose volume holds the database. They only run while the machine does;
+# every job works from the current state, so it catches up after a stop.
+if [ "${RUN_PERIODIC_JOBS:-true}" = "true" ]; then
+    python manage.py run_periodic_jobs &
+fi
+
+exec gunicorn -c gunicorn.conf.py
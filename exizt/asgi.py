@@ -9,8 +9,31 @@ https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 
 import os
 
+from asgiref.sync import sync_to_async
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'exizt.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Imported once Django is set up. Sheds load before requests queue for the view thread.
+from exizt.middleware import LoadSheddingASGIMiddleware
+django_application = LoadSheddingASGIMiddleware(django_application)
+
+
+async def application(scope, receive, send):
+    """Django's ASGI app plus lifespan support to warm each worker up and clean it up"""
+    if scope['type'] != 'lifespan':
+        return await django_application(scope, receive, send)
+
+    from exizt.warmup import warm_up
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await sync_to_async(warm_up)()
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            from realtime.brokers import close_broker
+            close_broker()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
@@ -0,0 +1,120 @@
+"""
+Running several API requests in one round-trip.
+
+Each sub-request goes through the URL resolver to the view in this process,
+as the already authenticated user: DRF's forced authentication replaces the
+token lookup every sub-request would otherwise repeat. Middleware runs once,
+for the batch request itself.
+"""
+import json
+import logging
+from contextlib import nullcontext
+from io import BytesIO
+from urllib.parse import urlsplit
+from django.core.handlers.wsgi import WSGIRequest
+from django.db import transaction
+from django.urls import Resolver404, resolve
+from monitoring.metrics import BATCH_SUBREQUESTS
+
+logger = logging.getLogger(__name__)
+
+METHODS = ('GET', 'POST', 'PUT', 'PATCH', 'DELETE')
+# Streams, probes and batches themselves cannot be part of a batch
+EXCLUDED_VIEWS = ('batch', 'events', 'readiness', 'metrics')
+
+
+def parse(items, max_requests):
+    """
+    Validate the sub-requests of a batch. Returns a list of
+    (method, path, query, body, idempotency key, resolver match) and None,
+    or None and the error message.
+    """
+    if not isinstance(items, list) or not items:
+        return None, "requests must be a non-empty list"
+    if len(items) > max_requests:
+        return None, f"At most {max_requests} requests per batch"
+    parsed = []
+    for index, item in enumerate(items):
+        if not isinstance(item, dict):
+            return None, f"Request {index} must be an object"
+        method = str(item.get('method', 'GET')).upper()
+        if method not in METHODS:
+            return None, f"Request {index}: method must be one of {', '.join(METHODS)}"
+        url = item.get('path')
+        if not isinstance(url, str) or not url.startswith('/'):
+            return None, f"Request {index}: path must start with /"
+        idempotency_key = item.get('idempotency_key')
+        if idempotency_key is not None and not isinstance(idempotency_key, str):
+            return None, f"Request {index}: idempotency_key must be a string"
+        url = urlsplit(url)
+        try:
+            match = resolve(url.path)
+        except Resolver404:
+            return None, f"Request {index}: {url.path} not found"
+        if match.url_name in EXCLUDED_VIEWS or match.app_names:
+            return None, f"Request {index}: {url.path} cannot be batched"
+        parsed.append((method, url.path, url.query, item.get('body'), idempotency_key, match))
+    return parsed, None
+
+
+def build_request(request, method, path, query, body, idempotency_key, match):
+    """A request for one sub-request, carrying the batch request's headers and user"""
+    content = b'' if body is None else json.dumps(body).encode()
+    environ = {
+        key: value for key, value in request.META.items()
+        if not key.startswith(('wsgi.', 'CONTENT_')) and key != 'HTTP_IDEMPOTENCY_KEY'
+    }
+    if idempotency_key is not None:
+        # Each sub-request has its own key, if any
+        environ['HTTP_IDEMPOTENCY_KEY'] = idempotency_key
+    environ.update({
+        'REQUEST_METHOD': method,
+        'PATH_INFO': path,
+        'QUERY_STRING': query,
+        'CONTENT_TYPE': 'application/json',
+        'CONTENT_LENGTH': str(len(content)),
+        'wsgi.input': BytesIO(content),
+    })
+    sub_request = WSGIRequest(environ)
+    sub_request.resolver_match = match
+    sub_request._force_auth_user = request.user
+    sub_request._force_auth_token = request.auth
+    return sub_request
+
+
+def response_body(response):
+    """The payload of a view's response: DRF data as is, JSON decoded, else None"""
+    if hasattr(response, 'data'):
+        return response.data
+    if response.get('Content-Type', '').startswith('application/json'):
+        return json.loads(response.content)
+    return None
+
+
+def run(request, parsed, atomic):
+    """
+    Call the views of parsed sub-requests in order. Returns the
+    {'status', 'body'} of each and whether the changes were committed.
+
+    Each sub-request runs in its own transaction (a savepoint with atomic),
+    so one that raises leaves no partial writes and is reported as a 500.
+    With atomic, everything runs in one transaction that is rolled back at
+    the first response with an error status; later sub-requests do not run.
+    """
+    responses = []
+    with transaction.atomic() if atomic else nullcontext():
+        for method, path, query, body, idempotency_key, match in parsed:
+            sub_request = build_request(request, method, path, query, body, idempotency_key, match)
+            BATCH_SUBREQUESTS.labels(match.url_name or path).inc()
+            try:
+                with transaction.atomic():
+                    response = match.func(sub_request, *match.args, **match.kwargs)
+            except Exception:
+                logger.exception("Batch sub-request %s %s failed", method, path)
+                responses.append({'status': 500, 'body': {'error': 'Internal server error'}})
+            else:
+                responses.append({'status': response.status_code, 'body': response_body(response)})
+            if atomic and responses[-1]['status'] >= 400:
+                transaction.set_rollback(True)
+                return responses, False
+    return responses, True
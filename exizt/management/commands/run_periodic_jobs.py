@@ -0,0 +1,36 @@
+import logging
+import time
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = "Run the maintenance commands of PERIODIC_JOBS, each every its interval, in one process"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Run every job once and exit")
+
+    def handle(self, *args, **options):
+        due = {name: 0.0 for name in settings.PERIODIC_JOBS}
+        while True:
+            for name, interval in settings.PERIODIC_JOBS.items():
+                if time.monotonic() < due[name]:
+                    continue
+                self.run(name)
+                due[name] = time.monotonic() + interval
+            if options['once']:
+                return
+            time.sleep(max(0.0, min(due.values()) - time.monotonic()))
+
+    def run(self, name):
+        """One run of a job; a failure is logged and retried at its next turn"""
+        try:
+            call_command(name, stdout=self.stdout)
+        except Exception:
+            logger.exception("Periodic job %s failed", name)
+        finally:
+            close_old_connections()
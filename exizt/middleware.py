@@ -0,0 +1,187 @@
+import hashlib
+import json
+import threading
+import time
+from django.conf import settings
+from django.core.cache import caches
+from django.http import JsonResponse
+from monitoring.metrics import REQUESTS_SHED, record_cache
+from .routers import replica_alias, use_replica, reset_replica
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+def client_key(request):
+    """Identify the client from its token (or session) without a DB lookup"""
+    credential = request.META.get('HTTP_AUTHORIZATION') or request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+    if not credential:
+        return None
+    return hashlib.sha1(credential.encode()).hexdigest()
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Let safe requests read from the replica, unless the same client wrote
+    within the last REPLICA_STICKY_SECONDS (read-your-writes stickiness).
+    The flag is kept in REPLICA_STICKY_CACHE_ALIAS so every worker sees it.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if replica_alias() is None:
+            return self.get_response(request)
+
+        key = client_key(request)
+        sticky_key = f'replica-sticky:{key}'
+        cache = caches[settings.REPLICA_STICKY_CACHE_ALIAS]
+
+        def mark_written():
+            if key:
+                cache.set(sticky_key, True, settings.REPLICA_STICKY_SECONDS)
+
+        if request.method not in SAFE_METHODS:
+            # Mutating requests read from the primary and make the client sticky
+            tokens = use_replica(False)
+            try:
+                return self.get_response(request)
+            finally:
+                reset_replica(tokens)
+                mark_written()
+
+        allowed = not (key and record_cache('replica_sticky', bool(cache.get(sticky_key))))
+        tokens = use_replica(allowed, mark_written)
+        try:
+            return self.get_response(request)
+        finally:
+            reset_replica(tokens)
+
+
+class LoadMonitor:
+    """
+    Requests in flight in this process and a moving average of their
+    latency. The average decays while no request finishes, so a worker that
+    sheds everything recovers on its own.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.latency = 0.0
+        self.updated = time.monotonic()
+
+    def current_latency(self):
+        elapsed = time.monotonic() - self.updated
+        return self.latency * 0.5 ** (elapsed / settings.LOAD_SHEDDING_LATENCY_HALF_LIFE)
+
+    def shed_reason(self, method, path):
+        """Why a request should be refused now, or None; reads and exempt paths never are"""
+        if method in SAFE_METHODS or shedding_exempt(path):
+            return None
+        if self.in_flight >= settings.LOAD_SHEDDING_MAX_IN_FLIGHT:
+            return 'queue_depth'
+        if self.current_latency() * 1000 >= settings.LOAD_SHEDDING_MAX_LATENCY_MS:
+            return 'latency'
+        return None
+
+    def started(self):
+        with self.lock:
+            self.in_flight += 1
+
+    def finished(self, seconds):
+        with self.lock:
+            self.in_flight -= 1
+            self.latency = 0.8 * self.current_latency() + 0.2 * seconds
+            self.updated = time.monotonic()
+
+
+# One per worker process, shared by the ASGI wrapper and the middleware
+load_monitor = LoadMonitor()
+
+# Set in the ASGI scope of requests the ASGI wrapper already counted
+COUNTED = 'exizt.load_counted'
+
+
+def shedding_exempt(path):
+    """Probes, event streams and the admin are never shed nor counted"""
+    return path.startswith(settings.LOAD_SHEDDING_EXEMPT_PATHS)
+
+
+def shed(reason):
+    REQUESTS_SHED.labels(reason).inc()
+    return {'error': 'Server is busy, retry later'}, [('Retry-After', str(settings.LOAD_SHEDDING_RETRY_AFTER))]
+
+
+class LoadSheddingASGIMiddleware:
+    """
+    Wraps the ASGI application: refuses writes with 503 and Retry-After while
+    this worker is overloaded, before they are queued.
+
+    Django runs the middleware chain and the sync views of a worker on one
+    thread, one request at a time, so only here, on the event loop, are the
+    requests waiting for that thread visible. in_flight counts them all and
+    latency runs from arrival, queueing included.
+    """
+
+    def __init__(self, app, monitor=None):
+        self.app = app
+        self.monitor = monitor or load_monitor
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or shedding_exempt(scope['path']):
+            return await self.app(scope, receive, send)
+
+        reason = self.monitor.shed_reason(scope['method'], scope['path'])
+        if reason is not None:
+            body, headers = shed(reason)
+            await send({
+                'type': 'http.response.start',
+                'status': 503,
+                'headers': [(b'content-type', b'application/json')]
+                           + [(name.lower().encode(), value.encode()) for name, value in headers],
+            })
+            await send({'type': 'http.response.body', 'body': json.dumps(body).encode()})
+            return
+
+        scope = {**scope, COUNTED: True}
+        self.monitor.started()
+        start = time.monotonic()
+        try:
+            return await self.app(scope, receive, send)
+        finally:
+            self.monitor.finished(time.monotonic() - start)
+
+
+class LoadSheddingMiddleware:
+    """
+    Refuse writes with 503 and Retry-After while this worker is overloaded:
+    LOAD_SHEDDING_MAX_IN_FLIGHT requests already in flight, or recent
+    latency above LOAD_SHEDDING_MAX_LATENCY_MS. Reads and exempt paths
+    (probes, event streams) are always let through.
+
+    Under WSGI this counts the requests of the worker's threads. Under ASGI
+    LoadSheddingASGIMiddleware has already counted (and possibly shed) the
+    request, including the time it queued, so it is only passed on.
+    """
+
+    def __init__(self, get_response, monitor=None):
+        self.get_response = get_response
+        self.monitor = monitor or load_monitor
+
+    def __call__(self, request):
+        if getattr(request, 'scope', {}).get(COUNTED) or shedding_exempt(request.path):
+            return self.get_response(request)
+        reason = self.monitor.shed_reason(request.method, request.path)
+        if reason is not None:
+            body, headers = shed(reason)
+            response = JsonResponse(body, status=503)
+            for name, value in headers:
+                response[name] = value
+            return response
+        self.monitor.started()
+        start = time.monotonic()
+        try:
+            return self.get_response(request)
+        finally:
+            self.monitor.finished(time.monotonic() - start)
@@ -0,0 +1,76 @@
+"""
+Database routing between the primary database and an optional read replica.
+
+Reads are only sent to the replica while a request has opted in through
+``ReplicaRoutingMiddleware`` (safe methods from clients that have not written
+recently). Everything else - writes, reads inside a transaction, management
+commands, background work - stays on the primary.
+"""
+from contextvars import ContextVar
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+_use_replica = ContextVar('use_replica', default=False)
+_on_write = ContextVar('on_write', default=None)
+
+
+def replica_alias():
+    """Return the configured replica alias, or None if there is no replica"""
+    alias = getattr(settings, 'REPLICA_DATABASE_ALIAS', None)
+    if alias and alias in settings.DATABASES:
+        return alias
+    return None
+
+
+def use_replica(enabled, on_write=None):
+    """
+    Allow or forbid replica reads for the current context.
+
+    Returns a token to pass to ``reset_replica`` once the request is done.
+    ``on_write`` is called the first time a write is routed while enabled.
+    """
+    return _use_replica.set(enabled), _on_write.set(on_write)
+
+
+def reset_replica(tokens):
+    """Restore the routing state saved by ``use_replica``"""
+    use_token, write_token = tokens
+    _use_replica.reset(use_token)
+    _on_write.reset(write_token)
+
+
+def pin_to_primary():
+    """Send every following read of the current context to the primary"""
+    if _use_replica.get():
+        _use_replica.set(False)
+        callback = _on_write.get()
+        if callback is not None:
+            callback()
+
+
+class PrimaryReplicaRouter:
+    """Send opted-in reads to the replica and everything else to the primary"""
+
+    def db_for_read(self, model, **hints):
+        alias = replica_alias()
+        if alias is None or not _use_replica.get():
+            return DEFAULT_DB_ALIAS
+        # Database cache entries (throttles, stickiness) must never be stale
+        if model._meta.app_label == 'django_cache':
+            return DEFAULT_DB_ALIAS
+        # Reads inside a transaction on the primary must see its writes
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return alias
+
+    def db_for_write(self, model, **hints):
+        # Read-your-writes: once this request writes, stop reading from the replica
+        pin_to_primary()
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replica holds the same data as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return None
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 import os
+import tempfile
 from pathlib import Path
 import environ
 
@@ -36,15 +37,25 @@ INSTALLED_APPS = [
     'rest_framework.authtoken',
     'corsheaders',
     'django.contrib.staticfiles',
-    'cloudinary_storage',
-    'cloudinary',
+    'exizt',
     'users',
     'friendships',
     'competitions',
+    'benchmarks',
+    'monitoring',
+    'realtime',
+    'sync',
+    'home',
+    'idempotency',
+    'screentime',
 ]
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'exizt.middleware.LoadSheddingMiddleware',
+    'monitoring.middleware.SlowQueryMiddleware',
+    'exizt.middleware.ReplicaRoutingMiddleware',
+    'monitoring.middleware.SQLInstrumentationMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -53,6 +64,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'monitoring.middleware.ProfilerMiddleware',
 ]
 
 ROOT_URLCONF = 'exizt.urls'
@@ -89,6 +101,62 @@ CORS_ALLOWED_ORIGINS = [
 DATABASES = {
     "default": env.db_url("DATABASE_URL", default="sqlite:////data/db.sqlite3"),
 }
+# Keep connections open between requests so warm-up connections are reused.
+# A connection belongs to the thread that opened it, and the ASGI handler
+# runs each request's sync code on a new thread: there a kept connection is
+# never reused nor closed, so the asgi preset closes them after each request.
+DATABASES['default']['CONN_MAX_AGE'] = env.int(
+    'CONN_MAX_AGE', default=0 if env('GUNICORN_PRESET', default='sync') == 'asgi' else 60
+)
+DATABASES['default']['CONN_HEALTH_CHECKS'] = True
+
+# Optional read replica: safe requests read from it, writes stay on the primary.
+# Locally, point both URLs at two SQLite files or two Postgres databases.
+REPLICA_DATABASE_ALIAS = None
+REPLICA_STICKY_SECONDS = env.int('REPLICA_STICKY_SECONDS', default=5)
+# Must be seen by every worker, or a write on one worker leaves the next read
+# on another one free to hit the lagging replica
+REPLICA_STICKY_CACHE_ALIAS = 'shared'
+if env('REPLICA_DATABASE_URL', default=''):
+    REPLICA_DATABASE_ALIAS = 'replica'
+    DATABASES[REPLICA_DATABASE_ALIAS] = env.db_url('REPLICA_DATABASE_URL')
+    DATABASES[REPLICA_DATABASE_ALIAS]['CONN_MAX_AGE'] = DATABASES['default']['CONN_MAX_AGE']
+    DATABASES[REPLICA_DATABASE_ALIAS]['CONN_HEALTH_CHECKS'] = True
+    DATABASES[REPLICA_DATABASE_ALIAS]['TEST'] = {'MIRROR': 'default'}
+    DATABASE_ROUTERS = ['exizt.routers.PrimaryReplicaRouter']
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+
+# 'shared' is seen by every worker of every machine on the volume, for state
+# that must not be multiplied by the worker count (the write throttles, the
+# replica stickiness flags). Its
+# default is a table in the main database (manage.py createcachetable);
+# point SHARED_CACHE_URL at Redis or memcached where one is available.
+CACHES = {
+    'default': env.cache_url('CACHE_URL', default='locmemcache://'),
+    'shared': env.cache_url(
+        'SHARED_CACHE_URL', default='dbcache://exizt_shared_cache?max_entries=100000&cull_frequency=10'
+    ),
+}
+
+# Bearer token of internal/metrics/, which is disabled without one. Fly
+# scrapes the gunicorn master on METRICS_PORT (gunicorn.conf.py), which is
+# not exposed publicly.
+METRICS_TOKEN = env.str('METRICS_TOKEN', default='')
+
+# Per-request SQL instrumentation (query count/time in Server-Timing and logs)
+SQL_INSTRUMENTATION_SAMPLE_RATE = env.float('SQL_INSTRUMENTATION_SAMPLE_RATE', default=1.0 if DEBUG else 0.1)
+
+# Slow-query log: statements from these modules over the threshold are
+# stored with their plan (see monitoring.slow_queries)
+SLOW_QUERY_LOG = env.bool('SLOW_QUERY_LOG', default=True)
+SLOW_QUERY_THRESHOLD_MS = env.float('SLOW_QUERY_THRESHOLD_MS', default=100.0)
+SLOW_QUERY_MODULES = ['users.services', 'friendships.services', 'competitions.services']
+
+# On-demand profiling of single requests by staff (X-Profile: 1 or ?_profile=1)
+PROFILER_DIR = env('PROFILER_DIR', default=str(BASE_DIR / 'profiles'))
+PROFILER_MAX_CAPTURES = env.int('PROFILER_MAX_CAPTURES', default=50)
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -126,7 +194,6 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 STATIC_ROOT = BASE_DIR / 'staticfiles'
-STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
@@ -142,12 +209,157 @@ AUTHENTICATION_BACKENDS = [
 
 MEDIA_URL = '/media/'
 ENVIRONMENT = env('ENVIRONMENT')
+
+# Avatars are staged locally and resized/uploaded off the request path:
+# 'thread' processes them on a background thread after the request commits,
+# 'inline' processes them before the response (tests, single-shot scripts).
+AVATAR_STAGING_DIR = env('AVATAR_STAGING_DIR', default=str(BASE_DIR / 'staging'))
+AVATAR_PROCESSING_MODE = env('AVATAR_PROCESSING_MODE', default='thread')
+AVATAR_WORKER_THREADS = env.int('AVATAR_WORKER_THREADS', default=1)
+AVATAR_SIZES = (64, 256, 512)
+# Avatar size served by ProfileSerializer per 'avatar_context'
+AVATAR_CONTEXT_SIZES = {
+    'profile': 512,
+    'list': 64,
+    'leaderboard': 64,
+}
+AVATAR_FORMAT = 'WEBP'
+AVATAR_QUALITY = 80
+
+# Event streams (realtime app). REALTIME_BROKER carries events from the
+# service layer to the streams: LocalBroker within one process (tests,
+# runserver), SocketBroker between all processes of the machine.
+REALTIME_BROKER = env('REALTIME_BROKER', default='realtime.brokers.SocketBroker')
+REALTIME_SOCKET_DIR = env('REALTIME_SOCKET_DIR', default=os.path.join(tempfile.gettempdir(), 'exizt-realtime'))
+REALTIME_KEEPALIVE_SECONDS = env.float('REALTIME_KEEPALIVE_SECONDS', default=15.0)
+REALTIME_MAX_STREAM_SECONDS = env.float('REALTIME_MAX_STREAM_SECONDS', default=3600.0)
+# Streams without an event for this long end with 'idle'; held streams
+# would otherwise keep Fly's auto-stop from ever stopping the machine
+REALTIME_IDLE_STREAM_SECONDS = env.float('REALTIME_IDLE_STREAM_SECONDS', default=600.0)
+# Events a slow stream may fall behind by before it is told to resync
+REALTIME_MAX_QUEUED_EVENTS = 100
+REALTIME_RETRY_MS = 5000
+
+# Days after a competition ends before close_competitions moves its
+# Participant rows to the archive (its standings stay in the snapshot)
+COMPETITION_ARCHIVE_AFTER_DAYS = env.float('COMPETITION_ARCHIVE_AFTER_DAYS', default=30)
+
+# Rows of the friends leaderboard (screen-time/leaderboard/)
+FRIENDS_LEADERBOARD_SIZE = env.int('FRIENDS_LEADERBOARD_SIZE', default=100)
+
+# Delta sync feed (sync app): entries per response, and how long the change
+# log is kept; clients with older cursors get a full snapshot
+SYNC_PAGE_SIZE = env.int('SYNC_PAGE_SIZE', default=500)
+SYNC_RETENTION_DAYS = env.float('SYNC_RETENTION_DAYS', default=30)
+# How long a change-log write may take to commit (see SyncService.get_changes);
+# SQLite commits ids in order, other databases need a safety margin
+SYNC_CURSOR_LAG_SECONDS = env.float(
+    'SYNC_CURSOR_LAG_SECONDS', default=0 if 'sqlite' in DATABASES['default']['ENGINE'] else 5
+)
+
+# How long a rendered home screen is kept in the cache. Entries are keyed by
+# the home version, so this bounds memory, not staleness.
+HOME_CACHE_SECONDS = env.int('HOME_CACHE_SECONDS', default=300)
+
+# Sub-requests accepted by one batch/ request
+BATCH_MAX_REQUESTS = 20
+
+# Token-bucket throttles of the writes (exizt.throttling): per scope, the
+# (rate, burst) of each user's bucket and of the bucket all users share.
+# Buckets live in THROTTLE_CACHE_ALIAS, which must be shared by all workers
+# for the limits to hold; each worker falls back to memory if it fails.
+REST_FRAMEWORK = {
+    'DEFAULT_THROTTLE_CLASSES': [
+        'exizt.throttling.UserWriteThrottle',
+        'exizt.throttling.GlobalWriteThrottle',
+    ],
+}
+THROTTLE_ENABLED = env.bool('THROTTLE_ENABLED', default=True)
+THROTTLE_CACHE_ALIAS = 'shared'
+THROTTLE_BUCKETS = {
+    # Every submission re-ranks the user's competitions
+    'screen_time': {'user': ('6/min', 10), 'global': ('50/sec', 100)},
+    'writes': {'user': ('120/min', 60), 'global': ('200/sec', 400)},
+}
+# Write endpoints by URL name; the others use the 'writes' scope
+THROTTLE_SCOPES = {
+    'update_screen_time': 'screen_time',
+}
+
+# Worker warm-up (exizt.warmup): delay before retrying a failed warm-up,
+# doubled after every failure up to the maximum
+WARMUP_RETRY_SECONDS = 1.0
+WARMUP_RETRY_MAX_SECONDS = 60.0
+
+# Load shedding (exizt.middleware): per worker, the requests in flight and
+# the recent latency past which writes get a 503. Under ASGI in-flight
+# counts the requests queued for the worker's single view thread, so 16 is
+# about half a second of typical writes; a gthread worker never holds more
+# than its threads, so there only the latency limit applies.
+LOAD_SHEDDING_MAX_IN_FLIGHT = env.int('LOAD_SHEDDING_MAX_IN_FLIGHT', default=16)
+LOAD_SHEDDING_MAX_LATENCY_MS = env.float('LOAD_SHEDDING_MAX_LATENCY_MS', default=2000.0)
+LOAD_SHEDDING_LATENCY_HALF_LIFE = 2.0
+LOAD_SHEDDING_RETRY_AFTER = 2
+LOAD_SHEDDING_EXEMPT_PATHS = ('/internal/', '/events/', '/admin/')
+
+# Maintenance commands run by run_periodic_jobs, started next to gunicorn by
+# entrypoint.sh (RUN_PERIODIC_JOBS) on every machine, and seconds between runs
+PERIODIC_JOBS = {
+    # Uploads left pending by a restart
+    'process_avatars': 60,
+    'expire_invitations': 300,
+    'close_competitions': 3600,
+    'purge_idempotency_keys': 3600,
+    'compact_changes': 6 * 3600,
+}
+
+# Idempotency keys (idempotency app): how long a key can be retried
+# (purge_idempotency_keys), and after how long a request that never
+# finished stops blocking retries of its key
+IDEMPOTENCY_KEY_TTL_HOURS = env.float('IDEMPOTENCY_KEY_TTL_HOURS', default=24)
+IDEMPOTENCY_LOCK_SECONDS = 60
+
+# Storage backends are imported on first use, so Cloudinary stays off the
+# startup path. Static files are collected and compressed at image build time.
+AVATAR_STORAGE_ALIAS = 'avatars'
 if ENVIRONMENT == 'development':
     MEDIA_ROOT = BASE_DIR / 'media'
+    STORAGES = {
+        'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+        'avatars': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+        'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+    }
 else:
-    DEFAULT_FILE_STORAGE = 'cloudinary_storage.storage.MediaCloudinaryStorage'
+    STORAGES = {
+        'default': {'BACKEND': 'cloudinary_storage.storage.MediaCloudinaryStorage'},
+        'avatars': {'BACKEND': 'cloudinary_storage.storage.MediaCloudinaryStorage'},
+        'staticfiles': {'BACKEND': 'whitenoise.storage.CompressedManifestStaticFilesStorage'},
+    }
     CLOUDINARY_STORAGE = {
         'CLOUD_NAME': env('CLOUDINARY_CLOUD_NAME'),
         'API_KEY': env('CLOUDINARY_API_KEY'),
         'API_SECRET': env('CLOUDINARY_API_SECRET')
-    }
\ No newline at end of file
+    }
+
+# Logging
+# https://docs.djangoproject.com/en/5.2/topics/logging/
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'exizt': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+        'monitoring': {
+            'handlers': ['console'],
+            'level': env('MONITORING_LOG_LEVEL', default='INFO'),
+            'propagate': False,
+        },
+    },
+}
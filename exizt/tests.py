@@ -0,0 +1,500 @@
+import asyncio
+import json
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+from django.core.cache import cache, caches
+from django.core.cache.backends.db import DatabaseCache
+from django.core.management import call_command
+from django.http import HttpResponse
+from django.core.handlers.asgi import ASGIHandler
+from django.db import connection, connections
+from django.db.backends.signals import connection_created
+from django.test import SimpleTestCase, TestCase, RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APITestCase
+from competitions.models import Competition
+from friendships.models import FriendRequest
+from users.models import User
+from competitions.services import CompetitionService
+from . import throttling, warmup
+from .middleware import (
+    LoadMonitor, LoadSheddingASGIMiddleware, LoadSheddingMiddleware, ReplicaRoutingMiddleware, client_key,
+    load_monitor,
+)
+from .routers import PrimaryReplicaRouter, use_replica, reset_replica
+
+class ReplicaRouterTest(SimpleTestCase):
+    """Tests for the primary/replica database router"""
+
+    def setUp(self):
+        self.router = PrimaryReplicaRouter()
+        patcher = mock.patch('exizt.routers.replica_alias', return_value='replica')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_reads_stay_on_primary_by_default(self):
+        self.assertEqual(self.router.db_for_read(User), 'default')
+
+    def test_opted_in_reads_use_replica(self):
+        tokens = use_replica(True)
+        try:
+            self.assertEqual(self.router.db_for_read(User), 'replica')
+        finally:
+            reset_replica(tokens)
+
+    def test_write_pins_reads_to_primary(self):
+        on_write = mock.Mock()
+        tokens = use_replica(True, on_write)
+        try:
+            self.assertEqual(self.router.db_for_write(User), 'default')
+            self.assertEqual(self.router.db_for_read(User), 'default')
+        finally:
+            reset_replica(tokens)
+        on_write.assert_called_once_with()
+
+    def test_database_cache_reads_stay_on_primary(self):
+        cache_entry = DatabaseCache('exizt_shared_cache', {}).cache_model_class
+        tokens = use_replica(True)
+        try:
+            self.assertEqual(self.router.db_for_read(cache_entry), 'default')
+        finally:
+            reset_replica(tokens)
+
+    def test_without_replica_configured(self):
+        tokens = use_replica(True)
+        try:
+            with mock.patch('exizt.routers.replica_alias', return_value=None):
+                self.assertEqual(self.router.db_for_read(User), 'default')
+        finally:
+            reset_replica(tokens)
+
+class ReplicaRouterTransactionTest(TestCase):
+    """Reads inside a transaction must see the primary's uncommitted writes"""
+
+    def test_reads_in_atomic_block_use_primary(self):
+        tokens = use_replica(True)
+        try:
+            with mock.patch('exizt.routers.replica_alias', return_value='replica'):
+                self.assertEqual(PrimaryReplicaRouter().db_for_read(User), 'default')
+        finally:
+            reset_replica(tokens)
+
+class ReplicaRoutingMiddlewareTest(SimpleTestCase):
+    """Tests for per-request replica routing and read-your-writes stickiness"""
+    # The stickiness flags live in the database cache; no test transaction, so
+    # the router sees reads outside an atomic block as it does in production
+    databases = {'default'}
+
+    def setUp(self):
+        cache.clear()
+        caches['shared'].clear()
+        self.addCleanup(caches['shared'].clear)
+        self.factory = RequestFactory()
+        self.router = PrimaryReplicaRouter()
+        patcher = mock.patch('exizt.routers.replica_alias', return_value='replica')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch('exizt.middleware.replica_alias', return_value='replica')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def read_alias_for(self, request):
+        """Run the middleware and return the alias a read inside the view would use"""
+        seen = {}
+
+        def view(request):
+            seen['alias'] = self.router.db_for_read(User)
+            if request.method == 'POST':
+                self.router.db_for_write(User)
+            return HttpResponse()
+
+        ReplicaRoutingMiddleware(view)(request)
+        return seen['alias']
+
+    def test_get_reads_from_replica(self):
+        request = self.factory.get('/friendships/', HTTP_AUTHORIZATION='Token abc')
+        self.assertEqual(self.read_alias_for(request), 'replica')
+
+    def test_post_reads_from_primary(self):
+        request = self.factory.post('/send-request/', HTTP_AUTHORIZATION='Token abc')
+        self.assertEqual(self.read_alias_for(request), 'default')
+
+    def test_client_is_sticky_after_write(self):
+        self.read_alias_for(self.factory.post('/send-request/', HTTP_AUTHORIZATION='Token abc'))
+
+        # The writer keeps reading from the primary...
+        request = self.factory.get('/requests/', HTTP_AUTHORIZATION='Token abc')
+        self.assertEqual(self.read_alias_for(request), 'default')
+
+        # ...while other clients still use the replica
+        request = self.factory.get('/requests/', HTTP_AUTHORIZATION='Token xyz')
+        self.assertEqual(self.read_alias_for(request), 'replica')
+
+    def test_sticky_flag_is_shared_between_workers(self):
+        request = self.factory.post('/send-request/', HTTP_AUTHORIZATION='Token abc')
+        self.read_alias_for(request)
+
+        key = f'replica-sticky:{client_key(request)}'
+        self.assertTrue(caches['shared'].get(key))
+        self.assertIsNone(cache.get(key))
+
+        # A worker with its own (empty) local cache still sends the writer to the primary
+        cache.clear()
+        request = self.factory.get('/requests/', HTTP_AUTHORIZATION='Token abc')
+        self.assertEqual(self.read_alias_for(request), 'default')
+
+class WarmupTest(TestCase):
+    """Tests for worker warm-up and the readiness endpoint"""
+
+    def setUp(self):
+        warmup._reset()
+        self.addCleanup(warmup._reset)
+        user = User.objects.create_user(username='warm', email='warm@example.com', password='testpassword123')
+        now = timezone.now()
+        CompetitionService.create_competition(
+            title='Active', description='', creator=user,
+            start_date=now - timedelta(days=1), end_date=now + timedelta(days=1)
+        )
+
+    def test_warm_up_marks_worker_ready(self):
+        self.assertFalse(warmup.is_ready())
+        self.assertTrue(warmup.warm_up())
+        self.assertTrue(warmup.is_ready())
+        response = self.client.get(reverse('readiness'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'ready': True, 'skipped': []})
+
+    def test_failed_warm_up_is_retried_with_backoff(self):
+        failing = mock.Mock(side_effect=RuntimeError('database unavailable'), __name__='failing')
+        with mock.patch.object(warmup, 'WARMUP_STEPS', (failing,)), \
+                mock.patch.object(warmup.time, 'monotonic', return_value=100.0) as monotonic, \
+                self.assertLogs('exizt.warmup', 'WARNING'):
+            response = self.client.get(reverse('readiness'))
+            self.assertEqual(response.status_code, 503)
+            self.assertFalse(warmup.is_ready())
+
+            # Probes within the retry delay do not run the steps again
+            self.client.get(reverse('readiness'))
+            self.assertEqual(failing.call_count, 1)
+
+            # The delay doubles after each failure
+            monotonic.return_value = 101.0
+            self.client.get(reverse('readiness'))
+            self.assertEqual(failing.call_count, 2)
+            monotonic.return_value = 102.5
+            self.client.get(reverse('readiness'))
+            self.assertEqual(failing.call_count, 2)
+
+            failing.side_effect = None
+            monotonic.return_value = 103.0
+            response = self.client.get(reverse('readiness'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(failing.call_count, 3)
+
+    def test_optional_step_failure_does_not_block_readiness(self):
+        failing = mock.Mock(side_effect=RuntimeError('storage unavailable'), __name__='failing')
+        with mock.patch.object(warmup, 'OPTIONAL_WARMUP_STEPS', (failing,)), \
+                self.assertLogs('exizt.warmup', 'ERROR'):
+            response = self.client.get(reverse('readiness'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'ready': True, 'skipped': ['failing']})
+
+        # A ready worker does not warm up again
+        self.client.get(reverse('readiness'))
+        failing.assert_called_once()
+
+class BatchTest(APITestCase):
+    """Tests for the batch endpoint"""
+
+    def setUp(self):
+        self.user1 = User.objects.create_user(username='testuser1', email='test1@example.com', password='testpassword123')
+        self.user2 = User.objects.create_user(username='testuser2', email='test2@example.com', password='testpassword123')
+        self.user3 = User.objects.create_user(username='testuser3', email='test3@example.com', password='testpassword123')
+        self.token = Token.objects.create(user=self.user1)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        self.url = reverse('batch')
+
+    def send_requests(self, *usernames):
+        return [
+            {'method': 'POST', 'path': reverse('send_friend_request'), 'body': {'username': username}}
+            for username in usernames
+        ]
+
+    def test_runs_requests_in_order(self):
+        requests = self.send_requests('testuser2', 'testuser3') + [
+            {'path': reverse('friend_requests') + '?avatar_size=64'}
+        ]
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.post(self.url, {'requests': requests}, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('committed', response.data)
+        statuses = [sub['status'] for sub in response.data['responses']]
+        self.assertEqual(statuses, [201, 201, 200])
+        sent = response.data['responses'][2]['body']['sent_requests']
+        self.assertEqual([request['receiver']['username'] for request in sent], ['testuser2', 'testuser3'])
+        # The token is looked up once for the whole batch
+        token_lookups = [query for query in captured.captured_queries if 'authtoken_token' in query['sql']]
+        self.assertEqual(len(token_lookups), 1)
+
+    def test_atomic_batch_rolls_back_on_error(self):
+        requests = self.send_requests('testuser2', 'nobody', 'testuser3')
+        response = self.client.post(self.url, {'requests': requests, 'atomic': True}, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.data['committed'])
+        self.assertEqual([sub['status'] for sub in response.data['responses']], [201, 404])
+        self.assertFalse(FriendRequest.objects.exists())
+
+        response = self.client.post(self.url, {'requests': self.send_requests('testuser2'), 'atomic': True}, format='json')
+        self.assertTrue(response.data['committed'])
+        self.assertEqual(FriendRequest.objects.count(), 1)
+
+    def test_non_atomic_batch_keeps_successes(self):
+        response = self.client.post(self.url, {'requests': self.send_requests('nobody', 'testuser2')}, format='json')
+
+        self.assertEqual([sub['status'] for sub in response.data['responses']], [404, 201])
+        self.assertEqual(FriendRequest.objects.get().receiver, self.user2)
+
+    def test_sub_request_that_raises_is_isolated(self):
+        now = timezone.now()
+        requests = [
+            {'method': 'POST', 'path': reverse('create_competition'), 'body': {
+                'title': 'Batched', 'start_date': (now + timedelta(days=1)).isoformat(),
+                'end_date': (now + timedelta(days=8)).isoformat(),
+            }},
+            {'method': 'POST', 'path': reverse('update_screen_time'), 'body': {'screen_time_minutes': 90, 'date': 123}},
+        ]
+        with self.assertLogs('exizt.batch', 'ERROR'):
+            response = self.client.post(self.url, {'requests': requests}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([sub['status'] for sub in response.data['responses']], [201, 500])
+        self.assertEqual(response.data['responses'][1]['body'], {'error': 'Internal server error'})
+        self.assertEqual(Competition.objects.filter(title='Batched').count(), 1)
+
+        with self.assertLogs('exizt.batch', 'ERROR'):
+            response = self.client.post(self.url, {'requests': requests + requests, 'atomic': True}, format='json')
+        self.assertFalse(response.data['committed'])
+        self.assertEqual([sub['status'] for sub in response.data['responses']], [201, 500])
+        self.assertEqual(Competition.objects.filter(title='Batched').count(), 1)
+
+    @override_settings(BATCH_MAX_REQUESTS=2)
+    def test_invalid_batches_run_nothing(self):
+        invalid = [
+            [],
+            self.send_requests('testuser2', 'testuser3', 'testuser3'),
+            self.send_requests('testuser2') + [{'method': 'TRACE', 'path': reverse('profile')}],
+            self.send_requests('testuser2') + [{'path': '/missing/'}],
+            self.send_requests('testuser2') + [{'method': 'POST', 'path': self.url}],
+            self.send_requests('testuser2') + [{'path': reverse('events')}],
+            self.send_requests('testuser2') + [{'path': '/admin/'}],
+        ]
+        for requests in invalid:
+            response = self.client.post(self.url, {'requests': requests}, format='json')
+            self.assertEqual(response.status_code, 400, requests)
+        self.assertEqual(self.client.post(self.url, [], format='json').status_code, 400)
+        self.assertFalse(FriendRequest.objects.exists())
+
+    def test_requires_authentication(self):
+        self.client.credentials()
+        response = self.client.post(self.url, {'requests': self.send_requests('testuser2')}, format='json')
+        self.assertEqual(response.status_code, 401)
+
+@override_settings(THROTTLE_BUCKETS={
+    'screen_time': {'user': ('1/min', 2), 'global': ('100/sec', 100)},
+    'writes': {'global': ('1/min', 1)},
+})
+class ThrottleTest(APITestCase):
+    """Tests for the token-bucket write throttles"""
+
+    def setUp(self):
+        caches['shared'].clear()
+        throttling._fallback.clear()
+        self.user1 = User.objects.create_user(username='testuser1', email='test1@example.com', password='testpassword123')
+        self.user2 = User.objects.create_user(username='testuser2', email='test2@example.com', password='testpassword123')
+        self.url = reverse('update_screen_time')
+
+    def post_screen_time(self, user):
+        self.client.force_authenticate(user)
+        return self.client.post(self.url, {'screen_time_minutes': 90}, format='json')
+
+    def test_user_bucket(self):
+        self.assertEqual([self.post_screen_time(self.user1).status_code for _ in range(2)], [200, 200])
+
+        response = self.post_screen_time(self.user1)
+        self.assertEqual(response.status_code, 429)
+        self.assertGreater(int(response['Retry-After']), 50)
+        # Other users and reads are not affected
+        self.assertEqual(self.post_screen_time(self.user2).status_code, 200)
+        self.assertEqual(self.client.get(reverse('profile')).status_code, 200)
+
+        # Kept in the cache every worker shares
+        self.assertIsNotNone(caches['shared'].get(f'throttle:screen_time:user:{self.user1.pk}'))
+        self.assertIsNone(throttling._fallback.get(f'throttle:screen_time:user:{self.user1.pk}'))
+
+    def test_global_bucket(self):
+        self.client.force_authenticate(self.user1)
+        self.assertEqual(self.client.post(reverse('send_friend_request'), {'username': 'nobody'}, format='json').status_code, 404)
+
+        self.client.force_authenticate(self.user2)
+        self.assertEqual(self.client.post(reverse('send_friend_request'), {'username': 'nobody'}, format='json').status_code, 429)
+
+    def test_falls_back_to_process_memory(self):
+        with mock.patch.object(throttling, 'caches', {}), self.assertLogs('exizt.throttling', 'WARNING'):
+            statuses = [self.post_screen_time(self.user1).status_code for _ in range(3)]
+        self.assertEqual(statuses, [200, 200, 429])
+
+
+@override_settings(LOAD_SHEDDING_MAX_IN_FLIGHT=2, LOAD_SHEDDING_MAX_LATENCY_MS=1000)
+class LoadSheddingMiddlewareTest(SimpleTestCase):
+    """Tests for shedding writes on an overloaded worker"""
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.monitor = LoadMonitor()
+        self.middleware = LoadSheddingMiddleware(lambda request: HttpResponse(), self.monitor)
+
+    def test_sheds_writes_at_queue_depth(self):
+        self.monitor.in_flight = 2
+
+        response = self.middleware(self.factory.post('/send-request/'))
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '2')
+        self.assertEqual(self.middleware(self.factory.get('/friendships/')).status_code, 200)
+        self.assertEqual(self.middleware(self.factory.post('/internal/ready/')).status_code, 200)
+
+        self.monitor.in_flight = 1
+        self.assertEqual(self.middleware(self.factory.post('/send-request/')).status_code, 200)
+        self.assertEqual(self.monitor.in_flight, 1)
+
+    def test_sheds_writes_while_latency_is_high(self):
+        self.monitor.latency = 1.5
+        self.assertEqual(self.middleware(self.factory.post('/send-request/')).status_code, 503)
+
+        # The average decays while nothing finishes
+        self.monitor.updated -= 10
+        self.assertEqual(self.middleware(self.factory.post('/send-request/')).status_code, 200)
+        self.assertLess(self.monitor.current_latency(), 0.1)
+
+
+async def asgi_call(app, method, path, body=b'', headers=()):
+    """Send one HTTP request to an ASGI app; returns the status and headers"""
+    sent = []
+    messages = [{'type': 'http.request', 'body': body, 'more_body': False}]
+
+    async def receive():
+        if messages:
+            return messages.pop()
+        # The client stays connected
+        await asyncio.Event().wait()
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': method, 'path': path,
+        'raw_path': path.encode(), 'root_path': '', 'scheme': 'http', 'query_string': b'',
+        'headers': list(headers), 'client': ('127.0.0.1', 1234), 'server': ('testserver', 80),
+    }
+    await app(scope, receive, send)
+    return sent[0]['status'], dict(sent[0]['headers'])
+
+
+@override_settings(LOAD_SHEDDING_MAX_IN_FLIGHT=2, LOAD_SHEDDING_MAX_LATENCY_MS=1000)
+class LoadSheddingASGIMiddlewareTest(SimpleTestCase):
+    """Under ASGI, requests are counted on the event loop, while they queue for the view thread"""
+
+    def call(self, app, method, path):
+        return asgi_call(app, method, path)
+
+    async def test_queued_requests_are_counted_and_shed(self):
+        monitor = LoadMonitor()
+        release = asyncio.Event()
+
+        async def slow_app(scope, receive, send):
+            await release.wait()
+            await send({'type': 'http.response.start', 'status': 200, 'headers': []})
+            await send({'type': 'http.response.body', 'body': b''})
+
+        app = LoadSheddingASGIMiddleware(slow_app, monitor)
+        waiting = [asyncio.ensure_future(self.call(app, 'POST', '/send-request/')) for _ in range(2)]
+        await asyncio.sleep(0)
+        self.assertEqual(monitor.in_flight, 2)
+
+        status_code, headers = await self.call(app, 'POST', '/send-request/')
+        self.assertEqual((status_code, headers[b'retry-after']), (503, b'2'))
+
+        release.set()
+        self.assertEqual([(await request)[0] for request in waiting], [200, 200])
+        self.assertEqual(monitor.in_flight, 0)
+
+    async def test_django_stack_runs_behind_it(self):
+        monitor = LoadMonitor()
+        app = LoadSheddingASGIMiddleware(ASGIHandler(), monitor)
+        updated = load_monitor.updated
+
+        # Counted once, by the wrapper, and finished; LoadSheddingMiddleware passes it on
+        status_code, headers = await self.call(app, 'POST', '/send-request/')
+        self.assertEqual(status_code, 401)
+        self.assertEqual(monitor.in_flight, 0)
+        self.assertGreater(monitor.latency, 0)
+        self.assertEqual(load_monitor.updated, updated)
+
+
+class ASGIConnectionTest(SimpleTestCase):
+    """
+    Under ASGI each request's sync code runs on a new thread, whose
+    connections must not outlive the request (CONN_MAX_AGE=0 there)
+    """
+    databases = {'default'}
+
+    def test_request_connections_are_closed(self):
+        created, closed = [], []
+        wrapper_class = type(connections['default'])
+        close = wrapper_class.close
+
+        def record_close(wrapper):
+            closed.append(wrapper)
+            return close(wrapper)
+
+        def record_created(sender, connection, **kwargs):
+            created.append(connection)
+
+        connection_created.connect(record_created)
+        self.addCleanup(connection_created.disconnect, record_created)
+        body = json.dumps({'username': 'nobody', 'password': 'wrong'}).encode()
+        with mock.patch.dict(connection.settings_dict, {'CONN_MAX_AGE': 0}), \
+                mock.patch.object(wrapper_class, 'close', record_close):
+            # Served from an event loop of its own, as by uvicorn; an async
+            # test would run the view on this thread instead
+            status_code, headers = asyncio.run(asgi_call(
+                ASGIHandler(), 'POST', '/login/', body,
+                [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode())],
+            ))
+
+        self.assertEqual(status_code, 401)
+        # The request's thread opened its own connection and closed it
+        self.assertTrue(created)
+        self.assertNotIn(connections['default'], created)
+        self.assertTrue(all(any(wrapper is c for c in closed) for wrapper in created))
+
+
+class PeriodicJobsTest(TestCase):
+    """Tests for the maintenance job runner"""
+
+    def test_runs_every_job(self):
+        out = StringIO()
+        call_command('run_periodic_jobs', '--once', stdout=out)
+        for line in ["Expired 0 invitations", "Closed 0 competitions", "Deleted 0 idempotency keys", "Nothing to compact"]:
+            self.assertIn(line, out.getvalue())
+
+    @override_settings(PERIODIC_JOBS={'no_such_command': 60, 'expire_invitations': 60})
+    def test_failing_job_does_not_stop_the_others(self):
+        out = StringIO()
+        with self.assertLogs('exizt.management.commands.run_periodic_jobs', 'ERROR'):
+            call_command('run_periodic_jobs', '--once', stdout=out)
+        self.assertIn("Expired 0 invitations", out.getvalue())
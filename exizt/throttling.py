@@ -0,0 +1,115 @@
+"""
+Token-bucket throttles for the write endpoints.
+
+Each throttle scope has a bucket per user and one bucket shared by all
+users (THROTTLE_BUCKETS). A bucket holds up to `burst` tokens and refills at
+`rate`; every write takes one token and is refused with 429 and Retry-After
+while the bucket is empty. Safe methods are never throttled, and nothing is
+while THROTTLE_ENABLED is off (benchmarks).
+
+Buckets are kept in the THROTTLE_CACHE_ALIAS cache ('shared', a database
+table by default) so all workers and machines share them. If that cache fails, each process keeps its buckets in memory until it
+works again. Updates are read-modify-write, so concurrent writes can
+overshoot a limit slightly; the limits are for protection, not accounting.
+"""
+import logging
+import time
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from rest_framework.throttling import BaseThrottle
+from monitoring.metrics import REQUESTS_THROTTLED
+
+logger = logging.getLogger(__name__)
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+_fallback = LocMemCache('exizt-throttle-fallback', {'OPTIONS': {'MAX_ENTRIES': 10000}})
+
+
+def parse_rate(rate):
+    """'10/min' -> tokens per second"""
+    count, period = rate.split('/')
+    return int(count) / PERIODS[period[0]]
+
+
+def take(key, rate, burst):
+    """
+    Take a token from the bucket stored at key. Returns 0 if one was taken,
+    else the seconds until the next token.
+    """
+    try:
+        return _take(caches[settings.THROTTLE_CACHE_ALIAS], key, rate, burst)
+    except Exception:
+        logger.warning("Throttle cache unavailable, using process memory", exc_info=True)
+        return _take(_fallback, key, rate, burst)
+
+
+def _take(store, key, rate, burst):
+    now = time.time()
+    state = store.get(key)
+    tokens, updated = state if state is not None else (burst, now)
+    tokens = min(burst, tokens + (now - updated) * rate)
+    wait = 0 if tokens >= 1 else (1 - tokens) / rate
+    if not wait:
+        tokens -= 1
+    # Expires once the bucket would be full again, like a missing one
+    store.set(key, (tokens, now), timeout=int((burst - tokens) / rate) + 1)
+    return wait
+
+
+def throttle_scope(request):
+    """The THROTTLE_BUCKETS scope of a request, by URL name (THROTTLE_SCOPES)"""
+    match = getattr(request, 'resolver_match', None)
+    name = match.url_name if match is not None else None
+    return settings.THROTTLE_SCOPES.get(name, 'writes')
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """
+    Throttle writes with one of the buckets of their scope. `bucket` names
+    it in THROTTLE_BUCKETS and `key_format` is its cache key, formatted with
+    the scope and the client's identity.
+    """
+    bucket = 'global'
+    key_format = 'throttle:{scope}:global'
+
+    def get_key(self, request, scope):
+        return self.key_format.format(scope=scope, client=self.get_client(request))
+
+    def get_client(self, request):
+        """The user id, or the IP address for anonymous requests"""
+        if request.user and request.user.is_authenticated:
+            return f'user:{request.user.pk}'
+        return f'anon:{self.get_ident(request)}'
+
+    def allow_request(self, request, view):
+        self.retry_after = None
+        if not settings.THROTTLE_ENABLED or request.method in SAFE_METHODS:
+            return True
+        scope = throttle_scope(request)
+        limits = settings.THROTTLE_BUCKETS.get(scope, {}).get(self.bucket)
+        if limits is None:
+            return True
+        rate, burst = limits
+        self.retry_after = take(self.get_key(request, scope), parse_rate(rate), burst)
+        if self.retry_after:
+            REQUESTS_THROTTLED.labels(scope, self.bucket).inc()
+            return False
+        return True
+
+    def wait(self):
+        return self.retry_after
+
+
+class UserWriteThrottle(TokenBucketThrottle):
+    """Each user's bucket (by IP address for anonymous requests)"""
+    bucket = 'user'
+    key_format = 'throttle:{scope}:{client}'
+
+
+class GlobalWriteThrottle(TokenBucketThrottle):
+    """The bucket all users share, which bounds the total write load"""
+    bucket = 'global'
+    key_format = 'throttle:{scope}:global'
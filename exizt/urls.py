@@ -3,13 +3,17 @@ from django.urls import path
 from users import views as user_views
 from friendships import views as friendship_views
 from competitions import views as competition_views
-
-import os
-
-print(f"ALLOWED_HOSTS from env: {os.environ.get('ALLOWED_HOSTS')}")
+from exizt import views as exizt_views
+from monitoring import views as monitoring_views
+from realtime import views as realtime_views
+from sync import views as sync_views
+from home import views as home_views
+from screentime import views as screentime_views
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('internal/ready/', exizt_views.readiness, name='readiness'),
+    path('internal/metrics/', monitoring_views.metrics, name='metrics'),
     # User URLs
     path('signup/', user_views.signup, name='signup'),
     path('login/', user_views.login, name='login'),
@@ -33,6 +37,18 @@ urlpatterns = [
     path('competitions/<int:competition_id>/leave/', competition_views.leave_competition, name='leave_competition'),
     path('competitions/invitations/', competition_views.get_invitations, name='get_competition_invitations'),
     path('competitions/invitations/send/', competition_views.send_invitation, name='send_competition_invitation'),
+    path('competitions/invitations/send-bulk/', competition_views.send_bulk_invitations, name='send_bulk_competition_invitations'),
     path('competitions/invitations/handle/', competition_views.handle_invitation, name='handle_competition_invitation'),
     path('competitions/screen-time/update/', competition_views.update_screen_time, name='update_screen_time'),
+    # Screen-time history
+    path('screen-time/history/', screentime_views.screen_time_history, name='screen_time_history'),
+    path('screen-time/leaderboard/', screentime_views.friends_leaderboard, name='friends_leaderboard'),
+    # Several API requests in one round-trip
+    path('batch/', exizt_views.batch, name='batch'),
+    # Home screen
+    path('home/', home_views.home, name='home'),
+    # Delta sync
+    path('sync/', sync_views.sync, name='sync'),
+    # Event stream (ASGI only)
+    path('events/', realtime_views.events, name='events'),
 ]
\ No newline at end of file
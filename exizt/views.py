@@ -0,0 +1,45 @@
+from django.conf import settings
+from django.http import JsonResponse
+from django.views.decorators.http import require_GET
+from rest_framework import status
+from rest_framework.decorators import api_view, authentication_classes, permission_classes
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from . import batch as batching
+from .warmup import skipped_steps, warm_up
+
+@require_GET
+def readiness(request):
+    """
+    Internal readiness probe: 200 only once this worker is warm. Servers
+    without a warm-up hook (runserver), or whose warm-up failed, warm up
+    from here, no more often than the warm-up's retry delay allows.
+    """
+    if warm_up():
+        return JsonResponse({'ready': True, 'skipped': skipped_steps()})
+    return JsonResponse({'ready': False}, status=503)
+
+@api_view(['POST'])
+@authentication_classes([TokenAuthentication])
+@permission_classes([IsAuthenticated])
+def batch(request):
+    """
+    Run "requests", a list of {"method", "path", "body", "idempotency_key"}
+    against the API in order, and return their {"status", "body"} in
+    "responses". With "atomic": true they share one transaction, which is
+    rolled back (and the batch stops) at the first error; "committed" tells
+    which happened.
+    """
+    if not isinstance(request.data, dict):
+        return Response({'error': 'Expected an object with "requests"'}, status=status.HTTP_400_BAD_REQUEST)
+    parsed, error = batching.parse(request.data.get('requests'), settings.BATCH_MAX_REQUESTS)
+    if error:
+        return Response({'error': error}, status=status.HTTP_400_BAD_REQUEST)
+
+    atomic = bool(request.data.get('atomic', False))
+    responses, committed = batching.run(request, parsed, atomic)
+    data = {'responses': responses}
+    if atomic:
+        data['committed'] = committed
+    return Response(data, status=status.HTTP_200_OK)
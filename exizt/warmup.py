@@ -0,0 +1,145 @@
+"""
+Worker warm-up: pay the first-request costs (DB connections where they
+persist, URL resolver, serializer fields, hot rows) before the worker takes
+traffic.
+
+Run from gunicorn's ``post_worker_init`` hook or the ASGI lifespan startup.
+"""
+import inspect
+import logging
+import sys
+import threading
+import time
+from django.apps import apps
+from django.conf import settings
+from django.db import connections
+from django.urls import get_resolver
+from django.utils.module_loading import autodiscover_modules
+from rest_framework import serializers
+
+logger = logging.getLogger(__name__)
+
+_ready = threading.Event()
+_lock = threading.Lock()
+
+
+def is_ready():
+    return _ready.is_set()
+
+
+def open_connections():
+    """
+    Connect to every configured database. Persistent connections
+    (CONN_MAX_AGE) stay open for this thread's first requests; otherwise
+    (the ASGI workers) this only checks the databases are reachable.
+    """
+    for connection in connections.all():
+        connection.ensure_connection()
+        if not connection.settings_dict['CONN_MAX_AGE']:
+            connection.close()
+
+
+def compile_urls():
+    """Populate the resolver and compile every URL pattern's regex"""
+    resolver = get_resolver()
+    resolver.reverse_dict  # populates the resolver and its lookups
+
+    def compile_patterns(patterns):
+        for pattern in patterns:
+            pattern.pattern.regex
+            if hasattr(pattern, 'url_patterns'):
+                compile_patterns(pattern.url_patterns)
+
+    compile_patterns(resolver.url_patterns)
+
+
+def build_serializers():
+    """Build every app serializer's fields once to warm model metadata and imports"""
+    autodiscover_modules('serializers')
+    for config in apps.get_app_configs():
+        module = sys.modules.get(f'{config.name}.serializers')
+        if module is None or not config.path.startswith(str(settings.BASE_DIR)):
+            continue
+        for _, cls in inspect.getmembers(module, inspect.isclass):
+            if issubclass(cls, serializers.Serializer) and cls.__module__ == module.__name__:
+                cls().fields
+
+
+def prime_active_competitions():
+    """Load the leaderboards of currently active competitions"""
+    from competitions.services import CompetitionService
+    for competition in CompetitionService.get_active_competitions():
+        ranked, unranked = CompetitionService.get_competition_leaderboard(competition)
+        list(ranked), list(unranked)
+
+
+# A worker is not ready until these pass
+WARMUP_STEPS = (
+    open_connections,
+    compile_urls,
+)
+# Only speed up the first requests: a failure is logged and the worker
+# is ready without them
+OPTIONAL_WARMUP_STEPS = (
+    build_serializers,
+    prime_active_competitions,
+)
+
+# Failed attempts so far and the monotonic time before which no retry runs
+_retry = {'failures': 0, 'at': 0.0}
+_skipped = []
+
+
+def skipped_steps():
+    """Names of the optional steps that failed in the warm-up that made the worker ready"""
+    return list(_skipped)
+
+
+def warm_up():
+    """
+    Run the warm-up steps once for this process.
+
+    Returns True when the worker is warm. A failing WARMUP_STEPS step is
+    logged and leaves the worker not ready; later calls (e.g. from the
+    readiness endpoint) retry after WARMUP_RETRY_SECONDS, doubled after
+    every failure up to WARMUP_RETRY_MAX_SECONDS, and return False until
+    then. Failing optional steps are logged and skipped.
+    """
+    with _lock:
+        if _ready.is_set():
+            return True
+        if time.monotonic() < _retry['at']:
+            return False
+        started = time.perf_counter()
+        failed = [step.__name__ for step in WARMUP_STEPS if not _run(step)]
+        if failed:
+            _retry['failures'] += 1
+            delay = min(
+                settings.WARMUP_RETRY_SECONDS * 2 ** (_retry['failures'] - 1), settings.WARMUP_RETRY_MAX_SECONDS
+            )
+            _retry['at'] = time.monotonic() + delay
+            logger.warning("Worker not ready (%s failed), retrying in %.0f s", ', '.join(failed), delay)
+            return False
+        _skipped[:] = [step.__name__ for step in OPTIONAL_WARMUP_STEPS if not _run(step)]
+        _ready.set()
+        logger.info(
+            "Worker warm in %.0f ms%s", (time.perf_counter() - started) * 1000,
+            f" (skipped {', '.join(_skipped)})" if _skipped else '',
+        )
+        return True
+
+
+def _run(step):
+    try:
+        step()
+    except Exception:
+        logger.exception("Warm-up step %s failed", step.__name__)
+        return False
+    return True
+
+
+def _reset():
+    """Forget the warm-up of this process (tests)"""
+    _ready.clear()
+    _retry.update(failures=0, at=0.0)
+    _skipped.clear()
@@ -16,6 +16,14 @@ class FriendRequestReceiverSerializer(serializers.ModelSerializer):
         model = FriendRequest
         fields = ['id', 'receiver', 'status', 'created_at']
 
+class FriendRequestSerializer(serializers.ModelSerializer):
+    sender = UserSerializer(read_only=True)
+    receiver = UserSerializer(read_only=True)
+
+    class Meta:
+        model = FriendRequest
+        fields = ['id', 'sender', 'receiver', 'status', 'created_at']
+
 class FriendRequestsSerializer(serializers.Serializer):
     sent_requests = FriendRequestReceiverSerializer(many=True)
     received_requests = FriendRequestSenderSerializer(many=True)
\ No newline at end of file
@@ -1,9 +1,14 @@
+from django.db import transaction
 from django.db.models import Q
 from django.contrib.auth import get_user_model
 from .models import FriendRequest, FriendList
+from monitoring.metrics import instrument_service
+from realtime import events
+from sync import changes
 
 User = get_user_model()
 
+@instrument_service
 class FriendshipService:
 
     @staticmethod
@@ -17,7 +22,11 @@ class FriendshipService:
     @staticmethod
     def create_friend_request(sender, receiver):
         """Create a new friend request"""
-        return FriendRequest.objects.create(sender=sender, receiver=receiver)
+        with transaction.atomic():
+            friend_request = FriendRequest.objects.create(sender=sender, receiver=receiver)
+            changes.record('friend_requests', [(sender.id, friend_request.id), (receiver.id, friend_request.id)])
+        events.publish([receiver.id], 'friend_request.received', request_id=friend_request.id)
+        return friend_request
     
     @staticmethod
     def get_or_create_friendslist(user):
@@ -31,11 +40,25 @@ class FriendshipService:
         friend_list, created = FriendList.objects.get_or_create(user=user)
         return friend_list
 
+    @staticmethod
+    def get_friend_ids(user):
+        """Get the ids of a user's friends as a set, in one query"""
+        return set(FriendList.friends.through.objects.filter(
+            friendlist__user=user
+        ).values_list('user_id', flat=True))
+
+    @staticmethod
+    def get_friend_profiles(user):
+        """Get the profiles of a user's friends in a single query"""
+        from users.models import Profile
+        friends = FriendshipService.get_or_create_friendslist(user)
+        return Profile.objects.filter(user__in=friends).select_related('user')
+
     @staticmethod
     def get_friend_request(request_id, user):
         """Get a friend request by ID where the user is the receiver"""
         try:
-            return FriendRequest.objects.get(id=request_id, receiver=user)
+            return FriendRequest.objects.select_related('sender', 'receiver').get(id=request_id, receiver=user)
         except FriendRequest.DoesNotExist:
             return None
     
@@ -55,25 +78,26 @@ class FriendshipService:
         - If accepted, add both users to each other's friend lists and delete the request
         - If rejected, just delete the request
         """
+        users = [(friend_request.sender_id, friend_request.id), (friend_request.receiver_id, friend_request.id)]
         if action == 'accept':
-            # Get or create friend lists
-            sender_list = FriendshipService.get_or_create_friend_list(friend_request.sender)
-            receiver_list = FriendshipService.get_or_create_friend_list(friend_request.receiver)
-            
-            # Add users to each other's friend lists
-            sender_list.friends.add(friend_request.receiver)
-            receiver_list.friends.add(friend_request.sender)
-            
-            sender_list = FriendshipService.get_or_create_friend_list(friend_request.sender)
-            receiver_list = FriendshipService.get_or_create_friend_list(friend_request.receiver)
-            print("Sender's Friends:", sender_list.friends.all())
-            print("Receiver's Friends:", receiver_list.friends.all())
-            # Store information for return value
-            sender = friend_request.sender
-            receiver = friend_request.receiver
-            request_id = friend_request.id
-            created_at = friend_request.created_at
-            friend_request.delete()
+            with transaction.atomic():
+                # Get or create friend lists
+                sender_list = FriendshipService.get_or_create_friend_list(friend_request.sender)
+                receiver_list = FriendshipService.get_or_create_friend_list(friend_request.receiver)
+
+                # Add users to each other's friend lists
+                sender_list.friends.add(friend_request.receiver)
+                receiver_list.friends.add(friend_request.sender)
+
+                # Store information for return value
+                sender = friend_request.sender
+                receiver = friend_request.receiver
+                request_id = friend_request.id
+                created_at = friend_request.created_at
+                friend_request.delete()
+                changes.record('friend_requests', users, deleted=True)
+                changes.record('friends', [(sender.id, receiver.id), (receiver.id, sender.id)])
+            events.publish([sender.id], 'friend_request.answered', request_id=request_id, status='accepted')
             return {
                 'sender': sender, 
                 'receiver': receiver, 
@@ -82,18 +106,29 @@ class FriendshipService:
             }
         elif action == 'reject':
             sender = friend_request.sender
-            friend_request.delete()
+            request_id = friend_request.id
+            with transaction.atomic():
+                friend_request.delete()
+                changes.record('friend_requests', users, deleted=True)
+            events.publish([sender.id], 'friend_request.answered', request_id=request_id, status='rejected')
             return {'sender': sender}
         
     @staticmethod
     def get_received_pending_requests(user):
         """Get all received requests for a user"""
-        return FriendRequest.objects.filter(receiver=user, status='pending')
+        return FriendRequest.objects.filter(receiver=user, status='pending').select_related('sender')
     
+    @staticmethod
+    def get_pending_requests(user):
+        """Get the pending requests a user sent or received"""
+        return FriendRequest.objects.filter(
+            Q(sender=user) | Q(receiver=user), status='pending'
+        ).select_related('sender', 'receiver')
+
     @staticmethod
     def get_sent_pending_requests(user):
         """Get all sent requests for a user"""
-        return FriendRequest.objects.filter(sender=user, status='pending')
+        return FriendRequest.objects.filter(sender=user, status='pending').select_related('receiver')
         
     @staticmethod
     def delete_friendship(user, friend_id):
@@ -101,23 +136,27 @@ class FriendshipService:
         try:
             friend = User.objects.get(id=friend_id)
             
-            removed_from_user = False
-            removed_from_friend = False
-            
-            try:
-                user_friend_list = FriendList.objects.get(user=user)
-                user_friend_list.friends.remove(friend)
-                removed_from_user = True
-            except FriendList.DoesNotExist:
-                pass
-                
-            try:
-                friend_list = FriendList.objects.get(user=friend)
-                friend_list.friends.remove(user)
-                removed_from_friend = True
-            except FriendList.DoesNotExist:
-                pass
-                
+            with transaction.atomic():
+                removed_from_user = False
+                removed_from_friend = False
+
+                try:
+                    user_friend_list = FriendList.objects.get(user=user)
+                    user_friend_list.friends.remove(friend)
+                    removed_from_user = True
+                except FriendList.DoesNotExist:
+                    pass
+
+                try:
+                    friend_list = FriendList.objects.get(user=friend)
+                    friend_list.friends.remove(user)
+                    removed_from_friend = True
+                except FriendList.DoesNotExist:
+                    pass
+
+                if removed_from_user or removed_from_friend:
+                    changes.record('friends', [(user.id, friend.id), (friend.id, user.id)], deleted=True)
+                    events.publish([friend.id], 'friend.removed', user_id=user.id)
             return (removed_from_user or removed_from_friend), friend
         except User.DoesNotExist:
             return False, None
\ No newline at end of file
@@ -6,6 +6,8 @@ from rest_framework import status
 from django.contrib.auth import get_user_model
 from .models import FriendList, FriendRequest
 from .services import FriendshipService
+from monitoring.testing import QueryBudgetMixin, make_users
+from users.models import Profile
 
 User = get_user_model()
 
@@ -355,4 +357,74 @@ class FriendshipAPITest(APITestCase):
         # Test missing friend_id
         data = {}
         response = self.client.post(self.delete_friend_url, data, format='json')
-        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
\ No newline at end of file
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+class FriendshipQueryBudgetTest(QueryBudgetMixin, APITestCase):
+    """Friendship endpoints must run a constant number of queries"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser1',
+            email='test1@example.com',
+            password='testpassword123'
+        )
+        Profile.objects.create(user=self.user, name='Test User')
+        self.friend_list = FriendList.objects.create(user=self.user)
+        token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+
+    def add_friends(self, size):
+        friends = make_users(size, 'friend')
+        self.friend_list.friends.add(*friends)
+        for friend in friends:
+            FriendList.objects.create(user=friend).friends.add(self.user)
+        return friends
+
+    def test_get_friends(self):
+        self.assertConstantQueries(
+            self.add_friends,
+            lambda friends: self.client.get(reverse('friendships')),
+        )
+
+    def test_get_friend_requests(self):
+        def seed(size):
+            FriendRequest.objects.bulk_create(
+                [FriendRequest(sender=other, receiver=self.user) for other in make_users(size, 'sender')]
+                + [FriendRequest(sender=self.user, receiver=other) for other in make_users(size, 'receiver')]
+            )
+
+        self.assertConstantQueries(seed, lambda state: self.client.get(reverse('friend_requests')))
+
+    def test_accept_friend_request(self):
+        def seed(size):
+            sender = make_users(1, 'sender')[0]
+            FriendList.objects.create(user=sender).friends.add(*make_users(size, 'other'))
+            return FriendRequest.objects.create(sender=sender, receiver=self.user)
+
+        self.assertConstantQueries(
+            seed,
+            lambda friend_request: self.client.post(
+                reverse('handle_friend_request'),
+                {'request_id': friend_request.id, 'action': 'accept'}, format='json'
+            ),
+        )
+
+    def test_send_friend_request(self):
+        def seed(size):
+            self.add_friends(size)
+            return make_users(1, 'stranger')[0]
+
+        self.assertConstantQueries(
+            seed,
+            lambda stranger: self.client.post(
+                reverse('send_friend_request'), {'username': stranger.username}, format='json'
+            ),
+        )
+
+    def test_delete_friend(self):
+        self.assertConstantQueries(
+            self.add_friends,
+            lambda friends: self.client.post(
+                reverse('delete_friend'), {'friend_id': friends[0].id}, format='json'
+            ),
+        )
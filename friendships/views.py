@@ -4,6 +4,7 @@ from rest_framework import status
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.authentication import TokenAuthentication
 from .services import FriendshipService
+from idempotency.decorators import idempotent
 from users.services import UserService
 from users.serializers import ProfileSerializer
 from .serializers import FriendRequestsSerializer
@@ -11,6 +12,7 @@ from .serializers import FriendRequestsSerializer
 @api_view(['POST'])
 @authentication_classes([TokenAuthentication])
 @permission_classes([IsAuthenticated])
+@idempotent
 def send_friend_request(request):
     """Send a friend request to another user"""
     # Parse request data
@@ -57,8 +59,6 @@ def handle_friend_request(request):
         return Response({'error': 'Action must be either "accept" or "reject"'}, status=status.HTTP_400_BAD_REQUEST)
     
     friend_request = FriendshipService.get_friend_request(request_id, request.user)
-
-    print(f"Found friend request: {friend_request}")
     if not friend_request:
         return Response({'error': 'Friend request not found'}, status=status.HTTP_404_NOT_FOUND)
     
@@ -99,25 +99,11 @@ def get_friend_requests(request):
 @permission_classes([IsAuthenticated])
 def get_friends(request):
     """Get a list of the current user's friends"""
-    from users.models import Profile  # Add this import
-    
-    friends = FriendshipService.get_or_create_friendslist(request.user)
-    friend_profiles = []
-    
-    for friend in friends:
-        try:
-            # Get the friend's profile
-            profile = Profile.objects.get(user=friend)
-            
-            # Use ProfileSerializer directly
-            serialized_profile = ProfileSerializer(profile).data
-            friend_profiles.append(serialized_profile)
-            
-        except Profile.DoesNotExist:
-            # Skip if profile doesn't exist
-            pass
-    
-    return Response(friend_profiles, status=status.HTTP_200_OK)
+    friend_profiles = FriendshipService.get_friend_profiles(request.user)
+    serializer = ProfileSerializer(
+        friend_profiles, many=True, context={'request': request, 'avatar_context': 'list'}
+    )
+    return Response(serializer.data, status=status.HTTP_200_OK)
 
 @api_view(['POST'])
 @authentication_classes([TokenAuthentication])
@@ -0,0 +1,127 @@
+"""
+Gunicorn configuration (loaded with ``gunicorn -c gunicorn.conf.py``).
+
+Everything is read from the environment. GUNICORN_PRESET picks a worker
+model and the other GUNICORN_* variables override single settings:
+
+    sync     2 sync workers, one request at a time each (the old default)
+    gthread  2 workers x 4 threads; threads share the worker's memory
+    asgi     2 uvicorn workers serving exizt.asgi (needed for streaming)
+
+Measure the trade-offs with ``python manage.py bench_gunicorn``.
+
+Prometheus metrics are shared between workers through files in
+PROMETHEUS_MULTIPROC_DIR. entrypoint.sh sets it and empties it so other
+processes (the periodic jobs) can write there too; without it a fresh
+temporary directory is used. With METRICS_PORT set, the master serves
+them on that port, apart from the public one.
+"""
+import os
+import shutil
+import signal
+import tempfile
+import threading
+import time
+
+PRESETS = {
+    'sync': {'worker_class': 'sync', 'workers': 2, 'threads': 1},
+    'gthread': {'worker_class': 'gthread', 'workers': 2, 'threads': 4},
+    'asgi': {'worker_class': 'uvicorn_worker.UvicornWorker', 'workers': 2, 'threads': 1},
+}
+
+preset = PRESETS[os.environ.get('GUNICORN_PRESET', 'sync')]
+
+bind = os.environ.get('GUNICORN_BIND', f"0.0.0.0:{os.environ.get('PORT', '8000')}")
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', preset['worker_class'])
+workers = int(os.environ.get('GUNICORN_WORKERS', preset['workers']))
+threads = int(os.environ.get('GUNICORN_THREADS', preset['threads']))
+if 'uvicorn' in worker_class.lower():
+    wsgi_app = 'exizt.asgi:application'
+else:
+    wsgi_app = 'exizt.wsgi:application'
+
+# Import the app once in the master so workers share its pages copy-on-write
+preload_app = os.environ.get('GUNICORN_PRELOAD', 'true').lower() in ('1', 'true', 'yes')
+
+# Recycle workers regularly; the jitter stops them all restarting at once
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 1000))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', 100))
+
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 5))
+
+# Per-worker resident memory ceiling (0 disables); checked every few seconds
+max_worker_rss_mb = int(os.environ.get('GUNICORN_MAX_WORKER_RSS_MB', 300))
+rss_check_interval = float(os.environ.get('GUNICORN_RSS_CHECK_INTERVAL', 5))
+
+# Must be set before prometheus_client is imported, i.e. before the app loads.
+# A directory from the environment is shared with other processes that may
+# already have written to it, so it is kept; whoever sets it empties it.
+if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+    prometheus_dir = os.environ['PROMETHEUS_MULTIPROC_DIR']
+    os.makedirs(prometheus_dir, exist_ok=True)
+    owns_prometheus_dir = False
+else:
+    prometheus_dir = os.environ['PROMETHEUS_MULTIPROC_DIR'] = tempfile.mkdtemp(prefix='exizt-prometheus-')
+    owns_prometheus_dir = True
+
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG') or None
+errorlog = '-'
+loglevel = os.environ.get('GUNICORN_LOG_LEVEL', 'info')
+
+
+metrics_port = int(os.environ.get('METRICS_PORT', 0))
+
+
+def when_ready(server):
+    if metrics_port:
+        from prometheus_client import CollectorRegistry, multiprocess, start_http_server
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        start_http_server(metrics_port, registry=registry)
+        server.log.info("Serving metrics on port %s", metrics_port)
+
+
+def current_rss_mb():
+    """Resident set size of this process in MB"""
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def watch_rss(worker):
+    """Ask the worker to exit gracefully once it grows past the RSS ceiling"""
+    while True:
+        time.sleep(rss_check_interval)
+        rss = current_rss_mb()
+        if rss > max_worker_rss_mb:
+            worker.log.warning(
+                "Worker %s uses %.0f MB (limit %s MB), recycling", worker.pid, rss, max_worker_rss_mb
+            )
+            # SIGTERM finishes in-flight requests; the master then forks a replacement
+            os.kill(worker.pid, signal.SIGTERM)
+            return
+
+
+def post_worker_init(worker):
+    if max_worker_rss_mb:
+        threading.Thread(target=watch_rss, args=(worker,), name='rss-watchdog', daemon=True).start()
+
+    # Warm the worker before it accepts its first request
+    from exizt.warmup import warm_up
+    warm_up()
+
+
+def child_exit(server, worker):
+    # Drop the dead worker's live gauges; its counters stay in the totals
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
+
+
+def on_exit(server):
+    if owns_prometheus_dir:
+        shutil.rmtree(prometheus_dir, ignore_errors=True)
@@ -0,0 +1,11 @@
+from rest_framework import serializers
+from competitions.serializers import CompetitionListSerializer
+
+
+class HomeCompetitionSerializer(CompetitionListSerializer):
+    """A competition on the home screen, with the user's standing in it"""
+    position = serializers.IntegerField(read_only=True, allow_null=True)
+    average_daily_usage = serializers.FloatField(read_only=True, allow_null=True)
+
+    class Meta(CompetitionListSerializer.Meta):
+        fields = CompetitionListSerializer.Meta.fields + ['position', 'average_daily_usage']
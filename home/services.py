@@ -0,0 +1,83 @@
+import hashlib
+from django.db.models import Count, Max
+from django.utils import timezone
+from competitions.models import Competition, CompetitionInvitation, Participant
+from competitions.services import CompetitionService
+from friendships.services import FriendshipService
+from monitoring.metrics import instrument_service
+from sync.models import Change
+from users.models import Profile
+from users.services import UserService
+
+# Bump when the home payload changes shape, so cached copies and client
+# ETags from older releases stop matching
+HOME_VERSION = 1
+
+@instrument_service
+class HomeService:
+
+    @staticmethod
+    def get_state(user):
+        """
+        The user's profile, their standings in active and upcoming
+        competitions ({competition_id: (position, average_daily_usage)}) and
+        a version string for the home screen, read in four queries.
+
+        Everything else on the home screen is a list the sync change log
+        covers, so the user's latest change entry stands in for it. The
+        version changes whenever any of it does, in any process. What the
+        clock alone changes (competitions starting or ending, invitations
+        to ended competitions disappearing) is read into it as well, and so
+        are the participants of the listed competitions, which other users
+        change by joining or leaving.
+        """
+        now = timezone.now()
+        profile = Profile.objects.select_related('user').filter(user=user).first()
+        if profile is None:
+            profile = UserService.create_profile(user)
+        latest = Change.objects.filter(user=user).aggregate(latest=Max('id'))['latest']
+        rows = list(Participant.objects.filter(
+            user=user,
+            competition__end_date__gt=now,
+            competition__status__in=['active', 'upcoming'],
+        ).order_by('competition_id').values_list(
+            'competition_id', 'position', 'average_daily_usage', 'competition__start_date'
+        ).annotate(
+            # Other users joining or leaving change the listed participant_count
+            members=Count('competition__participant'), last_joined=Max('competition__participant__id'),
+        ))
+        standings = {row[0]: (row[1], row[2]) for row in rows}
+        # The invitations get_user_competition_invitations shows right now
+        invitations = list(CompetitionInvitation.objects.filter(
+            receiver=user, status='pending', competition__end_date__gte=now
+        ).order_by('id').values_list('id', flat=True))
+
+        version = repr((
+            HOME_VERSION, latest, profile.user.username, profile.name, profile.avatar.name, profile.avatar_urls,
+            # Competitions turn from upcoming to active by the clock alone
+            [(competition_id, position, usage, start <= now, members, last_joined)
+             for competition_id, position, usage, start, members, last_joined in rows],
+            invitations,
+        ))
+        return profile, standings, hashlib.sha1(version.encode()).hexdigest()
+
+    @staticmethod
+    def get_home(user, standings):
+        """
+        Friends, pending friend requests, competition invitations and the
+        competitions in standings, each list in a fixed number of queries.
+        Competitions carry the user's position and average_daily_usage.
+        """
+        requests = list(FriendshipService.get_pending_requests(user).order_by('-created_at'))
+        competitions = list(CompetitionService.with_list_data(
+            Competition.objects.filter(id__in=standings)
+        ).order_by('start_date'))
+        for competition in competitions:
+            competition.position, competition.average_daily_usage = standings[competition.id]
+        return {
+            'friends': FriendshipService.get_friend_profiles(user),
+            'sent_requests': [request for request in requests if request.sender_id == user.id],
+            'received_requests': [request for request in requests if request.receiver_id == user.id],
+            'competition_invitations': CompetitionService.get_user_competition_invitations(user),
+            'competitions': competitions,
+        }
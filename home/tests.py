@@ -0,0 +1,184 @@
+from datetime import timedelta
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APITestCase
+from competitions.models import Competition, Participant, CompetitionInvitation
+from competitions.services import CompetitionService
+from friendships.models import FriendList, FriendRequest
+from monitoring.testing import QueryBudgetMixin, make_users
+from users.models import User, Profile
+
+
+class HomeTestMixin:
+
+    def create_user(self, username):
+        user = User.objects.create_user(username=username, email=f'{username}@example.com', password='testpassword123')
+        Profile.objects.create(user=user, name=username.title())
+        return user
+
+    def authenticate(self, user):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {Token.objects.get_or_create(user=user)[0].key}')
+
+
+class HomeAPITest(HomeTestMixin, APITestCase):
+
+    def setUp(self):
+        self.user1 = self.create_user('testuser1')
+        self.user2 = self.create_user('testuser2')
+        self.user3 = self.create_user('testuser3')
+        self.url = reverse('home')
+        self.authenticate(self.user1)
+        self.now = timezone.now()
+
+    def test_home_returns_everything(self):
+        FriendList.objects.create(user=self.user1).friends.add(self.user2)
+        FriendRequest.objects.create(sender=self.user3, receiver=self.user1)
+        active = CompetitionService.create_competition(
+            'Active', '', self.now - timedelta(days=1), self.now + timedelta(days=6), self.user1
+        )
+        CompetitionService.create_competition(
+            'Finished', '', self.now - timedelta(days=8), self.now - timedelta(days=1), self.user1
+        )
+        theirs = CompetitionService.create_competition(
+            'Theirs', '', self.now + timedelta(days=1), self.now + timedelta(days=8), self.user2
+        )
+        CompetitionInvitation.objects.create(competition=theirs, sender=self.user2, receiver=self.user1)
+        CompetitionService.update_user_screen_time(self.user1, self.now.date(), 90)
+
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.data
+        self.assertEqual(data['profile']['name'], 'Testuser1')
+        self.assertEqual([friend['name'] for friend in data['friends']], ['Testuser2'])
+        self.assertEqual(data['friend_requests']['sent_requests'], [])
+        self.assertEqual([r['sender']['username'] for r in data['friend_requests']['received_requests']], ['testuser3'])
+        self.assertEqual([i['competition']['id'] for i in data['competition_invitations']], [theirs.id])
+        [competition] = data['active_competitions']
+        self.assertEqual(competition['id'], active.id)
+        self.assertEqual((competition['position'], competition['average_daily_usage']), (1, 90))
+        self.assertTrue(competition['is_creator'])
+
+    def test_etag(self):
+        response = self.client.get(self.url)
+        etag = response['ETag']
+
+        response = self.client.get(self.url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response['ETag'], etag)
+
+        # Each kind of change makes a new version
+        seen = {etag}
+        changes = [
+            lambda: self.client.post(reverse('send_friend_request'), {'username': 'testuser2'}, format='json'),
+            lambda: self.client.put(reverse('update_profile'), {'name': 'Renamed'}, format='multipart'),
+            lambda: CompetitionService.create_competition(
+                'Mine', '', self.now - timedelta(days=1), self.now + timedelta(days=6), self.user1
+            ),
+            lambda: CompetitionService.update_user_screen_time(self.user1, self.now.date(), 60),
+        ]
+        for change in changes:
+            change()
+            response = self.client.get(self.url, headers={'If-None-Match': etag})
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            etag = response['ETag']
+            self.assertNotIn(etag, seen)
+            seen.add(etag)
+        self.assertEqual(response.data['profile']['name'], 'Renamed')
+        self.assertEqual(response.data['active_competitions'][0]['average_daily_usage'], 60)
+
+        # Another avatar size is another representation
+        self.assertNotEqual(self.client.get(self.url, {'avatar_size': '128'})['ETag'], etag)
+
+    def test_ended_competition_invitation_changes_the_version(self):
+        theirs = CompetitionService.create_competition(
+            'Theirs', '', self.now - timedelta(days=1), self.now + timedelta(days=6), self.user2
+        )
+        CompetitionInvitation.objects.create(competition=theirs, sender=self.user2, receiver=self.user1)
+        response = self.client.get(self.url)
+        self.assertEqual(len(response.data['competition_invitations']), 1)
+
+        # Ends with no change entry written (expire_invitations has not run)
+        Competition.objects.filter(id=theirs.id).update(end_date=self.now - timedelta(minutes=1))
+        response = self.client.get(self.url, headers={'If-None-Match': response['ETag']})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['competition_invitations'], [])
+
+    def test_other_user_joining_changes_the_version(self):
+        CompetitionService.create_competition(
+            'Mine', '', self.now - timedelta(days=1), self.now + timedelta(days=6), self.user1
+        )
+        response = self.client.get(self.url)
+        self.assertEqual(response.data['active_competitions'][0]['participant_count'], 1)
+        competition = Competition.objects.get(title='Mine')
+
+        # Joins with no change entry written for user1 (e.g. through the admin)
+        Participant.objects.create(user=self.user2, competition=competition)
+        response = self.client.get(self.url, headers={'If-None-Match': response['ETag']})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['active_competitions'][0]['participant_count'], 2)
+
+        # A leave and a join keep the count but not the version
+        Participant.objects.filter(user=self.user2, competition=competition).delete()
+        Participant.objects.create(user=self.user3, competition=competition)
+        response = self.client.get(self.url, headers={'If-None-Match': response['ETag']})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_creates_missing_profile(self):
+        user = User.objects.create_user(username='noprofile', email='noprofile@example.com', password='testpassword123')
+        self.authenticate(user)
+
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['profile']['name'], 'noprofile')
+
+    def test_requires_authentication(self):
+        self.client.credentials()
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class HomeQueryBudgetTest(QueryBudgetMixin, HomeTestMixin, APITestCase):
+    """The home endpoint must run a constant number of queries"""
+
+    def setUp(self):
+        self.user = self.create_user('testuser1')
+        self.url = reverse('home')
+        self.authenticate(self.user)
+        self.now = timezone.now()
+
+    def seed(self, size):
+        """size friends, each with a friend request, a competition with the user and an invitation"""
+        friends = make_users(size, 'friend')
+        FriendList.objects.create(user=self.user).friends.add(*friends)
+        FriendRequest.objects.bulk_create([FriendRequest(sender=friend, receiver=self.user) for friend in friends])
+        competitions = Competition.objects.bulk_create([
+            Competition(title=f'Competition {i}', creator=friend, status='active',
+                        start_date=self.now - timedelta(days=1), end_date=self.now + timedelta(days=6))
+            for i, friend in enumerate(friends)
+        ])
+        Participant.objects.bulk_create(
+            [Participant(user=friend, competition=competition) for friend, competition in zip(friends, competitions)]
+            + [Participant(user=self.user, competition=competition, position=2) for competition in competitions]
+        )
+        invitations = Competition.objects.bulk_create([
+            Competition(title=f'Invitation {i}', creator=friend,
+                        start_date=self.now + timedelta(days=1), end_date=self.now + timedelta(days=8))
+            for i, friend in enumerate(friends)
+        ])
+        CompetitionInvitation.objects.bulk_create([
+            CompetitionInvitation(competition=competition, sender=competition.creator, receiver=self.user)
+            for competition in invitations
+        ])
+
+    def test_home(self):
+        self.assertConstantQueries(self.seed, lambda state: self.client.get(self.url), max_queries=11)
+
+    def test_not_modified(self):
+        def revalidate(state):
+            etag = self.client.get(self.url)['ETag']
+            return self.client.get(self.url, headers={'If-None-Match': etag})
+
+        self.assertConstantQueries(self.seed, revalidate)
@@ -0,0 +1,54 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.http import parse_etags, quote_etag
+from rest_framework import status
+from rest_framework.decorators import api_view, authentication_classes, permission_classes
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from competitions.serializers import CompetitionInvitationSerializer
+from friendships.serializers import FriendRequestsSerializer
+from monitoring.metrics import record_cache
+from users.serializers import ProfileSerializer
+from .serializers import HomeCompetitionSerializer
+from .services import HomeService
+
+@api_view(['GET'])
+@authentication_classes([TokenAuthentication])
+@permission_classes([IsAuthenticated])
+def home(request):
+    """
+    Everything the home screen shows in one response: the profile, friends,
+    friend requests, competition invitations and the active and upcoming
+    competitions with the user's position in each. Send the ETag back in
+    If-None-Match to get a 304 while nothing changed.
+    """
+    profile, standings, version = HomeService.get_state(request.user)
+    avatar_size = request.query_params.get('avatar_size', '')
+    etag = quote_etag(f"{version}-{avatar_size if avatar_size.isdigit() else ''}")
+    headers = {'ETag': etag, 'Cache-Control': 'private, no-cache'}
+    if etag in parse_etags(request.headers.get('If-None-Match', '')):
+        return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    # Keyed by version, so a copy cached by this process is never stale
+    key = f'home:{request.user.id}:{etag}'
+    data = cache.get(key)
+    if not record_cache('home', data is not None):
+        result = HomeService.get_home(request.user, standings)
+        context = {'request': request, 'avatar_context': 'list'}
+        data = {
+            'profile': ProfileSerializer(profile, context={'request': request}).data,
+            'friends': ProfileSerializer(result['friends'], many=True, context=context).data,
+            'friend_requests': FriendRequestsSerializer({
+                'sent_requests': result['sent_requests'],
+                'received_requests': result['received_requests'],
+            }).data,
+            'competition_invitations': CompetitionInvitationSerializer(
+                result['competition_invitations'], many=True, context=context
+            ).data,
+            'active_competitions': HomeCompetitionSerializer(
+                result['competitions'], many=True, context=context
+            ).data,
+        }
+        cache.set(key, data, settings.HOME_CACHE_SECONDS)
+    return Response(data, status=status.HTTP_200_OK, headers=headers)
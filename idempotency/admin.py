@@ -0,0 +1,7 @@
+from django.contrib import admin
+from .models import IdempotencyKey
+
+@admin.register(IdempotencyKey)
+class IdempotencyKeyAdmin(admin.ModelAdmin):
+    list_display = ['key', 'user', 'status_code', 'created_at']
+    raw_id_fields = ['user']
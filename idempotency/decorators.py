@@ -0,0 +1,63 @@
+import functools
+import hashlib
+import json
+from django.db import transaction
+from rest_framework import status
+from rest_framework.response import Response
+from monitoring.metrics import IDEMPOTENT_REPLAYS
+from .services import IdempotencyService
+
+
+def fingerprint(request):
+    """SHA-256 of the request's method, path and body"""
+    body = json.dumps(request.data, sort_keys=True, default=str)
+    return hashlib.sha256(f'{request.method} {request.path}\n{body}'.encode()).hexdigest()
+
+
+def idempotent(view):
+    """
+    Let clients retry a write safely by sending an Idempotency-Key header.
+
+    The first request with a key runs the view and stores its response in the
+    same transaction as the view's writes. Retries with the same key and body
+    get that response back, marked Idempotent-Replayed, without calling the
+    view. Server errors are not stored, so they can be retried.
+    Place it below the DRF decorators so request.user is authenticated.
+    """
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        key = request.headers.get('Idempotency-Key')
+        if key is None:
+            return view(request, *args, **kwargs)
+        if not key or len(key) > 255:
+            return Response(
+                {'error': 'Idempotency-Key must be 1 to 255 characters'}, status=status.HTTP_400_BAD_REQUEST
+            )
+
+        record, state = IdempotencyService.claim(request.user, key, fingerprint(request))
+        if state == 'mismatch':
+            return Response(
+                {'error': 'Idempotency-Key was already used for a different request'},
+                status=status.HTTP_422_UNPROCESSABLE_ENTITY
+            )
+        if state == 'in_progress':
+            return Response(
+                {'error': 'A request with this Idempotency-Key is in progress'},
+                status=status.HTTP_409_CONFLICT, headers={'Retry-After': '1'}
+            )
+        if state == 'done':
+            IDEMPOTENT_REPLAYS.labels(view.__name__).inc()
+            return Response(record.response, status=record.status_code, headers={'Idempotent-Replayed': 'true'})
+
+        try:
+            with transaction.atomic():
+                response = view(request, *args, **kwargs)
+                if response.status_code < 500:
+                    IdempotencyService.complete(record, response.status_code, getattr(response, 'data', None))
+        except Exception:
+            IdempotencyService.release(record)
+            raise
+        if response.status_code >= 500:
+            IdempotencyService.release(record)
+        return response
+    return wrapper
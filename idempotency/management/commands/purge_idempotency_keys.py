@@ -0,0 +1,27 @@
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from idempotency.services import IdempotencyService
+
+
+class Command(BaseCommand):
+    help = "Delete idempotency keys older than their time to live"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--ttl-hours', type=float, default=settings.IDEMPOTENCY_KEY_TTL_HOURS,
+            help="Keys older than this are deleted; retries after that run again"
+        )
+        parser.add_argument('--batch-size', type=int, default=1000, help="Keys deleted per statement")
+        parser.add_argument('--loop', action='store_true', help="Keep purging periodically")
+        parser.add_argument('--interval', type=float, default=3600.0, help="Seconds between runs with --loop")
+
+    def handle(self, *args, **options):
+        ttl = timedelta(hours=options['ttl_hours'])
+        while True:
+            removed = IdempotencyService.purge(ttl, batch_size=options['batch_size'])
+            self.stdout.write(f"Deleted {removed} idempotency keys")
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
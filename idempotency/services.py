@@ -0,0 +1,64 @@
+from datetime import timedelta
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from monitoring.metrics import instrument_service
+from .models import IdempotencyKey
+
+@instrument_service
+class IdempotencyService:
+
+    @staticmethod
+    def claim(user, key, fingerprint):
+        """
+        Reserve user's key for a request with fingerprint. Returns the
+        IdempotencyKey and what to do with the request: 'new' (run it),
+        'done' (replay the stored response), 'in_progress' (the first request
+        is still running) or 'mismatch' (the key was used for another request).
+        """
+        try:
+            # Committed on its own so concurrent retries see the reservation
+            with transaction.atomic():
+                return IdempotencyKey.objects.create(user=user, key=key, fingerprint=fingerprint), 'new'
+        except IntegrityError:
+            pass
+        record = IdempotencyKey.objects.filter(user=user, key=key).first()
+        if record is None:
+            # Released or purged in between
+            return IdempotencyService.claim(user, key, fingerprint)
+        if record.fingerprint != fingerprint:
+            return record, 'mismatch'
+        if record.status_code is not None:
+            return record, 'done'
+        # Left behind by a worker that died mid-request
+        now = timezone.now()
+        abandoned = IdempotencyKey.objects.filter(
+            pk=record.pk, status_code=None,
+            created_at__lt=now - timedelta(seconds=settings.IDEMPOTENCY_LOCK_SECONDS),
+        ).update(created_at=now)
+        return record, 'new' if abandoned else 'in_progress'
+
+    @staticmethod
+    def complete(record, status_code, response):
+        """Store the response of the request that claimed record"""
+        record.status_code = status_code
+        record.response = response
+        record.save(update_fields=['status_code', 'response'])
+
+    @staticmethod
+    def release(record):
+        """Give up record so a retry runs the request again"""
+        IdempotencyKey.objects.filter(pk=record.pk).delete()
+
+    @staticmethod
+    def purge(ttl, batch_size=1000):
+        """Delete keys older than ttl (a timedelta) in batches; returns how many"""
+        cutoff = timezone.now() - ttl
+        removed = 0
+        while True:
+            ids = list(IdempotencyKey.objects.filter(
+                created_at__lt=cutoff
+            ).order_by('id').values_list('id', flat=True)[:batch_size])
+            if not ids:
+                return removed
+            removed += IdempotencyKey.objects.filter(id__in=ids).delete()[0]
@@ -0,0 +1,123 @@
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+from django.core.management import call_command
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.parsers import JSONParser
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory, APITestCase
+from competitions.models import Competition
+from competitions.services import CompetitionService
+from friendships.models import FriendRequest
+from users.models import User
+from .decorators import fingerprint
+from .models import IdempotencyKey
+
+
+class IdempotencyTest(APITestCase):
+
+    def setUp(self):
+        self.user1 = User.objects.create_user(username='testuser1', email='test1@example.com', password='testpassword123')
+        self.user2 = User.objects.create_user(username='testuser2', email='test2@example.com', password='testpassword123')
+        self.client.force_authenticate(self.user1)
+
+    def post(self, name, data, key='retry-1'):
+        return self.client.post(reverse(name), data, format='json', headers={'Idempotency-Key': key})
+
+    def test_retried_friend_request_replays_the_response(self):
+        first = self.post('send_friend_request', {'username': 'testuser2'})
+        retry = self.post('send_friend_request', {'username': 'testuser2'})
+
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(retry.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(retry.json(), first.json())
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(FriendRequest.objects.count(), 1)
+
+        # Without a key the write runs again
+        again = self.client.post(reverse('send_friend_request'), {'username': 'testuser2'}, format='json')
+        self.assertEqual(again.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_retried_screen_time_skips_the_service(self):
+        data = {'screen_time_minutes': 90}
+        with mock.patch.object(
+            CompetitionService, 'update_user_screen_time', wraps=CompetitionService.update_user_screen_time
+        ) as update:
+            self.assertEqual(self.post('update_screen_time', data).status_code, status.HTTP_200_OK)
+            self.assertEqual(self.post('update_screen_time', data).status_code, status.HTTP_200_OK)
+            self.post('update_screen_time', data, key='retry-2')
+        self.assertEqual(update.call_count, 2)
+
+    def test_retried_competition_creation(self):
+        now = timezone.now()
+        data = {
+            'title': 'Once', 'description': '',
+            'start_date': (now + timedelta(days=1)).isoformat(), 'end_date': (now + timedelta(days=8)).isoformat(),
+        }
+        first = self.post('create_competition', data)
+        retry = self.post('create_competition', data)
+
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(retry.json()['id'], first.json()['id'])
+        self.assertEqual(Competition.objects.count(), 1)
+
+    def test_key_reused_for_another_request(self):
+        self.post('send_friend_request', {'username': 'testuser2'})
+        response = self.post('send_friend_request', {'username': 'nobody'})
+        self.assertEqual(response.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+
+        # Keys belong to one user: this accepts the request instead of replaying it
+        self.client.force_authenticate(self.user2)
+        response = self.post('send_friend_request', {'username': 'testuser1'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn('Idempotent-Replayed', response)
+
+    def test_request_in_progress(self):
+        request = Request(
+            APIRequestFactory().post(reverse('send_friend_request'), {'username': 'testuser2'}, format='json'),
+            parsers=[JSONParser()]
+        )
+        record = IdempotencyKey.objects.create(user=self.user1, key='retry-1', fingerprint=fingerprint(request))
+
+        response = self.post('send_friend_request', {'username': 'testuser2'})
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(response['Retry-After'], '1')
+
+        # A reservation whose request never finished stops blocking
+        IdempotencyKey.objects.filter(pk=record.pk).update(created_at=timezone.now() - timedelta(minutes=5))
+        self.assertEqual(self.post('send_friend_request', {'username': 'testuser2'}).status_code, status.HTTP_201_CREATED)
+
+    def test_errors_are_not_stored(self):
+        with mock.patch.object(CompetitionService, 'update_user_screen_time', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                self.post('update_screen_time', {'screen_time_minutes': 90})
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+        self.assertEqual(self.post('update_screen_time', {'screen_time_minutes': 90}).status_code, status.HTTP_200_OK)
+
+    def test_batch_sub_requests_have_their_own_keys(self):
+        batch = {'requests': [
+            {'method': 'POST', 'path': reverse('send_friend_request'), 'body': {'username': 'testuser2'},
+             'idempotency_key': 'request-1'},
+            {'method': 'POST', 'path': reverse('update_screen_time'), 'body': {'screen_time_minutes': 30},
+             'idempotency_key': 'screen-time-1'},
+        ]}
+        first = self.client.post(reverse('batch'), batch, format='json', headers={'Idempotency-Key': 'batch'})
+        retry = self.client.post(reverse('batch'), batch, format='json', headers={'Idempotency-Key': 'batch'})
+
+        self.assertEqual([sub['status'] for sub in first.data['responses']], [201, 200])
+        self.assertEqual(retry.json(), first.json())
+        self.assertEqual(sorted(IdempotencyKey.objects.values_list('key', flat=True)), ['request-1', 'screen-time-1'])
+
+    def test_purge(self):
+        self.post('send_friend_request', {'username': 'testuser2'})
+        self.post('update_screen_time', {'screen_time_minutes': 30}, key='retry-2')
+        IdempotencyKey.objects.filter(key='retry-1').update(created_at=timezone.now() - timedelta(days=2))
+
+        out = StringIO()
+        call_command('purge_idempotency_keys', stdout=out)
+        self.assertIn("Deleted 1 idempotency keys", out.getvalue())
+        self.assertEqual(list(IdempotencyKey.objects.values_list('key', flat=True)), ['retry-2'])
+
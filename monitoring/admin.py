@@ -0,0 +1,87 @@
+import json
+from django.contrib import admin
+from django.http import FileResponse, Http404
+from django.urls import path, reverse
+from django.utils.html import format_html
+from .models import ProfileCapture, SlowQuery
+from .profiling import capture_path
+
+@admin.register(ProfileCapture)
+class ProfileCaptureAdmin(admin.ModelAdmin):
+    list_display = ['created_at', 'method', 'path', 'status_code', 'duration_ms', 'query_count', 'sql_ms', 'user']
+    list_filter = ['method', 'status_code', 'view_name']
+    search_fields = ['path', 'view_name']
+    readonly_fields = [
+        'name', 'created_at', 'user', 'method', 'path', 'view_name', 'status_code',
+        'duration_ms', 'query_count', 'sql_ms', 'download', 'profile_summary', 'sql_log',
+    ]
+    exclude = ['summary']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def get_urls(self):
+        return [
+            path('<int:pk>/pstats/', self.admin_site.admin_view(self.pstats_view), name='monitoring_profilecapture_pstats'),
+        ] + super().get_urls()
+
+    def pstats_view(self, request, pk):
+        capture = self.get_object(request, pk)
+        if capture is None or not self.has_view_permission(request, capture):
+            raise Http404
+        try:
+            stats = open(capture_path(capture.name, 'pstats'), 'rb')
+        except FileNotFoundError:
+            raise Http404("The pstats file is gone")
+        return FileResponse(stats, as_attachment=True, filename=f'{capture.name}.pstats')
+
+    @admin.display(description='pstats')
+    def download(self, obj):
+        url = reverse('admin:monitoring_profilecapture_pstats', args=[obj.pk])
+        return format_html('<a href="{}">{}.pstats</a>', url, obj.name)
+
+    @admin.display(description='Top functions (cumulative)')
+    def profile_summary(self, obj):
+        return format_html('<pre>{}</pre>', obj.summary)
+
+    @admin.display(description='SQL')
+    def sql_log(self, obj):
+        try:
+            with open(capture_path(obj.name, 'sql.json')) as log:
+                statements = json.load(log)
+        except (FileNotFoundError, ValueError):
+            return '-'
+        lines = [f"{entry['ms']:>8.2f} ms  {entry['sql']}  {entry['params']}" for entry in statements]
+        return format_html('<pre>{}</pre>', '\n'.join(lines))
+
+@admin.register(SlowQuery)
+class SlowQueryAdmin(admin.ModelAdmin):
+    list_display = ['short_sql', 'count', 'avg_ms', 'max_ms', 'total_ms', 'view_name', 'last_seen']
+    list_filter = ['alias', 'view_name']
+    search_fields = ['normalized_sql', 'view_name']
+    readonly_fields = [
+        'fingerprint', 'normalized_sql', 'sql', 'params', 'alias', 'view_name', 'stack_summary',
+        'query_plan', 'count', 'total_ms', 'max_ms', 'first_seen', 'last_seen',
+    ]
+    exclude = ['stack', 'plan']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    @admin.display(description='Statement')
+    def short_sql(self, obj):
+        return obj.normalized_sql[:120]
+
+    @admin.display(description='Stack (innermost first)')
+    def stack_summary(self, obj):
+        return format_html('<pre>{}</pre>', obj.stack)
+
+    @admin.display(description='Plan')
+    def query_plan(self, obj):
+        return format_html('<pre>{}</pre>', obj.plan)
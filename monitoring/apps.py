@@ -0,0 +1,10 @@
+from django.apps import AppConfig
+
+
+class MonitoringConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'monitoring'
+
+    def ready(self):
+        # Register the signal receivers
+        from . import metrics, profiling, slow_queries  # noqa: F401
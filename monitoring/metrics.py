@@ -0,0 +1,128 @@
+"""
+Prometheus metrics of the service layer.
+
+Under gunicorn every worker, and the periodic jobs beside it, writes its
+samples to files in PROMETHEUS_MULTIPROC_DIR (set up by entrypoint.sh, or
+by gunicorn.conf.py when run alone) and the metrics view merges them, so a
+scrape sees the whole server rather than one worker.
+Without that variable the metrics live in the process' default registry.
+"""
+import functools
+import os
+import time
+from django.core.signals import request_finished
+from django.db import connections
+from django.dispatch import receiver
+from prometheus_client import (
+    CollectorRegistry, Counter, Gauge, Histogram, REGISTRY, generate_latest, multiprocess,
+)
+
+SERVICE_CALL_SECONDS = Histogram(
+    'exizt_service_call_seconds', "Duration of service-layer calls", ['service', 'method'],
+)
+RANKING_RECOMPUTE_SECONDS = Histogram(
+    'exizt_ranking_recompute_seconds', "Duration of one leaderboard recomputation",
+)
+RANKING_PARTICIPANTS = Counter(
+    'exizt_ranking_participants', "Participants read by leaderboard recomputations",
+)
+RANKING_POSITIONS_CHANGED = Counter(
+    'exizt_ranking_positions_changed', "Participants whose position a recomputation changed",
+)
+SCREEN_TIME_UPDATES = Counter(
+    'exizt_screen_time_updates', "Screen-time submissions applied to competitions",
+)
+INVITATIONS_SENT = Counter(
+    'exizt_competition_invitations_sent', "Competition invitations created",
+)
+INVITATIONS_EXPIRED = Counter(
+    'exizt_competition_invitations_expired', "Pending invitations expired after their competition ended",
+)
+COMPETITIONS_CLOSED = Counter(
+    'exizt_competitions_closed', "Ended competitions closed into a final-standings snapshot",
+)
+PARTICIPANTS_ARCHIVED = Counter(
+    'exizt_participants_archived', "Participant rows of closed competitions moved to the archive",
+)
+CACHE_REQUESTS = Counter(
+    'exizt_cache_requests', "Cache lookups by cache and result (hit or miss)", ['cache', 'result'],
+)
+REALTIME_EVENTS_PUBLISHED = Counter(
+    'exizt_realtime_events_published', "Events published to the event streams by type", ['type'],
+)
+REALTIME_STREAMS_OPEN = Gauge(
+    'exizt_realtime_streams_open', "Event streams currently connected", multiprocess_mode='livesum',
+)
+BATCH_SUBREQUESTS = Counter(
+    'exizt_batch_subrequests', "Sub-requests run through the batch endpoint by view", ['view'],
+)
+REQUESTS_THROTTLED = Counter(
+    'exizt_requests_throttled', "Writes refused with 429 by throttle scope and bucket (user or global)",
+    ['scope', 'bucket'],
+)
+REQUESTS_SHED = Counter(
+    'exizt_requests_shed', "Writes refused with 503 by an overloaded worker, by reason", ['reason'],
+)
+IDEMPOTENT_REPLAYS = Counter(
+    'exizt_idempotent_replays', "Retried writes answered with the stored response, by view", ['view'],
+)
+ENDPOINT_SQL_QUERIES = Histogram(
+    'exizt_endpoint_sql_queries', "Statements run by sampled requests, by endpoint", ['endpoint'],
+    buckets=(1, 2, 3, 5, 8, 13, 21, 34, 55, 89),
+)
+ENDPOINT_SQL_SECONDS = Histogram(
+    'exizt_endpoint_sql_seconds', "Time spent in SQL by sampled requests, by endpoint", ['endpoint'],
+)
+ENDPOINT_SQL_DUPLICATES = Counter(
+    'exizt_endpoint_sql_duplicates', "Repeated statements (N+1 pattern) in sampled requests, by endpoint",
+    ['endpoint'],
+)
+DB_CONNECTIONS_OPEN = Gauge(
+    'exizt_db_connections_open', "Persistent database connections held open after a request",
+    ['alias'], multiprocess_mode='livesum',
+)
+
+
+def record_cache(cache, hit):
+    """Count a lookup in CACHE_REQUESTS; returns hit so it can wrap a condition"""
+    CACHE_REQUESTS.labels(cache, 'hit' if hit else 'miss').inc()
+    return hit
+
+
+def instrument_service(cls):
+    """Class decorator timing every public static method into SERVICE_CALL_SECONDS"""
+    for name, attr in list(vars(cls).items()):
+        if name.startswith('_') or not isinstance(attr, staticmethod):
+            continue
+        setattr(cls, name, staticmethod(_timed(cls.__name__, name, attr.__func__)))
+    return cls
+
+
+def _timed(service, method, func):
+    histogram = SERVICE_CALL_SECONDS.labels(service, method)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            histogram.observe(time.perf_counter() - started)
+    return wrapper
+
+
+@receiver(request_finished)
+def update_connection_gauge(sender, **kwargs):
+    """After each request (and Django's own connection cleanup), record which connections stay open"""
+    for connection in connections.all(initialized_only=True):
+        DB_CONNECTIONS_OPEN.labels(connection.alias).set(int(connection.connection is not None))
+
+
+def exposition():
+    """Metrics in the Prometheus text format, merged across workers when multiprocess"""
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry)
\ No newline at end of file
@@ -0,0 +1,93 @@
+import json
+import logging
+import random
+from django.conf import settings
+from .metrics import ENDPOINT_SQL_DUPLICATES, ENDPOINT_SQL_QUERIES, ENDPOINT_SQL_SECONDS
+from .sql import record_queries
+from . import profiling, slow_queries
+
+logger = logging.getLogger('monitoring.sql')
+
+
+def endpoint_name(request):
+    """URL name of the resolved view, or the raw path for unresolved requests"""
+    match = getattr(request, 'resolver_match', None)
+    if match is not None:
+        return match.view_name or match.route
+    return 'unresolved'
+
+
+class SQLInstrumentationMiddleware:
+    """
+    Record query count, SQL time, slowest statement and duplicates for a
+    sample (SQL_INSTRUMENTATION_SAMPLE_RATE) of requests. Sampled requests
+    get a Server-Timing header and a structured log line, and feed the
+    per-endpoint ENDPOINT_SQL_* metrics. The log line names the slowest
+    statement by fingerprint; its full text is only logged at DEBUG.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if random.random() >= settings.SQL_INSTRUMENTATION_SAMPLE_RATE:
+            return self.get_response(request)
+
+        with record_queries() as recorder:
+            response = self.get_response(request)
+
+        endpoint = endpoint_name(request)
+        ENDPOINT_SQL_QUERIES.labels(endpoint).observe(recorder.count)
+        ENDPOINT_SQL_SECONDS.labels(endpoint).observe(recorder.total_time)
+        ENDPOINT_SQL_DUPLICATES.labels(endpoint).inc(recorder.duplicates)
+
+        timing = (
+            f'sql;dur={recorder.total_time * 1000:.2f};'
+            f'desc="{recorder.count} queries, {recorder.duplicates} duplicated"'
+        )
+        existing = response.get('Server-Timing')
+        response['Server-Timing'] = f'{existing}, {timing}' if existing else timing
+
+        logger.info(json.dumps({
+            'event': 'request_sql',
+            'endpoint': endpoint,
+            'method': request.method,
+            'status': response.status_code,
+            **recorder.summary(),
+        }))
+        if recorder.slowest_sql and logger.isEnabledFor(logging.DEBUG):
+            logger.debug(json.dumps({
+                'event': 'request_sql_slowest',
+                'endpoint': endpoint,
+                'sql': recorder.slowest_sql,
+            }))
+        return response
+
+
+class SlowQueryMiddleware:
+    """Store the request's slow statements (see monitoring.slow_queries) once it is handled"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with slow_queries.deferred_recording():
+            return self.get_response(request)
+
+
+class ProfilerMiddleware:
+    """
+    Profile requests flagged by staff (see monitoring.profiling). Other
+    requests only pay for checking the flag.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not profiling.wants_profile(request):
+            return self.get_response(request)
+        user = profiling.staff_user(request)
+        if user is None:
+            return self.get_response(request)
+        return profiling.profile_request(request, self.get_response, user)
@@ -0,0 +1,35 @@
+# Generated by Django 5.2 on 2026-10-19 17:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitoring', '0001_profile_capture'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SlowQuery',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fingerprint', models.CharField(max_length=40, unique=True)),
+                ('normalized_sql', models.TextField()),
+                ('sql', models.TextField()),
+                ('params', models.TextField(blank=True)),
+                ('alias', models.CharField(max_length=100)),
+                ('view_name', models.CharField(blank=True, max_length=200)),
+                ('stack', models.TextField(blank=True)),
+                ('plan', models.TextField(blank=True)),
+                ('count', models.PositiveIntegerField(default=1)),
+                ('total_ms', models.FloatField()),
+                ('max_ms', models.FloatField()),
+                ('first_seen', models.DateTimeField(auto_now_add=True)),
+                ('last_seen', models.DateTimeField()),
+            ],
+            options={
+                'ordering': ['-total_ms'],
+            },
+        ),
+    ]
@@ -0,0 +1,56 @@
+from django.conf import settings
+from django.db import models
+
+class ProfileCapture(models.Model):
+    """
+    A request run under cProfile at a staff member's request. The pstats
+    dump and the SQL log are files in PROFILER_DIR named after `name`.
+    """
+    name = models.CharField(max_length=64, unique=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    method = models.CharField(max_length=10)
+    path = models.CharField(max_length=255)
+    view_name = models.CharField(max_length=200, blank=True)
+    status_code = models.PositiveSmallIntegerField()
+    duration_ms = models.FloatField()
+    query_count = models.PositiveIntegerField()
+    sql_ms = models.FloatField()
+    # Functions with the highest cumulative time, as printed by pstats
+    summary = models.TextField(blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.method} {self.path} ({self.duration_ms:.0f} ms)"
+
+class SlowQuery(models.Model):
+    """
+    Statements over SLOW_QUERY_THRESHOLD_MS, one row per normalised
+    statement (fingerprint). The example, stack and plan are those of the
+    first occurrence; the counters cover every occurrence.
+    """
+    fingerprint = models.CharField(max_length=40, unique=True)
+    normalized_sql = models.TextField()
+    sql = models.TextField()
+    params = models.TextField(blank=True)
+    alias = models.CharField(max_length=100)
+    view_name = models.CharField(max_length=200, blank=True)
+    stack = models.TextField(blank=True)
+    plan = models.TextField(blank=True)
+    count = models.PositiveIntegerField(default=1)
+    total_ms = models.FloatField()
+    max_ms = models.FloatField()
+    first_seen = models.DateTimeField(auto_now_add=True)
+    last_seen = models.DateTimeField()
+
+    class Meta:
+        ordering = ['-total_ms']
+
+    def __str__(self):
+        return self.normalized_sql[:80]
+
+    @property
+    def avg_ms(self):
+        return round(self.total_ms / self.count, 2)
@@ -0,0 +1,113 @@
+"""
+On-demand profiling of single requests.
+
+Staff send ``X-Profile: 1`` (or ``?_profile=1``) and the request runs
+under cProfile with its SQL recorded. The pstats dump (loadable by
+snakeviz, flameprof or ``python -m pstats``) and the SQL log are written
+to PROFILER_DIR, indexed by ProfileCapture rows; only the newest
+PROFILER_MAX_CAPTURES are kept.
+"""
+import cProfile
+import io
+import json
+import logging
+import os
+import pstats
+import time
+import uuid
+from django.conf import settings
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.exceptions import AuthenticationFailed
+from .models import ProfileCapture
+from .sql import record_queries
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_LINES = 40
+
+
+def wants_profile(request):
+    return request.META.get('HTTP_X_PROFILE') == '1' or request.GET.get('_profile') == '1'
+
+
+def staff_user(request):
+    """The staff user behind a session or API token, else None"""
+    user = getattr(request, 'user', None)
+    if user is None or not user.is_authenticated:
+        try:
+            authenticated = TokenAuthentication().authenticate(request)
+        except AuthenticationFailed:
+            return None
+        user = authenticated[0] if authenticated else None
+    return user if user is not None and user.is_staff else None
+
+
+def capture_path(name, suffix):
+    return os.path.join(settings.PROFILER_DIR, f'{name}.{suffix}')
+
+
+def profile_request(request, get_response, user):
+    """Run the request under cProfile and store a capture; returns the response"""
+    profiler = cProfile.Profile()
+    started = time.perf_counter()
+    with record_queries(keep_log=True) as recorder:
+        profiler.enable()
+        try:
+            response = get_response(request)
+        finally:
+            profiler.disable()
+    duration = time.perf_counter() - started
+
+    try:
+        capture = save_capture(request, response, user, profiler, recorder, duration)
+    except Exception:
+        # Profiling must never break the request it observes
+        logger.exception("Could not store the profile of %s", request.path)
+    else:
+        response['X-Profile-Id'] = str(capture.pk)
+    return response
+
+
+def save_capture(request, response, user, profiler, recorder, duration):
+    name = f"{timezone.now():%Y%m%d%H%M%S}-{uuid.uuid4().hex[:8]}"
+    os.makedirs(settings.PROFILER_DIR, exist_ok=True)
+    profiler.dump_stats(capture_path(name, 'pstats'))
+    with open(capture_path(name, 'sql.json'), 'w') as sql_log:
+        json.dump(recorder.log, sql_log, indent=1)
+
+    summary = io.StringIO()
+    pstats.Stats(profiler, stream=summary).sort_stats('cumulative').print_stats(SUMMARY_LINES)
+    match = getattr(request, 'resolver_match', None)
+    capture = ProfileCapture.objects.create(
+        name=name,
+        user=user,
+        method=request.method,
+        path=request.get_full_path()[:255],
+        view_name=(match.view_name if match else '')[:200],
+        status_code=response.status_code,
+        duration_ms=round(duration * 1000, 2),
+        query_count=recorder.count,
+        sql_ms=round(recorder.total_time * 1000, 2),
+        summary=summary.getvalue(),
+    )
+    prune_captures()
+    return capture
+
+
+def prune_captures():
+    """Delete the captures (and, through post_delete, their files) beyond the newest PROFILER_MAX_CAPTURES"""
+    stale = ProfileCapture.objects.order_by('-created_at', '-id')[settings.PROFILER_MAX_CAPTURES:]
+    for capture in ProfileCapture.objects.filter(pk__in=list(stale.values_list('pk', flat=True))):
+        capture.delete()
+
+
+@receiver(post_delete, sender=ProfileCapture)
+def delete_capture_files(sender, instance, **kwargs):
+    for suffix in ('pstats', 'sql.json'):
+        try:
+            os.remove(capture_path(instance.name, suffix))
+        except FileNotFoundError:
+            pass
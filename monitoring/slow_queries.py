@@ -0,0 +1,174 @@
+"""
+Slow-query log.
+
+An execute wrapper installed on every connection times each statement.
+Statements over SLOW_QUERY_THRESHOLD_MS that were issued from one of the
+SLOW_QUERY_MODULES are logged with the calling view and a stack summary.
+Those run during a request are then stored by SlowQueryMiddleware as
+SlowQuery rows, deduplicated by fingerprint, with the database's plan.
+Only slow statements pay for the stack walk and EXPLAIN.
+"""
+import json
+import logging
+import sys
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from django.conf import settings
+from django.db import connections, transaction, IntegrityError
+from django.db.backends.signals import connection_created
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.dispatch import receiver
+from django.utils import timezone
+from .models import SlowQuery
+from .sql import fingerprint, normalize_sql
+
+logger = logging.getLogger(__name__)
+
+# Set while the log runs its own statements (EXPLAIN, upsert)
+_recording = ContextVar('slow_query_recording', default=False)
+# Slow statements waiting to be stored (see deferred_recording)
+_pending = ContextVar('slow_query_pending', default=None)
+
+STACK_DEPTH = 8
+MAX_PENDING = 50
+
+EXPLAIN_PREFIX = {
+    'sqlite': 'EXPLAIN QUERY PLAN ',
+    'postgresql': 'EXPLAIN ',
+}
+
+
+def caller_frames(modules):
+    """
+    Project frames of the current stack, innermost first, if one of them
+    belongs to modules; else None.
+    """
+    frames, matched = [], False
+    project = str(settings.BASE_DIR)
+    frame = sys._getframe(2)
+    while frame is not None:
+        module = frame.f_globals.get('__name__', '')
+        if frame.f_code.co_filename.startswith(project) and module != '__main__' and not module.startswith('monitoring.'):
+            frames.append((module, frame.f_code.co_name, frame.f_lineno))
+            matched = matched or module in modules
+        frame = frame.f_back
+    return frames if matched else None
+
+
+def view_of(frames):
+    """module.function of the outermost view frame"""
+    for module, function, line in reversed(frames):
+        if module.endswith('.views'):
+            return f'{module}.{function}'
+    return ''
+
+
+def explain(connection, sql, params):
+    prefix = EXPLAIN_PREFIX.get(connection.vendor)
+    if prefix is None:
+        return ''
+    try:
+        # A savepoint keeps a failed EXPLAIN from breaking the caller's transaction
+        with transaction.atomic(using=connection.alias):
+            with connection.cursor() as cursor:
+                cursor.execute(prefix + sql, params)
+                rows = cursor.fetchall()
+    except Exception as exc:
+        return f'EXPLAIN failed: {exc}'
+    return '\n'.join(' | '.join(str(value) for value in row) for row in rows)
+
+
+def record(entry):
+    """Store a slow statement, or count another occurrence of its fingerprint"""
+    now = timezone.now()
+    counters = {
+        'count': F('count') + 1,
+        'total_ms': F('total_ms') + entry['ms'],
+        'max_ms': Greatest('max_ms', entry['ms']),
+        'last_seen': now,
+    }
+    key = fingerprint(entry['sql'])
+    if SlowQuery.objects.filter(fingerprint=key).update(**counters):
+        return
+    connection = connections[entry['alias']]
+    try:
+        with transaction.atomic():
+            SlowQuery.objects.create(
+                fingerprint=key,
+                normalized_sql=normalize_sql(entry['sql']),
+                sql=entry['sql'],
+                params=repr(entry['params'])[:10000],
+                alias=entry['alias'],
+                view_name=entry['view'],
+                stack='\n'.join(entry['stack']),
+                plan='' if entry['many'] else explain(connection, entry['sql'], entry['params']),
+                total_ms=entry['ms'],
+                max_ms=entry['ms'],
+                last_seen=now,
+            )
+    except IntegrityError:
+        # Another worker stored the fingerprint first
+        SlowQuery.objects.filter(fingerprint=key).update(**counters)
+
+
+def flush(entries):
+    token = _recording.set(True)
+    try:
+        for entry in entries:
+            record(entry)
+    except Exception:
+        logger.exception("Could not store slow queries")
+    finally:
+        _recording.reset(token)
+
+
+def slow_query_wrapper(execute, sql, params, many, context):
+    if not settings.SLOW_QUERY_LOG or _recording.get():
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    result = execute(sql, params, many, context)
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    if elapsed_ms >= settings.SLOW_QUERY_THRESHOLD_MS:
+        frames = caller_frames(settings.SLOW_QUERY_MODULES)
+        if frames is not None:
+            entry = {
+                'ms': round(elapsed_ms, 3),
+                'alias': context['connection'].alias,
+                'sql': sql,
+                'params': params,
+                'many': many,
+                'view': view_of(frames),
+                'stack': [f'{module}.{function}:{line}' for module, function, line in frames[:STACK_DEPTH]],
+            }
+            # Parameters can hold credentials: they go to the staff-only table, not the log
+            logger.warning(json.dumps({'event': 'slow_query', **{k: v for k, v in entry.items() if k != 'params'}}))
+            pending = _pending.get()
+            if pending is not None and len(pending) < MAX_PENDING:
+                pending.append(entry)
+    return result
+
+
+@contextmanager
+def deferred_recording():
+    """
+    Collect the slow statements run inside the block and store them at its
+    end. EXPLAIN cannot run from the execute wrapper itself while the
+    statement's rows are still being read.
+    """
+    pending = []
+    token = _pending.set(pending)
+    try:
+        yield
+    finally:
+        _pending.reset(token)
+        if pending:
+            flush(pending)
+
+
+@receiver(connection_created)
+def install_wrapper(sender, connection, **kwargs):
+    # First in the list: execute_wrapper() context managers pop from the end
+    if slow_query_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, slow_query_wrapper)
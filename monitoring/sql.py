@@ -0,0 +1,83 @@
+"""
+Per-request SQL accounting through ``connection.execute_wrapper`` and
+statement fingerprints.
+"""
+import hashlib
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+from django.db import connections
+
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER_LISTS = re.compile(r"\((?:\s*(?:%s|\?)\s*,)+\s*(?:%s|\?)\s*\)")
+
+
+def normalize_sql(sql):
+    """Replace literals and collapse IN/VALUES lists so statements differing only in parameters match"""
+    return _PLACEHOLDER_LISTS.sub('(...)', _LITERALS.sub('?', sql))
+
+
+def fingerprint(sql):
+    return hashlib.sha1(normalize_sql(sql).encode()).hexdigest()
+
+
+class QueryRecorder:
+    """
+    Execute wrapper counting and timing every statement it sees. With
+    keep_log the statements, parameters and durations are kept in order.
+    """
+
+    def __init__(self, keep_log=False):
+        self.log = [] if keep_log else None
+        self.count = 0
+        self.total_time = 0.0
+        self.slowest_time = 0.0
+        self.slowest_sql = None
+        self.statements = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.count += 1
+            self.total_time += elapsed
+            self.statements[sql] += 1
+            if self.log is not None:
+                self.log.append({
+                    'sql': sql,
+                    'params': repr(params),
+                    'many': many,
+                    'alias': context['connection'].alias,
+                    'ms': round(elapsed * 1000, 3),
+                })
+            if elapsed > self.slowest_time:
+                self.slowest_time = elapsed
+                self.slowest_sql = sql
+
+    @property
+    def duplicates(self):
+        """Executions of SQL text already run in this request (N+1 pattern)"""
+        return sum(count - 1 for count in self.statements.values() if count > 1)
+
+    def summary(self):
+        """Counts and timings; the slowest statement only by fingerprint"""
+        return {
+            'queries': self.count,
+            'sql_ms': round(self.total_time * 1000, 2),
+            'duplicates': self.duplicates,
+            'slowest_ms': round(self.slowest_time * 1000, 2),
+            'slowest_fingerprint': fingerprint(self.slowest_sql) if self.slowest_sql else None,
+        }
+
+
+@contextmanager
+def record_queries(keep_log=False):
+    """Record the statements run on every database connection inside the block"""
+    recorder = QueryRecorder(keep_log)
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(recorder))
+        yield recorder
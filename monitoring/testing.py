@@ -0,0 +1,144 @@
+"""
+Query-budget assertions for tests: an endpoint's query count must not grow
+with the amount of related data, and its queries must not scan whole tables.
+"""
+import difflib
+import unittest
+from collections import Counter
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from .sql import normalize_sql
+
+
+def repeated_statements(queries):
+    """Lines of 'Nx SQL' for normalized statements executed more than once"""
+    counts = Counter(normalize_sql(query['sql']) for query in queries)
+    return [f'{count:>4}x {sql}' for sql, count in sorted(counts.items()) if count > 1]
+
+
+class QueryBudgetMixin:
+    """
+    Mixin for TestCase classes.
+
+    assertConstantQueries(seed, make_request) seeds each size of fixture
+    inside a savepoint, performs the request and checks the query count is
+    the same for every size. On failure the message lists the per-size
+    counts and a diff of the statements repeated at the smallest and
+    largest size.
+    """
+    query_budget_sizes = (1, 10, 100)
+
+    def _measure(self, seed, make_request, size):
+        savepoint = transaction.savepoint()
+        try:
+            state = seed(size)
+            cache.clear()
+            with CaptureQueriesContext(connection) as captured:
+                response = make_request(state)
+            if hasattr(response, 'status_code'):
+                self.assertLess(response.status_code, 400, f"Request failed at size {size}: {response.status_code}")
+            return captured.captured_queries
+        finally:
+            transaction.savepoint_rollback(savepoint)
+
+    def assertConstantQueries(self, seed, make_request, sizes=None, max_queries=None):
+        """
+        seed(size) creates `size` related rows and returns a state object that
+        is passed to make_request(state), which performs the request.
+        """
+        sizes = sizes or self.query_budget_sizes
+        # Prime process-wide caches (content types, permissions, ...) first
+        self._measure(seed, make_request, sizes[0])
+        captured = {size: self._measure(seed, make_request, size) for size in sizes}
+        counts = {size: len(queries) for size, queries in captured.items()}
+
+        if len(set(counts.values())) > 1:
+            smallest, largest = sizes[0], sizes[-1]
+            diff = difflib.unified_diff(
+                repeated_statements(captured[smallest]),
+                repeated_statements(captured[largest]),
+                fromfile=f'repeated statements at size {smallest}',
+                tofile=f'repeated statements at size {largest}',
+                lineterm='',
+            )
+            self.fail(f"Query count grows with data size: {counts}\n" + '\n'.join(diff))
+        if max_queries is not None:
+            count = counts[sizes[0]]
+            self.assertLessEqual(
+                count, max_queries, f"{count} queries exceed the budget of {max_queries}"
+            )
+        return counts[sizes[0]]
+
+
+def scanned(detail):
+    """
+    (table, index) walked in full by an EXPLAIN QUERY PLAN line, index None
+    for a plain table scan; None for searches and other steps. Handles
+    "SCAN t [AS alias] [USING [COVERING] INDEX i]" and the "SCAN TABLE t"
+    of SQLite before 3.36.
+    """
+    words = detail.split()
+    if len(words) < 2 or words[0] != 'SCAN':
+        return None
+    table = words[2] if words[1] == 'TABLE' and len(words) > 2 else words[1]
+    index = words[words.index('INDEX') + 1] if 'INDEX' in words[:-1] else None
+    return table, index
+
+
+def full_scans(queries, allowed_indexes=()):
+    """
+    (statement, plan line) for each SQLite plan step in queries (as captured
+    by CaptureQueriesContext) that walks a whole table rather than searching
+    it. A full walk of an index counts too: it reads every row just the
+    same, only in index order. allowed_indexes names indexes whose full walk
+    is intended, e.g. a small partial index.
+    """
+    tables = set(connection.introspection.table_names())
+    scans = []
+    with connection.cursor() as cursor:
+        for query in queries:
+            sql = query['sql']
+            if not sql.startswith(('SELECT', 'UPDATE', 'DELETE')):
+                continue
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+            for row in cursor.fetchall():
+                detail = row[-1]
+                step = scanned(detail)
+                # Subqueries and CTEs are scanned by name but are not tables
+                if step and step[0] in tables and step[1] not in allowed_indexes:
+                    scans.append((sql, detail))
+    return scans
+
+
+class QueryPlanMixin:
+    """
+    Mixin for TestCase classes.
+
+    assertIndexedQueries(call) runs call() and checks that SQLite's plan of
+    every SELECT, UPDATE and DELETE it ran searches each table through an
+    index (or primary key), listing the statements that scan a whole table
+    or index instead. Walks of the indexes in allowed_indexes are accepted.
+    """
+
+    def assertIndexedQueries(self, call, allowed_indexes=()):
+        if connection.vendor != 'sqlite':
+            raise unittest.SkipTest("Query plans are checked on SQLite")
+        with CaptureQueriesContext(connection) as captured:
+            result = call()
+        scans = full_scans(captured.captured_queries, allowed_indexes)
+        if scans:
+            self.fail("Full table scans:\n" + '\n'.join(f'{detail}: {sql}' for sql, detail in scans))
+        return result
+
+
+def make_users(count, prefix='user', with_profiles=True):
+    """Bulk-create users (unusable passwords) and their profiles for scaled fixtures"""
+    from users.models import User, Profile
+    users = User.objects.bulk_create([
+        User(username=f'{prefix}{i}', email=f'{prefix}{i}@example.com', password='!')
+        for i in range(count)
+    ])
+    if with_profiles:
+        Profile.objects.bulk_create([Profile(user=user, name=user.username) for user in users])
+    return users
@@ -0,0 +1,338 @@
+import json
+import os
+import tempfile
+import unittest
+from datetime import timedelta
+from unittest import mock
+from django.conf import settings
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+from django.utils import timezone
+from prometheus_client import REGISTRY
+from competitions.models import Competition, Participant
+from competitions.services import CompetitionService
+from users.services import UserService
+from .metrics import exposition
+from .models import ProfileCapture, SlowQuery
+from .profiling import capture_path
+from .slow_queries import slow_query_wrapper, deferred_recording
+from .sql import QueryRecorder, record_queries, fingerprint
+from .testing import full_scans, scanned
+from friendships.services import FriendshipService
+
+class QueryRecorderTest(TestCase):
+    """Tests for the execute wrapper recording statements"""
+
+    def test_counts_time_and_duplicates(self):
+        with record_queries() as recorder:
+            for _ in range(3):
+                with connection.cursor() as cursor:
+                    cursor.execute("SELECT %s", [1])
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 2")
+
+        self.assertEqual(recorder.count, 4)
+        self.assertEqual(recorder.duplicates, 2)
+        self.assertGreater(recorder.total_time, 0)
+        self.assertIsNotNone(recorder.slowest_sql)
+
+    def test_stops_recording_after_block(self):
+        with record_queries() as recorder:
+            pass
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1")
+        self.assertEqual(recorder.count, 0)
+
+@unittest.skipUnless(connection.vendor == 'sqlite', "Query plans are checked on SQLite")
+class FullScansTest(TestCase):
+    """Tests for the query plan check behind QueryPlanMixin"""
+
+    def test_plan_lines(self):
+        self.assertEqual(scanned('SCAN users_user'), ('users_user', None))
+        self.assertEqual(scanned('SCAN TABLE users_user AS U0'), ('users_user', None))
+        self.assertEqual(scanned('SCAN users_user USING COVERING INDEX user_name'), ('users_user', 'user_name'))
+        self.assertEqual(scanned('SCAN TABLE users_user USING INDEX user_name'), ('users_user', 'user_name'))
+        self.assertIsNone(scanned('SEARCH users_user USING INTEGER PRIMARY KEY (rowid=?)'))
+        self.assertIsNone(scanned('USE TEMP B-TREE FOR ORDER BY'))
+
+    def plan(self, sql):
+        return full_scans([{'sql': sql}])
+
+    def test_index_walks_are_scans(self):
+        self.assertEqual(len(self.plan('SELECT * FROM users_user')), 1)
+        walk = self.plan('SELECT id FROM users_user ORDER BY username')
+        self.assertEqual(len(walk), 1)
+        self.assertIn('INDEX', walk[0][1])
+        self.assertEqual(self.plan('SELECT * FROM users_user WHERE id = 1'), [])
+
+    def test_allowed_indexes(self):
+        sql = 'SELECT id FROM users_user ORDER BY username'
+        [(_, detail)] = self.plan(sql)
+        index = scanned(detail)[1]
+        self.assertEqual(full_scans([{'sql': sql}], allowed_indexes=[index]), [])
+
+@override_settings(SQL_INSTRUMENTATION_SAMPLE_RATE=1.0)
+class SQLInstrumentationMiddlewareTest(TestCase):
+    """Tests for the per-request SQL middleware"""
+
+    def sample(self, name, labels=None):
+        return REGISTRY.get_sample_value(name, labels or {}) or 0
+
+    def setUp(self):
+        user = UserService.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpassword123'
+        )
+        UserService.create_profile(user)
+        token = UserService.create_auth_token(user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+
+    def test_server_timing_header_and_log(self):
+        with self.assertLogs('monitoring.sql', 'INFO') as logs:
+            response = self.client.get(reverse('profile'))
+
+        self.assertIn('Server-Timing', response)
+        self.assertTrue(response['Server-Timing'].startswith('sql;dur='))
+        line = json.loads(logs.records[-1].getMessage())
+        self.assertEqual(line['endpoint'], 'profile')
+        self.assertEqual(line['status'], 200)
+        self.assertGreater(line['queries'], 0)
+        self.assertIn(f'{line["queries"]} queries', response['Server-Timing'])
+        self.assertNotIn('slowest_sql', line)
+        self.assertEqual(len(line['slowest_fingerprint']), 40)
+
+    def test_full_statement_only_at_debug(self):
+        with self.assertLogs('monitoring.sql', 'DEBUG') as logs:
+            self.client.get(reverse('profile'))
+
+        debug = [json.loads(record.getMessage()) for record in logs.records if record.levelname == 'DEBUG']
+        self.assertEqual(len(debug), 1)
+        self.assertEqual(debug[0]['event'], 'request_sql_slowest')
+        self.assertIn('SELECT', debug[0]['sql'])
+
+    def test_endpoint_metrics(self):
+        labels = {'endpoint': 'profile'}
+        requests = self.sample('exizt_endpoint_sql_queries_count', labels)
+        queries = self.sample('exizt_endpoint_sql_queries_sum', labels)
+        for _ in range(3):
+            self.client.get(reverse('profile'))
+        self.assertEqual(self.sample('exizt_endpoint_sql_queries_count', labels), requests + 3)
+        self.assertGreater(self.sample('exizt_endpoint_sql_queries_sum', labels), queries)
+        self.assertEqual(self.sample('exizt_endpoint_sql_seconds_count', labels), requests + 3)
+
+    @override_settings(SQL_INSTRUMENTATION_SAMPLE_RATE=0.0)
+    def test_unsampled_requests_are_untouched(self):
+        labels = {'endpoint': 'profile'}
+        requests = self.sample('exizt_endpoint_sql_queries_count', labels)
+        response = self.client.get(reverse('profile'))
+        self.assertNotIn('Server-Timing', response)
+        self.assertEqual(self.sample('exizt_endpoint_sql_queries_count', labels), requests)
+
+class MetricsTest(TestCase):
+    """Tests for the Prometheus service metrics and endpoint"""
+
+    def sample(self, name, labels=None):
+        return REGISTRY.get_sample_value(name, labels or {}) or 0
+
+    def setUp(self):
+        self.user = UserService.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpassword123'
+        )
+        now = timezone.now()
+        self.competition = Competition.objects.create(
+            title='Active', creator=self.user,
+            start_date=now - timedelta(days=1), end_date=now + timedelta(days=1),
+        )
+        Participant.objects.create(user=self.user, competition=self.competition)
+
+    def test_screen_time_update_metrics(self):
+        updates = self.sample('exizt_screen_time_updates_total')
+        recomputes = self.sample('exizt_ranking_recompute_seconds_count')
+        participants = self.sample('exizt_ranking_participants_total')
+        calls = self.sample(
+            'exizt_service_call_seconds_count',
+            {'service': 'CompetitionService', 'method': 'update_user_screen_time'},
+        )
+
+        CompetitionService.update_user_screen_time(self.user, timezone.now().date(), 30.0)
+
+        self.assertEqual(self.sample('exizt_screen_time_updates_total'), updates + 1)
+        self.assertEqual(self.sample('exizt_ranking_recompute_seconds_count'), recomputes + 1)
+        self.assertEqual(self.sample('exizt_ranking_participants_total'), participants + 1)
+        self.assertEqual(self.sample(
+            'exizt_service_call_seconds_count',
+            {'service': 'CompetitionService', 'method': 'update_user_screen_time'},
+        ), calls + 1)
+
+    @override_settings(METRICS_TOKEN='scrape-token')
+    def test_metrics_endpoint(self):
+        # The connection gauge is set when the previous request finished
+        self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer scrape-token')
+        response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer scrape-token')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        body = response.content.decode()
+        self.assertIn('exizt_service_call_seconds', body)
+        self.assertIn('exizt_db_connections_open{alias="default"}', body)
+
+    def test_metrics_endpoint_needs_the_token(self):
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 404)
+        with override_settings(METRICS_TOKEN='scrape-token'):
+            self.assertEqual(self.client.get(reverse('metrics')).status_code, 404)
+            response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer wrong')
+            self.assertEqual(response.status_code, 404)
+
+    def test_multiprocess_exposition_reads_the_shared_directory(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with mock.patch.dict(os.environ, {'PROMETHEUS_MULTIPROC_DIR': directory}):
+                with mock.patch('monitoring.metrics.multiprocess.MultiProcessCollector') as collector:
+                    exposition()
+        collector.assert_called_once()
+
+class ProfilerMiddlewareTest(TestCase):
+    """Tests for staff-only request profiling"""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        settings_override = override_settings(PROFILER_DIR=self.directory.name, PROFILER_MAX_CAPTURES=2)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.addCleanup(self.directory.cleanup)
+
+        self.user = UserService.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpassword123'
+        )
+        UserService.create_profile(self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {UserService.create_auth_token(self.user).key}')
+
+    def test_non_staff_requests_are_not_profiled(self):
+        response = self.client.get(reverse('profile'), HTTP_X_PROFILE='1')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('X-Profile-Id', response)
+        self.assertFalse(ProfileCapture.objects.exists())
+
+    def test_staff_request_is_captured(self):
+        self.user.is_staff = True
+        self.user.save()
+
+        response = self.client.get(reverse('profile'), {'_profile': '1'})
+
+        capture = ProfileCapture.objects.get(pk=response['X-Profile-Id'])
+        self.assertEqual(capture.view_name, 'profile')
+        self.assertEqual(capture.user, self.user)
+        self.assertGreater(capture.query_count, 0)
+        self.assertIn('cumulative', capture.summary)
+        self.assertTrue(os.path.exists(capture_path(capture.name, 'pstats')))
+        with open(capture_path(capture.name, 'sql.json')) as log:
+            self.assertEqual(len(json.load(log)), capture.query_count)
+
+    def test_unflagged_staff_requests_are_not_profiled(self):
+        self.user.is_staff = True
+        self.user.save()
+        response = self.client.get(reverse('profile'))
+        self.assertNotIn('X-Profile-Id', response)
+
+    def test_ring_buffer_keeps_newest_captures(self):
+        self.user.is_staff = True
+        self.user.save()
+        names = []
+        for _ in range(3):
+            response = self.client.get(reverse('profile'), HTTP_X_PROFILE='1')
+            names.append(ProfileCapture.objects.get(pk=response['X-Profile-Id']).name)
+
+        self.assertEqual(list(ProfileCapture.objects.values_list('name', flat=True)), names[:0:-1])
+        self.assertFalse(os.path.exists(capture_path(names[0], 'pstats')))
+        self.assertEqual(len(os.listdir(self.directory.name)), 4)
+
+    # The admin pages link static files, which the production manifest storage
+    # only resolves after collectstatic
+    @override_settings(STORAGES={
+        **settings.STORAGES,
+        'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+    })
+    def test_admin_download(self):
+        self.user.is_staff = True
+        self.user.is_superuser = True
+        self.user.save()
+        response = self.client.get(reverse('profile'), HTTP_X_PROFILE='1')
+        capture_id = response['X-Profile-Id']
+
+        self.client.force_login(self.user)
+        detail = self.client.get(reverse('admin:monitoring_profilecapture_change', args=[capture_id]))
+        download = self.client.get(reverse('admin:monitoring_profilecapture_pstats', args=[capture_id]))
+
+        self.assertEqual(detail.status_code, 200)
+        self.assertEqual(download.status_code, 200)
+        self.assertIn('attachment', download['Content-Disposition'])
+        download.close()
+
+class SlowQueryLogTest(TestCase):
+    """Tests for the slow-query log"""
+
+    def setUp(self):
+        self.user = UserService.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpassword123'
+        )
+        UserService.create_profile(self.user)
+        # Every statement counts as slow from here on
+        settings_override = override_settings(SLOW_QUERY_THRESHOLD_MS=0.0)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def test_wrapper_is_installed(self):
+        self.assertIn(slow_query_wrapper, connection.execute_wrappers)
+
+    def test_service_queries_are_recorded_once_per_fingerprint(self):
+        with self.assertLogs('monitoring.slow_queries', 'WARNING'), deferred_recording():
+            FriendshipService.get_or_create_friend_list(self.user)
+            FriendshipService.get_or_create_friend_list(self.user)
+
+        entry = SlowQuery.objects.get(normalized_sql__contains='FROM "friendships_friendlist"')
+        self.assertEqual(entry.count, 2)
+        self.assertIn('friendships.services.get_or_create_friend_list', entry.stack)
+        self.assertIn('friendships_friendlist', entry.plan)
+        self.assertGreaterEqual(entry.max_ms, 0)
+        self.assertIn(str(self.user.id), entry.params)
+
+    def test_calling_view_is_recorded(self):
+        client = APIClient()
+        with self.assertLogs('monitoring.slow_queries', 'WARNING'):
+            client.credentials(HTTP_AUTHORIZATION=f'Token {UserService.create_auth_token(self.user).key}')
+            client.get(reverse('friendships'))
+
+        self.assertTrue(SlowQuery.objects.filter(view_name='friendships.views.get_friends').exists())
+
+    def test_queries_outside_the_services_are_ignored(self):
+        with deferred_recording():
+            list(Competition.objects.all())
+        self.assertFalse(SlowQuery.objects.filter(normalized_sql__contains='competitions_competition').exists())
+
+    @override_settings(SLOW_QUERY_THRESHOLD_MS=10_000.0)
+    def test_fast_queries_are_ignored(self):
+        with deferred_recording():
+            FriendshipService.get_or_create_friend_list(self.user)
+        self.assertFalse(SlowQuery.objects.exists())
+
+    def test_outside_a_request_slow_queries_are_only_logged(self):
+        with self.assertLogs('monitoring.slow_queries', 'WARNING'):
+            FriendshipService.get_or_create_friend_list(self.user)
+        self.assertFalse(SlowQuery.objects.exists())
+
+    def test_fingerprint_ignores_list_lengths(self):
+        self.assertEqual(
+            fingerprint('SELECT * FROM t WHERE id IN (%s, %s)'),
+            fingerprint('SELECT * FROM t WHERE id IN (%s, %s, %s, %s)'),
+        )
@@ -0,0 +1,19 @@
+import hmac
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseNotFound
+from django.views.decorators.http import require_GET
+from prometheus_client import CONTENT_TYPE_LATEST
+from .metrics import exposition
+
+@require_GET
+def metrics(request):
+    """
+    Internal Prometheus scrape endpoint, for `Authorization: Bearer
+    <METRICS_TOKEN>` only; without a token configured it does not exist.
+    Production scrapes the gunicorn master on METRICS_PORT instead.
+    """
+    expected = f'Bearer {settings.METRICS_TOKEN}'
+    given = request.META.get('HTTP_AUTHORIZATION', '')
+    if not settings.METRICS_TOKEN or not hmac.compare_digest(given.encode(), expected.encode()):
+        return HttpResponseNotFound()
+    return HttpResponse(exposition(), content_type=CONTENT_TYPE_LATEST)
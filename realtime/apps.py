@@ -0,0 +1,10 @@
+from django.apps import AppConfig
+
+
+class RealtimeConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'realtime'
+
+    def ready(self):
+        # Register the signal receivers
+        from . import brokers  # noqa: F401
@@ -0,0 +1,216 @@
+"""
+Pub/sub between the code that changes data and the event streams.
+
+publish() may be called from any thread (the sync service layer) and
+subscriptions are consumed on the event loop serving the stream.
+LocalBroker only reaches the streams of its own process; SocketBroker also
+forwards every message to the other processes of the machine over Unix
+datagram sockets in REALTIME_SOCKET_DIR. REALTIME_BROKER selects the class.
+"""
+import asyncio
+import json
+import logging
+import os
+import socket
+import threading
+import uuid
+from contextlib import suppress
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+# Upper bound for one message; events only carry ids
+MAX_DATAGRAM = 64 * 1024
+
+
+class Subscription:
+    """Events of some channels queued for one stream"""
+
+    def __init__(self, broker, channels, loop):
+        self.broker = broker
+        self.channels = frozenset(channels)
+        self.loop = loop
+        self.queue = asyncio.Queue(settings.REALTIME_MAX_QUEUED_EVENTS)
+        self.overflowed = False
+
+    def deliver(self, event):
+        # Runs on self.loop
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+    async def get(self, timeout):
+        """
+        Next event, or None after timeout seconds. Once events were dropped
+        because the stream fell behind, a single 'resync' event replaces
+        the queued ones and the client refetches its state.
+        """
+        if self.overflowed:
+            self.overflowed = False
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            return {'type': 'resync', 'data': {}}
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class LocalBroker:
+    """Delivers events to the subscriptions of this process only"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscriptions = {}
+
+    def subscribe(self, channels, loop=None):
+        """Subscription bound to loop (by default the running one)"""
+        subscription = Subscription(self, channels, loop or asyncio.get_running_loop())
+        with self._lock:
+            for channel in subscription.channels:
+                self._subscriptions.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            for channel in subscription.channels:
+                subscribers = self._subscriptions.get(channel, set())
+                subscribers.discard(subscription)
+                if not subscribers:
+                    self._subscriptions.pop(channel, None)
+
+    def publish(self, channels, event):
+        """Send event (a JSON-serializable dict) to the subscribers of channels"""
+        self.dispatch(channels, event)
+
+    def dispatch(self, channels, event):
+        """Hand event to the local subscriptions of channels; returns how many"""
+        with self._lock:
+            targets = set().union(*(self._subscriptions.get(channel, ()) for channel in channels))
+        for subscription in targets:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.deliver, event)
+            except RuntimeError:
+                # The subscription's loop is closed
+                self.unsubscribe(subscription)
+        return len(targets)
+
+    def close(self):
+        pass
+
+
+class SocketBroker(LocalBroker):
+    """
+    Reaches the streams of every process on the machine (gunicorn workers,
+    management commands). A process binds a socket in REALTIME_SOCKET_DIR
+    once it has subscribers and publish() sends one datagram to each socket
+    there. Processes on other machines are not reached.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.directory = settings.REALTIME_SOCKET_DIR
+        self.path = None
+        self._receiver = None
+        self._sender = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        # A full receiver buffer drops the message instead of blocking the request
+        self._sender.setblocking(False)
+
+    def subscribe(self, channels, loop=None):
+        self._listen()
+        return super().subscribe(channels, loop)
+
+    def _listen(self):
+        with self._lock:
+            if self._receiver is not None:
+                return
+            os.makedirs(self.directory, exist_ok=True)
+            path = os.path.join(self.directory, f'{os.getpid()}.{uuid.uuid4().hex[:8]}.sock')
+            receiver = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            receiver.bind(path)
+            # Lets the thread notice close()
+            receiver.settimeout(1.0)
+            self._receiver, self.path = receiver, path
+        threading.Thread(
+            target=self._receive, args=(receiver,), name='realtime-receiver', daemon=True
+        ).start()
+
+    def _receive(self, receiver):
+        while self._receiver is receiver:
+            try:
+                data = receiver.recv(MAX_DATAGRAM)
+            except socket.timeout:
+                continue
+            except OSError:
+                return
+            try:
+                message = json.loads(data)
+                self.dispatch(message['channels'], message['event'])
+            except (ValueError, KeyError, TypeError):
+                logger.warning("Ignoring malformed realtime message", exc_info=True)
+
+    def publish(self, channels, event):
+        channels = list(channels)
+        self.dispatch(channels, event)
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return
+        data = json.dumps({'channels': channels, 'event': event}).encode()
+        for name in names:
+            path = os.path.join(self.directory, name)
+            if not name.endswith('.sock') or path == self.path:
+                continue
+            try:
+                self._sender.sendto(data, path)
+            except (ConnectionRefusedError, FileNotFoundError):
+                # Left behind by a process that exited without closing its broker
+                with suppress(FileNotFoundError):
+                    os.unlink(path)
+            except OSError:
+                logger.warning("Could not forward realtime event to %s", path, exc_info=True)
+
+    def close(self):
+        with self._lock:
+            receiver, path = self._receiver, self.path
+            self._receiver = self.path = None
+        if receiver is not None:
+            receiver.close()
+            with suppress(FileNotFoundError):
+                os.unlink(path)
+        self._sender.close()
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    """The process-wide broker, created on first use"""
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                _broker = import_string(settings.REALTIME_BROKER)()
+    return _broker
+
+
+def close_broker():
+    global _broker
+    with _broker_lock:
+        broker, _broker = _broker, None
+    if broker is not None:
+        broker.close()
+
+
+@receiver(setting_changed)
+def reset_broker(setting, **kwargs):
+    if setting.startswith('REALTIME_'):
+        close_broker()
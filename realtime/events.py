@@ -0,0 +1,37 @@
+"""
+Events published by the service layer.
+
+Every stream subscribes to the channel of its user. Events only carry ids:
+a client refetches what changed through the regular endpoints. They are
+published once the surrounding transaction commits, so the refetch never
+races the write, and rolled-back changes publish nothing.
+"""
+import logging
+from django.db import transaction
+from monitoring.metrics import REALTIME_EVENTS_PUBLISHED
+from .brokers import get_broker
+
+logger = logging.getLogger(__name__)
+
+
+def user_channel(user_id):
+    return f'user.{user_id}'
+
+
+def publish(user_ids, event_type, **data):
+    """Send an event to the streams of user_ids after the current transaction commits"""
+    channels = sorted({user_channel(user_id) for user_id in user_ids})
+    if not channels:
+        return
+    event = {'type': event_type, 'data': data}
+
+    def send():
+        try:
+            get_broker().publish(channels, event)
+        except Exception:
+            # Streams are best effort; the data itself is committed
+            logger.exception("Could not publish %s event", event_type)
+            return
+        REALTIME_EVENTS_PUBLISHED.labels(event_type).inc()
+
+    transaction.on_commit(send)
@@ -0,0 +1,207 @@
+import asyncio
+import os
+import tempfile
+import threading
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from datetime import timedelta
+from rest_framework.authtoken.models import Token
+from competitions.models import Participant
+from competitions.services import CompetitionService
+from friendships.models import FriendList
+from friendships.services import FriendshipService
+from users.models import User
+from .brokers import LocalBroker, SocketBroker, get_broker
+from .events import user_channel
+
+
+def drain(subscription):
+    """Events delivered to subscription so far"""
+    # Runs the deliveries scheduled on the subscription's loop
+    subscription.loop.run_until_complete(asyncio.sleep(0))
+    events = []
+    while not subscription.queue.empty():
+        events.append(subscription.queue.get_nowait())
+    return events
+
+
+class BrokerTest(SimpleTestCase):
+    event = {'type': 'friend_request.received', 'data': {'request_id': 1}}
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.addCleanup(self.loop.close)
+
+    def test_local_broker_delivers_across_threads(self):
+        broker = LocalBroker()
+        subscription = broker.subscribe(['user.1'], loop=self.loop)
+        other = broker.subscribe(['user.3'], loop=self.loop)
+
+        publisher = threading.Thread(target=broker.publish, args=(['user.1', 'user.2'], self.event))
+        publisher.start()
+        publisher.join()
+
+        self.assertEqual(drain(subscription), [self.event])
+        self.assertEqual(drain(other), [])
+        subscription.close()
+        self.assertEqual(broker.dispatch(['user.1'], self.event), 0)
+
+    @override_settings(REALTIME_MAX_QUEUED_EVENTS=2)
+    def test_slow_subscription_is_told_to_resync(self):
+        broker = LocalBroker()
+        subscription = broker.subscribe(['user.1'], loop=self.loop)
+        for _ in range(3):
+            broker.publish(['user.1'], self.event)
+        self.loop.run_until_complete(asyncio.sleep(0))
+
+        self.assertEqual(self.loop.run_until_complete(subscription.get(1)), {'type': 'resync', 'data': {}})
+        self.assertIsNone(self.loop.run_until_complete(subscription.get(0.01)))
+
+    def test_socket_broker_reaches_other_processes(self):
+        with tempfile.TemporaryDirectory() as directory, self.settings(REALTIME_SOCKET_DIR=directory):
+            listener, publisher = SocketBroker(), SocketBroker()
+            subscription = listener.subscribe(['user.1'], loop=self.loop)
+            # A socket whose process is gone
+            open(os.path.join(directory, '0.dead.sock'), 'w').close()
+
+            publisher.publish(['user.1'], self.event)
+
+            self.assertEqual(self.loop.run_until_complete(subscription.get(5)), self.event)
+            listener.close()
+            publisher.close()
+            self.assertEqual(os.listdir(directory), [])
+
+
+@override_settings(REALTIME_BROKER='realtime.brokers.LocalBroker')
+class ServiceEventsTest(TestCase):
+    """Service-layer changes reach the streams of the users they concern"""
+
+    def setUp(self):
+        self.user1 = User.objects.create_user(username='testuser1', email='test1@example.com', password='testpassword123')
+        self.user2 = User.objects.create_user(username='testuser2', email='test2@example.com', password='testpassword123')
+        self.loop = asyncio.new_event_loop()
+        self.addCleanup(self.loop.close)
+
+    def subscribe(self, user):
+        return get_broker().subscribe([user_channel(user.id)], loop=self.loop)
+
+    def test_friend_request_events(self):
+        sender, receiver = self.subscribe(self.user1), self.subscribe(self.user2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            friend_request = FriendshipService.create_friend_request(self.user1, self.user2)
+        request_id = friend_request.id
+        self.assertEqual(drain(receiver), [
+            {'type': 'friend_request.received', 'data': {'request_id': request_id}}
+        ])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            FriendshipService.update_request_status(friend_request, 'accept')
+        self.assertEqual(drain(sender), [{
+            'type': 'friend_request.answered',
+            'data': {'request_id': request_id, 'status': 'accepted'},
+        }])
+        self.assertEqual(drain(receiver), [])
+
+    def test_invitation_and_leaderboard_events(self):
+        FriendList.objects.create(user=self.user1).friends.add(self.user2)
+        now = timezone.now()
+        creator, invitee = self.subscribe(self.user1), self.subscribe(self.user2)
+
+        # Rolled back creations publish nothing
+        with self.captureOnCommitCallbacks(execute=True):
+            CompetitionService.create_competition_with_invitees(
+                'Rolled back', '', now - timedelta(days=1), now + timedelta(days=6), self.user1,
+                ['testuser2', 'nobody']
+            )
+        self.assertEqual(drain(invitee), [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            competition, results = CompetitionService.create_competition_with_invitees(
+                'Started', '', now - timedelta(days=1), now + timedelta(days=6), self.user1, ['testuser2']
+            )
+        self.assertEqual(drain(invitee), [
+            {'type': 'competition_invitation.received', 'data': {'competition_id': competition.id}}
+        ])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            CompetitionService.handle_invitation_response(results['testuser2']['invitation'].id, self.user2, 'accept')
+        leaderboard = {'type': 'competition.leaderboard', 'data': {'competition_id': competition.id}}
+        self.assertEqual(drain(creator), [
+            {
+                'type': 'competition_invitation.answered',
+                'data': {
+                    'invitation_id': results['testuser2']['invitation'].id,
+                    'competition_id': competition.id,
+                    'status': 'accepted',
+                },
+            },
+            leaderboard,
+        ])
+        self.assertEqual(drain(invitee), [leaderboard])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            CompetitionService.update_user_screen_time(self.user2, now.date(), 90)
+        self.assertEqual(drain(creator), [leaderboard])
+        self.assertEqual(drain(invitee), [leaderboard])
+        self.assertTrue(Participant.objects.filter(competition=competition, user=self.user2, position=1).exists())
+
+
+@override_settings(
+    REALTIME_BROKER='realtime.brokers.LocalBroker',
+    REALTIME_KEEPALIVE_SECONDS=0.05,
+    REALTIME_MAX_STREAM_SECONDS=0.5,
+)
+class EventStreamTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser1', email='test1@example.com', password='testpassword123')
+        self.token = Token.objects.create(user=self.user)
+        self.url = reverse('events')
+
+    async def test_stream(self):
+        response = await self.async_client.get(self.url, headers={'Authorization': f'Token {self.token.key}'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        content = response.streaming_content
+        self.assertEqual(await anext(content), b'retry: 5000\nevent: ready\ndata: {}\n\n')
+
+        get_broker().publish(
+            [user_channel(self.user.id), user_channel(self.user.id + 1)],
+            {'type': 'friend_request.received', 'data': {'request_id': 7}}
+        )
+        self.assertEqual(await anext(content), b'event: friend_request.received\ndata: {"request_id":7}\n\n')
+        self.assertEqual(await anext(content), b': keepalive\n\n')
+
+        # The stream ends after REALTIME_MAX_STREAM_SECONDS and unsubscribes
+        rest = [part async for part in content]
+        self.assertTrue(all(part == b': keepalive\n\n' for part in rest))
+        self.assertEqual(get_broker().dispatch([user_channel(self.user.id)], {}), 0)
+
+    @override_settings(REALTIME_IDLE_STREAM_SECONDS=0.2)
+    async def test_idle_stream_ends(self):
+        response = await self.async_client.get(self.url, headers={'Authorization': f'Token {self.token.key}'})
+        content = response.streaming_content
+        await anext(content)
+
+        # An event postpones the idle cut-off
+        get_broker().publish([user_channel(self.user.id)], {'type': 'friend_request.received', 'data': {}})
+        self.assertEqual(await anext(content), b'event: friend_request.received\ndata: {}\n\n')
+
+        rest = [part async for part in content]
+        self.assertEqual(rest[-1], b'event: idle\ndata: {}\n\n')
+        self.assertTrue(all(part == b': keepalive\n\n' for part in rest[:-1]))
+        self.assertEqual(get_broker().dispatch([user_channel(self.user.id)], {}), 0)
+
+    async def test_requires_token(self):
+        response = await self.async_client.get(self.url)
+        self.assertEqual(response.status_code, 401)
+
+        response = await self.async_client.get(self.url, headers={'Authorization': 'Token invalid'})
+        self.assertEqual(response.status_code, 401)
+
+    def test_not_served_over_wsgi(self):
+        response = self.client.get(self.url, headers={'Authorization': f'Token {self.token.key}'})
+        self.assertEqual(response.status_code, 501)
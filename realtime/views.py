@@ -0,0 +1,85 @@
+"""
+Server-Sent Events stream of the authenticated user's events.
+
+The stream only works on the ASGI workers (GUNICORN_PRESET=asgi), where an
+idle client holds a connection and no thread. Events missed while
+disconnected are not replayed: every (re)connection starts with a 'ready'
+event after which the client refetches its state once. A stream that
+delivered nothing for REALTIME_IDLE_STREAM_SECONDS ends with an 'idle'
+event; the client reconnects on the next user activity, not after
+`retry`, so idle apps do not keep an auto-stopped machine running.
+"""
+import asyncio
+import json
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import require_GET
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.exceptions import AuthenticationFailed
+from monitoring.metrics import REALTIME_STREAMS_OPEN
+from .brokers import get_broker
+from .events import user_channel
+
+
+def authenticate(request):
+    """User of the request's token, or None"""
+    try:
+        result = TokenAuthentication().authenticate(request)
+    except AuthenticationFailed:
+        return None
+    return result[0] if result else None
+
+
+def format_event(event_type, data):
+    return f"event: {event_type}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n".encode()
+
+
+async def stream(user_id):
+    """
+    SSE frames for user_id until the client leaves, REALTIME_MAX_STREAM_SECONDS
+    pass, or no event came for REALTIME_IDLE_STREAM_SECONDS. An idle stream
+    ends with an 'idle' event.
+    """
+    # Subscribed here, on the loop that consumes the response
+    subscription = get_broker().subscribe([user_channel(user_id)])
+    REALTIME_STREAMS_OPEN.inc()
+    try:
+        yield f'retry: {settings.REALTIME_RETRY_MS}\n'.encode() + format_event('ready', {})
+        loop = asyncio.get_running_loop()
+        # Bounded so workers can be recycled; the client reconnects after `retry`
+        deadline = loop.time() + settings.REALTIME_MAX_STREAM_SECONDS
+        idle_deadline = loop.time() + settings.REALTIME_IDLE_STREAM_SECONDS
+        while (remaining := min(deadline, idle_deadline) - loop.time()) > 0:
+            event = await subscription.get(min(settings.REALTIME_KEEPALIVE_SECONDS, remaining))
+            if event is None:
+                # Keeps proxies from closing an idle connection
+                yield b': keepalive\n\n'
+            else:
+                idle_deadline = loop.time() + settings.REALTIME_IDLE_STREAM_SECONDS
+                yield format_event(event['type'], event['data'])
+        if idle_deadline < deadline:
+            # Clients reconnect on the next user activity rather than after
+            # `retry`, so an idle app stops holding the machine awake
+            yield format_event('idle', {})
+    finally:
+        subscription.close()
+        REALTIME_STREAMS_OPEN.dec()
+
+
+@require_GET
+async def events(request):
+    """Stream of friend request, invitation and leaderboard events"""
+    if not isinstance(request, ASGIRequest):
+        return JsonResponse({'error': 'Event streams are only served by the ASGI workers'}, status=501)
+
+    user = await sync_to_async(authenticate)(request)
+    if user is None:
+        return JsonResponse({'detail': 'Authentication credentials were not provided.'}, status=401)
+
+    response = StreamingHttpResponse(stream(user.id), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Stop buffering reverse proxies from holding back events
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from screentime.services import ScreenTimeService
+
+
+class Command(BaseCommand):
+    help = "Recompute the weekly and monthly screen-time rollups and the usage summaries from the daily entries"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', nargs='+', type=int, help="Only these user ids")
+        parser.add_argument('--batch-size', type=int, default=500, help="Users rebuilt per transaction")
+
+    def handle(self, *args, **options):
+        written = ScreenTimeService.rebuild_rollups(options['users'], batch_size=options['batch_size'])
+        summaries = ScreenTimeService.rebuild_summaries(options['users'], batch_size=options['batch_size'])
+        self.stdout.write(f"Wrote {written} rollups and {summaries} usage summaries")
@@ -0,0 +1,27 @@
+# Generated by Django 5.2 on 2026-10-19 18:38
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('screentime', '0001_initial'),
+        ('users', '0007_profile_avatar_urls'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserUsageSummary',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='usage_summary', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('window_end', models.DateField()),
+                ('total_minutes', models.FloatField(default=0)),
+                ('days', models.PositiveSmallIntegerField(default=0)),
+                ('average_minutes', models.FloatField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
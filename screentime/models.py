@@ -0,0 +1,60 @@
+from django.conf import settings
+from django.db import models
+
+
+class ScreenTimeEntry(models.Model):
+    """A user's screen time for one day; a later submission for the day replaces it"""
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='screen_time_entries')
+    date = models.DateField()
+    minutes = models.FloatField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('user', 'date')
+
+    def __str__(self):
+        return f"{self.user_id} on {self.date}: {self.minutes} min"
+
+
+class ScreenTimeRollup(models.Model):
+    """
+    Sum of a user's daily entries over a week (starting Monday) or a month,
+    kept up to date by ScreenTimeService.record and rebuilt by
+    rebuild_screen_time_rollups.
+    """
+    PERIOD_CHOICES = (
+        ('week', 'Week'),
+        ('month', 'Month'),
+    )
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='+')
+    period = models.CharField(max_length=5, choices=PERIOD_CHOICES)
+    start = models.DateField()
+    total_minutes = models.FloatField(default=0)
+    # Days of the period with an entry
+    days = models.PositiveSmallIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('user', 'period', 'start')
+
+    def __str__(self):
+        return f"{self.user_id} {self.period} of {self.start}: {self.total_minutes} min"
+
+
+class UserUsageSummary(models.Model):
+    """
+    A user's average daily screen time over the 7 days ending on their
+    latest entry (window_end), counting only days with an entry. Kept up to
+    date by ScreenTimeService.record; the friends leaderboard reads it.
+    """
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, primary_key=True, related_name='usage_summary'
+    )
+    window_end = models.DateField()
+    total_minutes = models.FloatField(default=0)
+    days = models.PositiveSmallIntegerField(default=0)
+    average_minutes = models.FloatField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.user_id}: {self.average_minutes} min/day to {self.window_end}"
@@ -0,0 +1,24 @@
+from rest_framework import serializers
+from users.serializers import ProfileSerializer
+from .models import UserUsageSummary
+
+
+class ScreenTimePeriodSerializer(serializers.Serializer):
+    """A day, week or month of a user's screen-time history"""
+    start = serializers.DateField()
+    total_minutes = serializers.FloatField()
+    days = serializers.IntegerField()
+    average_minutes = serializers.SerializerMethodField()
+
+    def get_average_minutes(self, obj):
+        return obj['total_minutes'] / obj['days'] if obj['days'] else None
+
+
+class LeaderboardEntrySerializer(serializers.ModelSerializer):
+    """A row of the friends leaderboard; position is set by ScreenTimeService.get_friends_leaderboard"""
+    user = ProfileSerializer(source='user.profile', read_only=True)
+    position = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = UserUsageSummary
+        fields = ['position', 'user', 'average_minutes', 'days', 'window_end']
@@ -0,0 +1,185 @@
+from datetime import timedelta
+from django.db import transaction
+from django.db.models import Count, F, Max, Q, Sum
+from django.db.models.functions import TruncMonth, TruncWeek
+from django.utils import timezone
+from friendships.models import FriendList
+from monitoring.metrics import instrument_service
+from .models import ScreenTimeEntry, ScreenTimeRollup, UserUsageSummary
+
+# Rollup period -> start of the period holding a date
+PERIOD_STARTS = {
+    'week': lambda date: date - timedelta(days=date.weekday()),
+    'month': lambda date: date.replace(day=1),
+}
+# The same truncation done by the database
+TRUNCATIONS = {
+    'week': TruncWeek,
+    'month': TruncMonth,
+}
+# Days averaged by UserUsageSummary
+SUMMARY_DAYS = 7
+
+@instrument_service
+class ScreenTimeService:
+
+    @staticmethod
+    def record(user, date, minutes):
+        """
+        Store minutes as the user's screen time on date and move the week
+        and month rollups and the usage summary by the difference, in a
+        handful of queries.
+        """
+        with transaction.atomic():
+            entry, created = ScreenTimeEntry.objects.select_for_update().get_or_create(
+                user=user, date=date, defaults={'minutes': minutes}
+            )
+            delta, new_day = (minutes, 1) if created else (minutes - entry.minutes, 0)
+            if not created:
+                entry.minutes = minutes
+                entry.save(update_fields=['minutes', 'updated_at'])
+
+            for period, period_start in PERIOD_STARTS.items():
+                start = period_start(date)
+                updated = ScreenTimeRollup.objects.filter(user=user, period=period, start=start).update(
+                    total_minutes=F('total_minutes') + delta, days=F('days') + new_day
+                )
+                if not updated:
+                    # First entry of the period, or rollups not built yet
+                    ScreenTimeService._rebuild_rollup(user, period, start)
+
+            updated = UserUsageSummary.objects.filter(
+                user=user, window_end__gte=date, window_end__lt=date + timedelta(days=SUMMARY_DAYS)
+            ).update(
+                total_minutes=F('total_minutes') + delta,
+                days=F('days') + new_day,
+                average_minutes=(F('total_minutes') + delta) / (F('days') + new_day),
+            )
+            if not updated:
+                # The window moves to a newer day, or there is no summary yet
+                ScreenTimeService._rebuild_summary(user)
+        return entry
+
+    @staticmethod
+    def _rebuild_rollup(user, period, start):
+        period_start = PERIOD_STARTS[period]
+        end = period_start(start + timedelta(days=31 if period == 'month' else 7))
+        totals = ScreenTimeEntry.objects.filter(user=user, date__gte=start, date__lt=end).aggregate(
+            total_minutes=Sum('minutes'), days=Count('id')
+        )
+        ScreenTimeRollup.objects.update_or_create(
+            user=user, period=period, start=start,
+            defaults={'total_minutes': totals['total_minutes'] or 0, 'days': totals['days']},
+        )
+
+    @staticmethod
+    def _rebuild_summary(user):
+        window_end = ScreenTimeEntry.objects.filter(user=user).aggregate(last=Max('date'))['last']
+        totals = ScreenTimeEntry.objects.filter(
+            user=user, date__gt=window_end - timedelta(days=SUMMARY_DAYS), date__lte=window_end
+        ).aggregate(total_minutes=Sum('minutes'), days=Count('id'))
+        UserUsageSummary.objects.update_or_create(user=user, defaults={
+            'window_end': window_end,
+            'total_minutes': totals['total_minutes'],
+            'days': totals['days'],
+            'average_minutes': totals['total_minutes'] / totals['days'],
+        })
+
+    @staticmethod
+    def get_history(user, period, start, end):
+        """
+        The user's screen time from start to end (dates, inclusive) per day,
+        week or month, oldest first, as dicts with start, total_minutes and
+        days. Weeks and months are read from the rollups.
+        """
+        if period == 'day':
+            return [
+                {'start': date, 'total_minutes': minutes, 'days': 1}
+                for date, minutes in ScreenTimeEntry.objects.filter(
+                    user=user, date__gte=start, date__lte=end
+                ).order_by('date').values_list('date', 'minutes')
+            ]
+        period_start = PERIOD_STARTS[period]
+        return list(ScreenTimeRollup.objects.filter(
+            user=user, period=period, start__gte=period_start(start), start__lte=end
+        ).order_by('start').values('start', 'total_minutes', 'days'))
+
+    @staticmethod
+    def rebuild_rollups(user_ids=None, batch_size=500):
+        """
+        Recompute every rollup from the daily entries, batch_size users per
+        transaction (all users with entries, or user_ids). Returns the
+        number of rollup rows written.
+        """
+        written = 0
+        for batch in ScreenTimeService._batches(user_ids, batch_size):
+            with transaction.atomic():
+                rollups = []
+                for period, trunc in TRUNCATIONS.items():
+                    rollups.extend(
+                        ScreenTimeRollup(user_id=row['user_id'], period=period, start=row['start'],
+                                         total_minutes=row['total_minutes'], days=row['days'])
+                        for row in ScreenTimeEntry.objects.filter(user_id__in=batch).annotate(
+                            start=trunc('date')
+                        ).values('user_id', 'start').annotate(
+                            total_minutes=Sum('minutes'), days=Count('id')
+                        ).order_by()
+                    )
+                ScreenTimeRollup.objects.filter(user_id__in=batch).delete()
+                ScreenTimeRollup.objects.bulk_create(rollups)
+            written += len(rollups)
+        return written
+
+    @staticmethod
+    def rebuild_summaries(user_ids=None, batch_size=500):
+        """
+        Recompute the usage summaries from the daily entries, batch_size
+        users per transaction. Returns the number of summaries written.
+        """
+        written = 0
+        for batch in ScreenTimeService._batches(user_ids, batch_size):
+            with transaction.atomic():
+                window_ends = dict(ScreenTimeEntry.objects.filter(user_id__in=batch).values_list(
+                    'user_id'
+                ).annotate(last=Max('date')).order_by())
+                windows = Q()
+                for user_id, window_end in window_ends.items():
+                    windows |= Q(user_id=user_id, date__gt=window_end - timedelta(days=SUMMARY_DAYS))
+                summaries = [
+                    UserUsageSummary(user_id=row['user_id'], window_end=window_ends[row['user_id']],
+                                     total_minutes=row['total_minutes'], days=row['days'],
+                                     average_minutes=row['total_minutes'] / row['days'])
+                    for row in ScreenTimeEntry.objects.filter(windows).values('user_id').annotate(
+                        total_minutes=Sum('minutes'), days=Count('id')
+                    ).order_by()
+                ] if window_ends else []
+                UserUsageSummary.objects.filter(user_id__in=batch).delete()
+                UserUsageSummary.objects.bulk_create(summaries)
+            written += len(summaries)
+        return written
+
+    @staticmethod
+    def _batches(user_ids, batch_size):
+        """user_ids (default: every user with entries) in lists of batch_size"""
+        if user_ids is None:
+            user_ids = ScreenTimeEntry.objects.values_list('user_id', flat=True).distinct().order_by('user_id')
+        user_ids = list(user_ids)
+        for offset in range(0, len(user_ids), batch_size):
+            yield user_ids[offset:offset + batch_size]
+
+    @staticmethod
+    def get_friends_leaderboard(user, limit):
+        """
+        The usage summaries of user and their friends, least screen time
+        first, at most limit of them, each with a 1-based position. Only
+        summaries with an entry in the last SUMMARY_DAYS days take part.
+        One query: the friend ids come from a subquery on the friend list.
+        """
+        friend_ids = FriendList.friends.through.objects.filter(friendlist__user=user).values('user_id')
+        since = timezone.now().date() - timedelta(days=SUMMARY_DAYS - 1)
+        summaries = list(UserUsageSummary.objects.filter(
+            Q(user__in=friend_ids) | Q(user=user), window_end__gte=since
+        ).select_related('user__profile').order_by('average_minutes', 'user_id')[:limit])
+        for position, summary in enumerate(summaries, 1):
+            summary.position = position
+        return summaries
@@ -0,0 +1,142 @@
+from datetime import date, timedelta
+from io import StringIO
+from django.core.management import call_command
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase
+from friendships.models import FriendList
+from monitoring.testing import QueryBudgetMixin, make_users
+from users.models import User, Profile
+from .models import ScreenTimeEntry, ScreenTimeRollup, UserUsageSummary
+from .services import ScreenTimeService
+
+
+class ScreenTimeHistoryTest(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser1', email='test1@example.com', password='testpassword123')
+        self.client.force_authenticate(self.user)
+        self.url = reverse('screen_time_history')
+
+    def rollups(self, period):
+        return list(ScreenTimeRollup.objects.filter(user=self.user, period=period).order_by('start').values_list(
+            'start', 'total_minutes', 'days'
+        ))
+
+    def test_submissions_maintain_rollups(self):
+        # Wednesday 2026-09-30 and Thursday 2026-10-01: one week, two months
+        self.client.post(reverse('update_screen_time'), {'screen_time_minutes': 120, 'date': '2026-09-30'}, format='json')
+        self.client.post(reverse('update_screen_time'), {'screen_time_minutes': 60, 'date': '2026-10-01'}, format='json')
+        # A new total for a day replaces the earlier one
+        self.client.post(reverse('update_screen_time'), {'screen_time_minutes': 90, 'date': '2026-10-01'}, format='json')
+
+        self.assertEqual(ScreenTimeEntry.objects.filter(user=self.user).count(), 2)
+        self.assertEqual(self.rollups('week'), [(date(2026, 9, 28), 210, 2)])
+        self.assertEqual(self.rollups('month'), [(date(2026, 9, 1), 120, 1), (date(2026, 10, 1), 90, 1)])
+
+    def test_missing_rollups_are_built_from_the_entries(self):
+        ScreenTimeEntry.objects.create(user=self.user, date=date(2026, 10, 5), minutes=30)
+        ScreenTimeService.record(self.user, date(2026, 10, 6), 50)
+
+        self.assertEqual(self.rollups('week'), [(date(2026, 10, 5), 80, 2)])
+        self.assertEqual(self.rollups('month'), [(date(2026, 10, 1), 80, 2)])
+
+    def test_history(self):
+        start = date(2025, 11, 1)
+        for day in range(365):
+            ScreenTimeService.record(self.user, start + timedelta(days=day), 60 + day % 7)
+
+        response = self.client.get(self.url, {'period': 'month', 'from': '2025-11-01', 'to': '2026-10-31'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        months = response.data['entries']
+        self.assertEqual(len(months), 12)
+        self.assertEqual(months[0]['start'], '2025-11-01')
+        self.assertEqual(months[0]['days'], 30)
+        self.assertAlmostEqual(sum(month['total_minutes'] for month in months), sum(60 + day % 7 for day in range(365)))
+
+        # A year of weeks is one query on the rollups
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url, {'period': 'week', 'from': '2025-11-01', 'to': '2026-10-31'})
+        self.assertEqual(len(response.data['entries']), 53)
+
+        response = self.client.get(self.url, {'from': '2026-10-01', 'to': '2026-10-07'})
+        self.assertEqual([entry['average_minutes'] for entry in response.data['entries']], [65, 66, 60, 61, 62, 63, 64])
+
+    def test_invalid_requests(self):
+        for params in [{'period': 'year'}, {'from': 'yesterday'}, {'from': '2026-10-02', 'to': '2026-10-01'},
+                       {'from': '2020-01-01', 'to': '2026-01-01'}]:
+            self.assertEqual(self.client.get(self.url, params).status_code, status.HTTP_400_BAD_REQUEST, params)
+
+    def test_rebuild_command(self):
+        for day in range(40):
+            ScreenTimeService.record(self.user, date(2026, 9, 1) + timedelta(days=day), 30)
+        expected = self.rollups('week'), self.rollups('month')
+        ScreenTimeRollup.objects.update(total_minutes=0, days=0)
+
+        out = StringIO()
+        call_command('rebuild_screen_time_rollups', stdout=out)
+        self.assertIn("Wrote 8 rollups and 1 usage summaries", out.getvalue())
+        self.assertEqual((self.rollups('week'), self.rollups('month')), expected)
+
+
+class FriendsLeaderboardTest(QueryBudgetMixin, APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser1', email='test1@example.com', password='testpassword123')
+        Profile.objects.create(user=self.user, name='Testuser1')
+        self.client.force_authenticate(self.user)
+        self.url = reverse('friends_leaderboard')
+        self.today = timezone.now().date()
+
+    def summary(self, user):
+        summary = UserUsageSummary.objects.get(user=user)
+        return summary.window_end, summary.total_minutes, summary.days, summary.average_minutes
+
+    def test_summary_follows_the_latest_week(self):
+        day = date(2026, 10, 1)
+        for offset, minutes in enumerate([10, 20, 30, 40, 50, 60, 70]):
+            ScreenTimeService.record(self.user, day + timedelta(days=offset), minutes)
+        self.assertEqual(self.summary(self.user), (date(2026, 10, 7), 280, 7, 40))
+
+        # Replacing a day of the window, then one before it
+        ScreenTimeService.record(self.user, day, 80)
+        ScreenTimeService.record(self.user, day - timedelta(days=1), 500)
+        self.assertEqual(self.summary(self.user), (date(2026, 10, 7), 350, 7, 50))
+
+        # A later day moves the window, skipping the missing days
+        ScreenTimeService.record(self.user, date(2026, 10, 10), 10)
+        self.assertEqual(self.summary(self.user), (date(2026, 10, 10), 230, 5, 46))
+
+        expected = self.summary(self.user)
+        UserUsageSummary.objects.all().delete()
+        self.assertEqual(ScreenTimeService.rebuild_summaries(), 1)
+        self.assertEqual(self.summary(self.user), expected)
+
+    def test_leaderboard(self):
+        friends = make_users(3, 'friend')
+        stranger, inactive = make_users(2, 'other')
+        FriendList.objects.create(user=self.user).friends.add(*friends, inactive)
+        for user, minutes in zip([self.user, *friends, stranger], [90, 120, 30, 60, 10]):
+            ScreenTimeService.record(user, self.today, minutes)
+        ScreenTimeService.record(inactive, self.today - timedelta(days=7), 5)
+
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [(row['position'], row['user']['name'], row['average_minutes']) for row in response.data],
+            [(1, 'friend1', 30), (2, 'friend2', 60), (3, 'Testuser1', 90), (4, 'friend0', 120)],
+        )
+
+        self.client.force_authenticate(None)
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_query_budget(self):
+        def seed(size):
+            friends = make_users(size, 'friend')
+            FriendList.objects.create(user=self.user).friends.add(*friends)
+            UserUsageSummary.objects.bulk_create([
+                UserUsageSummary(user=friend, window_end=self.today, total_minutes=i, days=1, average_minutes=i)
+                for i, friend in enumerate(friends)
+            ])
+        self.assertConstantQueries(seed, lambda state: self.client.get(self.url), max_queries=1)
@@ -0,0 +1,62 @@
+from datetime import date, timedelta
+from django.conf import settings
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.decorators import api_view, authentication_classes, permission_classes
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from .serializers import LeaderboardEntrySerializer, ScreenTimePeriodSerializer
+from .services import ScreenTimeService
+
+# Period -> (days shown by default, longest range accepted in days)
+HISTORY_RANGES = {
+    'day': (30, 366),
+    'week': (7 * 26, 366 * 3),
+    'month': (366, 366 * 10),
+}
+
+@api_view(['GET'])
+@authentication_classes([TokenAuthentication])
+@permission_classes([IsAuthenticated])
+def screen_time_history(request):
+    """
+    The user's screen time per ?period= (day, week or month) between ?from=
+    and ?to= (ISO dates, both optional), oldest first.
+    """
+    period = request.query_params.get('period', 'day')
+    if period not in HISTORY_RANGES:
+        return Response({"error": "Period must be day, week or month"}, status=status.HTTP_400_BAD_REQUEST)
+    default_days, max_days = HISTORY_RANGES[period]
+
+    try:
+        end = date.fromisoformat(request.query_params.get('to', timezone.now().date().isoformat()))
+        start = request.query_params.get('from')
+        start = date.fromisoformat(start) if start else end - timedelta(days=default_days - 1)
+    except ValueError:
+        return Response(
+            {"error": "Invalid date format. Use ISO format (YYYY-MM-DD)"}, status=status.HTTP_400_BAD_REQUEST
+        )
+    if start > end:
+        return Response({"error": "from must not be after to"}, status=status.HTTP_400_BAD_REQUEST)
+    if (end - start).days >= max_days:
+        return Response(
+            {"error": f"At most {max_days} days of {period} history per request"}, status=status.HTTP_400_BAD_REQUEST
+        )
+
+    history = ScreenTimeService.get_history(request.user, period, start, end)
+    return Response({
+        'period': period,
+        'from': start,
+        'to': end,
+        'entries': ScreenTimePeriodSerializer(history, many=True).data,
+    }, status=status.HTTP_200_OK)
+
+@api_view(['GET'])
+@authentication_classes([TokenAuthentication])
+@permission_classes([IsAuthenticated])
+def friends_leaderboard(request):
+    """The user and their friends ranked by average daily screen time over their last 7 days"""
+    summaries = ScreenTimeService.get_friends_leaderboard(request.user, settings.FRIENDS_LEADERBOARD_SIZE)
+    context = {'request': request, 'avatar_context': 'leaderboard'}
+    return Response(LeaderboardEntrySerializer(summaries, many=True, context=context).data, status=status.HTTP_200_OK)
@@ -0,0 +1,12 @@
+from django.contrib import admin
+from .models import Change, Compaction
+
+@admin.register(Change)
+class ChangeAdmin(admin.ModelAdmin):
+    list_display = ['id', 'user', 'entity', 'object_id', 'deleted', 'created_at']
+    list_filter = ['entity', 'deleted']
+    raw_id_fields = ['user']
+
+@admin.register(Compaction)
+class CompactionAdmin(admin.ModelAdmin):
+    list_display = ['created_at', 'sequence', 'superseded_removed', 'expired_removed']
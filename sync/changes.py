@@ -0,0 +1,59 @@
+"""
+Writing the sync change log.
+
+The service layer calls record() next to every write that changes what a
+user sees in one of the synced lists, inside the same transaction, so the
+log never misses a committed change and rolled-back writes leave no entry.
+"""
+from django.db.models import Q
+from .models import Change
+
+
+def record(entity, rows, deleted=False):
+    """Append one entry per (user_id, object_id) in rows with a single INSERT"""
+    Change.objects.bulk_create([
+        Change(user_id=user_id, entity=entity, object_id=object_id, deleted=deleted)
+        for user_id, object_id in rows
+    ])
+
+
+def followers(user_id):
+    """Ids of the users who have user_id in their friend list"""
+    from friendships.models import FriendList
+    return FriendList.friends.through.objects.filter(user_id=user_id).values_list('friendlist__user_id', flat=True)
+
+
+def record_profile_change(user_id):
+    """The user's profile is part of their friends' friend lists"""
+    record('friends', [(follower_id, user_id) for follower_id in followers(user_id)])
+
+
+def record_user_deletion(user):
+    """Tombstones for the rows that disappear from other users' lists when user is deleted"""
+    from competitions.models import ArchivedParticipant, CompetitionInvitation, Participant
+    from friendships.models import FriendRequest
+
+    record('friends', [(follower_id, user.id) for follower_id in followers(user.id)], deleted=True)
+    record('friend_requests', [
+        (sender_id if receiver_id == user.id else receiver_id, request_id)
+        for request_id, sender_id, receiver_id in FriendRequest.objects.filter(
+            Q(sender=user) | Q(receiver=user), status='pending'
+        ).values_list('id', 'sender_id', 'receiver_id')
+    ], deleted=True)
+    record('competition_invitations', CompetitionInvitation.objects.filter(
+        sender=user, status='pending'
+    ).values_list('receiver_id', 'id'), deleted=True)
+
+    # Competitions the user created go away; the others lose a participant
+    removed, shrunk = [], []
+    members = list(Participant.objects.filter(
+        competition__participant__user=user
+    ).exclude(user=user).values_list('user_id', 'competition_id', 'competition__creator_id'))
+    # Closed competitions keep their participant count, but go away with their creator
+    members += ArchivedParticipant.objects.filter(
+        competition__archived_participants__user=user, competition__creator=user
+    ).exclude(user=user).values_list('user_id', 'competition_id', 'competition__creator_id')
+    for user_id, competition_id, creator_id in members:
+        (removed if creator_id == user.id else shrunk).append((user_id, competition_id))
+    record('competitions', removed, deleted=True)
+    record('competitions', shrunk)
@@ -0,0 +1,33 @@
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from sync.services import SyncService
+
+
+class Command(BaseCommand):
+    help = "Compact the sync change log: drop superseded and expired entries"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--retention-days', type=float, default=settings.SYNC_RETENTION_DAYS,
+            help="Entries older than this are dropped; older cursors get a full snapshot"
+        )
+        parser.add_argument('--batch-size', type=int, default=1000, help="Entries deleted per statement")
+        parser.add_argument('--loop', action='store_true', help="Keep compacting periodically")
+        parser.add_argument('--interval', type=float, default=3600.0, help="Seconds between runs with --loop")
+
+    def handle(self, *args, **options):
+        retention = timedelta(days=options['retention_days'])
+        while True:
+            compaction = SyncService.compact(retention, batch_size=options['batch_size'])
+            if compaction is None:
+                self.stdout.write("Nothing to compact")
+            else:
+                self.stdout.write(
+                    f"Removed {compaction.superseded_removed} superseded and "
+                    f"{compaction.expired_removed} expired entries (horizon #{compaction.sequence})"
+                )
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
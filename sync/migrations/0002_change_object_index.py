@@ -0,0 +1,19 @@
+# Generated by Django 5.2 on 2026-10-19 19:00
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sync', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='change',
+            index=models.Index(fields=['user', 'entity', 'object_id', 'id'], name='change_object'),
+        ),
+    ]
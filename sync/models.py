@@ -0,0 +1,49 @@
+from django.conf import settings
+from django.db import models
+
+class Change(models.Model):
+    """
+    One entry of a user's sync feed: an object of `entity` was created or
+    changed (deleted=False), or removed from the user's view (a tombstone).
+    The id is the feed's sequence number. Rows only point at objects; the
+    sync endpoint reads their current state.
+    """
+    ENTITY_CHOICES = (
+        ('friends', 'Friends'),
+        ('friend_requests', 'Friend requests'),
+        ('competition_invitations', 'Competition invitations'),
+        ('competitions', 'Competitions'),
+    )
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='+')
+    entity = models.CharField(max_length=32, choices=ENTITY_CHOICES)
+    # User id for friends, primary key otherwise
+    object_id = models.BigIntegerField()
+    deleted = models.BooleanField(default=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'id'], name='change_user_sequence'),
+            # Later entries for the same object (SyncService.compact)
+            models.Index(fields=['user', 'entity', 'object_id', 'id'], name='change_object'),
+        ]
+
+    def __str__(self):
+        return f"#{self.id} {'delete' if self.deleted else 'upsert'} {self.entity} {self.object_id} for user {self.user_id}"
+
+class Compaction(models.Model):
+    """
+    A compaction run. Entries up to `sequence` may have been dropped, so
+    older cursors get a full snapshot instead of a delta.
+    """
+    sequence = models.BigIntegerField()
+    superseded_removed = models.PositiveIntegerField(default=0)
+    expired_removed = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"Compaction up to #{self.sequence}"
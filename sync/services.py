@@ -0,0 +1,136 @@
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, Max, OuterRef
+from django.utils import timezone
+from competitions.services import CompetitionService
+from friendships.services import FriendshipService
+from monitoring.metrics import instrument_service
+from .models import Change, Compaction
+
+# Entity -> (the user's current rows, field matching Change.object_id)
+FEEDS = {
+    'friends': (FriendshipService.get_friend_profiles, 'user_id'),
+    'friend_requests': (FriendshipService.get_pending_requests, 'id'),
+    'competition_invitations': (CompetitionService.get_user_competition_invitations, 'id'),
+    'competitions': (CompetitionService.get_competitions_for_user, 'id'),
+}
+
+@instrument_service
+class SyncService:
+
+    @staticmethod
+    def get_changes(user, cursor, page_size):
+        """
+        What changed for user since cursor, as a dict with 'cursor' (pass it
+        next time), 'reset', 'has_more', 'upserted' ({entity: rows in their
+        current state}) and 'deleted' ({entity: [object ids]}).
+
+        Without a usable cursor (none given, or older than the last
+        compaction) every entity is returned in full and 'reset' is True:
+        the client replaces its lists instead of patching them.
+        """
+        # Entries up to top are read now, but the cursor handed out stops at
+        # `safe`: ids are allocated at insert, so an entry below top may still
+        # commit after this read. With transactions shorter than
+        # SYNC_CURSOR_LAG_SECONDS, every id up to the newest entry older than
+        # that is committed. Newer entries are sent again next time, which
+        # clients apply idempotently. On SQLite writers are serialized, ids
+        # are in commit order and the lag is 0.
+        top = Change.objects.aggregate(top=Max('id'))['top'] or 0
+        safe = top
+        lag = settings.SYNC_CURSOR_LAG_SECONDS
+        if lag:
+            safe = Change.objects.filter(
+                created_at__lte=timezone.now() - timedelta(seconds=lag)
+            ).order_by('-id').values_list('id', flat=True).first() or 0
+        horizon = Compaction.objects.aggregate(horizon=Max('sequence'))['horizon'] or 0
+        if cursor is None or cursor < horizon:
+            return {
+                'cursor': safe,
+                'reset': True,
+                'has_more': False,
+                'upserted': {entity: rows(user) for entity, (rows, key) in FEEDS.items()},
+                'deleted': {entity: [] for entity in FEEDS},
+            }
+
+        entries = list(Change.objects.filter(
+            user=user, id__gt=cursor, id__lte=top
+        ).order_by('id').values_list('id', 'entity', 'object_id', 'deleted')[:page_size + 1])
+        has_more = len(entries) > page_size
+        entries = entries[:page_size]
+        next_cursor = entries[-1][0] if has_more else top
+        if next_cursor > safe:
+            # The rest comes once it is safe to move past; a cursor from
+            # ahead of a lagging replica is kept as it is
+            next_cursor, has_more = max(cursor, safe), False
+
+        # The last entry of each object wins
+        latest = {}
+        for sequence, entity, object_id, deleted in entries:
+            latest[entity, object_id] = deleted
+        upserted = {entity: [] for entity in FEEDS}
+        deleted = {entity: [] for entity in FEEDS}
+        for (entity, object_id), is_deleted in latest.items():
+            (deleted if is_deleted else upserted)[entity].append(object_id)
+
+        for entity, (rows, key) in FEEDS.items():
+            if not upserted[entity]:
+                continue
+            ids, upserted[entity] = upserted[entity], list(rows(user).filter(**{f'{key}__in': upserted[entity]}))
+            # Changed into something the user no longer sees, e.g. an answered invitation
+            found = {getattr(obj, key) for obj in upserted[entity]}
+            deleted[entity].extend(object_id for object_id in ids if object_id not in found)
+
+        return {
+            'cursor': next_cursor,
+            'reset': False,
+            'has_more': has_more,
+            'upserted': upserted,
+            'deleted': deleted,
+        }
+
+    @staticmethod
+    def compact(retention, batch_size=1000):
+        """
+        Shrink the change log: drop entries superseded by a later entry for
+        the same object, then every entry older than retention (a timedelta).
+        Deletes run in batches of batch_size, one transaction each.
+        Returns the Compaction recorded, or None if nothing was removed.
+        """
+        newer = Change.objects.filter(
+            user_id=OuterRef('user_id'),
+            entity=OuterRef('entity'),
+            object_id=OuterRef('object_id'),
+            id__gt=OuterRef('id'),
+        )
+        superseded = SyncService._delete_in_batches(Change.objects.filter(Exists(newer)), batch_size)
+
+        cutoff = timezone.now() - retention
+        sequence = Change.objects.filter(created_at__lt=cutoff).aggregate(sequence=Max('id'))['sequence']
+        expired = 0
+        if sequence is not None:
+            # Recorded first so no cursor is trusted past deleted entries
+            compaction = Compaction.objects.create(sequence=sequence)
+            expired = SyncService._delete_in_batches(Change.objects.filter(id__lte=sequence), batch_size)
+        elif superseded:
+            compaction = Compaction.objects.create(sequence=0)
+        else:
+            return None
+        compaction.superseded_removed = superseded
+        compaction.expired_removed = expired
+        compaction.save(update_fields=['superseded_removed', 'expired_removed'])
+        return compaction
+
+    @staticmethod
+    def _delete_in_batches(queryset, batch_size):
+        # Each batch continues after the last id of the previous one
+        removed = last = 0
+        while True:
+            with transaction.atomic():
+                ids = list(queryset.filter(id__gt=last).order_by('id').values_list('id', flat=True)[:batch_size])
+                if not ids:
+                    return removed
+                removed += Change.objects.filter(id__in=ids).delete()[0]
+            last = ids[-1]
+
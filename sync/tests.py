@@ -0,0 +1,244 @@
+from datetime import timedelta
+from io import StringIO
+from django.core.management import call_command
+from django.test import override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APITestCase
+from competitions.models import Competition, Participant, CompetitionInvitation
+from competitions.services import CompetitionService
+from friendships.models import FriendList
+from monitoring.testing import QueryBudgetMixin, QueryPlanMixin, make_users
+from users.models import User, Profile
+from . import changes
+from .models import Change, Compaction
+from .services import SyncService
+
+
+class SyncTestMixin:
+
+    def create_user(self, username):
+        user = User.objects.create_user(username=username, email=f'{username}@example.com', password='testpassword123')
+        Profile.objects.create(user=user, name=username.title())
+        return user
+
+    def authenticate(self, user):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {Token.objects.get_or_create(user=user)[0].key}')
+
+    def sync(self, cursor=None):
+        response = self.client.get(self.url, {} if cursor is None else {'cursor': cursor})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data
+
+
+class SyncAPITest(SyncTestMixin, APITestCase):
+
+    def setUp(self):
+        self.user1 = self.create_user('testuser1')
+        self.user2 = self.create_user('testuser2')
+        self.url = reverse('sync')
+        self.authenticate(self.user1)
+
+    def test_first_sync_returns_everything(self):
+        FriendList.objects.create(user=self.user1).friends.add(self.user2)
+
+        data = self.sync()
+
+        self.assertTrue(data['reset'])
+        self.assertFalse(data['has_more'])
+        self.assertEqual([friend['name'] for friend in data['friends']['upserted']], ['Testuser2'])
+        self.assertEqual(data['competitions'], {'upserted': [], 'deleted': []})
+
+    def test_friend_request_lifecycle(self):
+        cursor = self.sync()['cursor']
+
+        self.client.post(reverse('send_friend_request'), {'username': 'testuser2'}, format='json')
+        data = self.sync(cursor)
+        self.assertFalse(data['reset'])
+        [friend_request] = data['friend_requests']['upserted']
+        self.assertEqual(friend_request['receiver']['username'], 'testuser2')
+
+        # The receiver sees the same request in their own feed
+        self.authenticate(self.user2)
+        self.assertEqual(self.sync(cursor)['friend_requests']['upserted'][0]['id'], friend_request['id'])
+        self.client.post(
+            reverse('handle_friend_request'), {'request_id': friend_request['id'], 'action': 'accept'}, format='json'
+        )
+
+        self.authenticate(self.user1)
+        data = self.sync(data['cursor'])
+        self.assertEqual(data['friend_requests'], {'upserted': [], 'deleted': [friend_request['id']]})
+        self.assertEqual([friend['name'] for friend in data['friends']['upserted']], ['Testuser2'])
+
+        self.client.post(reverse('delete_friend'), {'friend_id': self.user2.id}, format='json')
+        data = self.sync(data['cursor'])
+        self.assertEqual(data['friends'], {'upserted': [], 'deleted': [self.user2.id]})
+
+        # Nothing new
+        self.assertEqual(self.sync(data['cursor'])['cursor'], data['cursor'])
+
+    def test_competition_changes(self):
+        FriendList.objects.create(user=self.user1).friends.add(self.user2)
+        now = timezone.now()
+        cursor = self.sync()['cursor']
+
+        competition, results = CompetitionService.create_competition_with_invitees(
+            'Synced', '', now + timedelta(days=1), now + timedelta(days=8), self.user1, ['testuser2']
+        )
+        data = self.sync(cursor)
+        self.assertEqual([row['participant_count'] for row in data['competitions']['upserted']], [1])
+
+        self.authenticate(self.user2)
+        invitation_id = results['testuser2']['invitation'].id
+        data = self.sync(cursor)
+        self.assertEqual([row['id'] for row in data['competition_invitations']['upserted']], [invitation_id])
+        self.assertEqual(data['competitions']['upserted'], [])
+
+        CompetitionService.handle_invitation_response(invitation_id, self.user2, 'accept')
+        data = self.sync(data['cursor'])
+        self.assertEqual(data['competition_invitations'], {'upserted': [], 'deleted': [invitation_id]})
+        self.assertEqual([row['participant_count'] for row in data['competitions']['upserted']], [2])
+
+        self.client.post(reverse('leave_competition', args=[competition.id]))
+        data = self.sync(data['cursor'])
+        self.assertEqual(data['competitions'], {'upserted': [], 'deleted': [competition.id]})
+
+        # The creator's row now counts one participant again
+        self.authenticate(self.user1)
+        data = self.sync(cursor)
+        self.assertEqual([row['participant_count'] for row in data['competitions']['upserted']], [1])
+
+    def test_profile_changes_reach_friends(self):
+        FriendList.objects.create(user=self.user1).friends.add(self.user2)
+        cursor = self.sync()['cursor']
+
+        self.authenticate(self.user2)
+        self.client.put(reverse('update_profile'), {'name': 'Renamed'}, format='multipart')
+
+        self.authenticate(self.user1)
+        data = self.sync(cursor)
+        self.assertEqual([friend['name'] for friend in data['friends']['upserted']], ['Renamed'])
+
+    def test_deleted_user_leaves_tombstones(self):
+        FriendList.objects.create(user=self.user1).friends.add(self.user2)
+        FriendList.objects.create(user=self.user2).friends.add(self.user1)
+        now = timezone.now()
+        competition = CompetitionService.create_competition(
+            'Theirs', '', now + timedelta(days=1), now + timedelta(days=8), self.user2
+        )
+        Participant.objects.create(user=self.user1, competition=competition)
+        cursor = self.sync()['cursor']
+
+        self.authenticate(self.user2)
+        self.client.delete(reverse('delete_user'))
+
+        self.authenticate(self.user1)
+        data = self.sync(cursor)
+        self.assertEqual(data['friends']['deleted'], [self.user2.id])
+        self.assertEqual(data['competitions']['deleted'], [competition.id])
+
+    @override_settings(SYNC_PAGE_SIZE=2)
+    def test_paging(self):
+        cursor = self.sync()['cursor']
+        friends = make_users(5, 'friend')
+        changes.record('friends', [(self.user1.id, friend.id) for friend in friends])
+        # The first sync created the (empty) friend list
+        FriendList.objects.get(user=self.user1).friends.add(*friends)
+
+        received = []
+        data = {'has_more': True, 'cursor': cursor}
+        while data['has_more']:
+            data = self.sync(data['cursor'])
+            received.extend(friend['name'] for friend in data['friends']['upserted'])
+        self.assertEqual(sorted(received), sorted(friend.username for friend in friends))
+
+    def test_compacted_cursor_gets_snapshot(self):
+        cursor = self.sync()['cursor']
+        changes.record('friends', [(self.user2.id, self.user1.id)])
+        Change.objects.filter(user=self.user2).update(created_at=timezone.now() - timedelta(days=40))
+        changes.record('friends', [(self.user1.id, self.user2.id)])
+        changes.record('friends', [(self.user1.id, self.user2.id)], deleted=True)
+
+        out = StringIO()
+        call_command('compact_changes', stdout=out)
+        self.assertIn("Removed 1 superseded and 1 expired entries", out.getvalue())
+        self.assertEqual(list(Change.objects.values_list('user_id', 'deleted')), [(self.user1.id, True)])
+        self.assertEqual(SyncService.compact(timedelta(days=30)), None)
+
+        data = self.sync(cursor)
+        self.assertTrue(data['reset'])
+        self.assertFalse(self.sync(data['cursor'])['reset'])
+        self.assertEqual(Compaction.objects.count(), 1)
+
+    @override_settings(SYNC_CURSOR_LAG_SECONDS=5)
+    def test_cursor_stays_behind_entries_that_may_not_be_committed(self):
+        cursor = self.sync()['cursor']
+        # The first sync created the (empty) friend list
+        FriendList.objects.get(user=self.user1).friends.add(self.user2)
+        changes.record('friends', [(self.user1.id, self.user2.id)])
+
+        # Sent now, and again until the entry is older than the lag
+        data = self.sync(cursor)
+        self.assertEqual([friend['name'] for friend in data['friends']['upserted']], ['Testuser2'])
+        self.assertEqual(data['cursor'], cursor)
+        self.assertFalse(data['has_more'])
+        self.assertEqual(self.sync()['cursor'], cursor)
+
+        Change.objects.update(created_at=timezone.now() - timedelta(seconds=10))
+        data = self.sync(cursor)
+        self.assertEqual(data['cursor'], Change.objects.get().id)
+        self.assertEqual(self.sync(data['cursor'])['friends']['upserted'], [])
+
+    def test_invalid_cursor(self):
+        response = self.client.get(self.url, {'cursor': 'latest'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        self.client.credentials()
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class SyncQueryBudgetTest(QueryBudgetMixin, SyncTestMixin, APITestCase):
+    """The sync endpoint must run a constant number of queries"""
+
+    def setUp(self):
+        self.user = self.create_user('testuser1')
+        self.url = reverse('sync')
+        self.authenticate(self.user)
+        self.now = timezone.now()
+
+    def seed(self, size):
+        """size friends, each with a competition and an invitation to it, all logged as changes"""
+        friends = make_users(size, 'friend')
+        FriendList.objects.create(user=self.user).friends.add(*friends)
+        competitions = Competition.objects.bulk_create([
+            Competition(title=f'Competition {i}', creator=friend,
+                        start_date=self.now + timedelta(days=1), end_date=self.now + timedelta(days=8))
+            for i, friend in enumerate(friends)
+        ])
+        Participant.objects.bulk_create([Participant(user=friend, competition=competition)
+                                         for friend, competition in zip(friends, competitions)])
+        invitations = CompetitionInvitation.objects.bulk_create([
+            CompetitionInvitation(competition=competition, sender=competition.creator, receiver=self.user)
+            for competition in competitions
+        ])
+        changes.record('friends', [(self.user.id, friend.id) for friend in friends])
+        changes.record('competition_invitations', [(self.user.id, invitation.id) for invitation in invitations])
+
+    def test_snapshot(self):
+        self.assertConstantQueries(self.seed, lambda state: self.client.get(self.url))
+
+    def test_delta(self):
+        self.assertConstantQueries(self.seed, lambda state: self.client.get(self.url, {'cursor': 0}))
+
+
+class SyncCompactionPlanTest(QueryPlanMixin, SyncTestMixin, APITestCase):
+    """Compaction must find superseded entries through an index"""
+
+    def test_compact(self):
+        user = self.create_user('testuser1')
+        for _ in range(3):
+            changes.record('friends', [(user.id, user.id)])
+        compaction = self.assertIndexedQueries(lambda: SyncService.compact(timedelta(days=30), batch_size=1))
+        self.assertEqual(compaction.superseded_removed, 2)
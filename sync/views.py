@@ -0,0 +1,45 @@
+from django.conf import settings
+from rest_framework import status
+from rest_framework.decorators import api_view, authentication_classes, permission_classes
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from competitions.serializers import CompetitionInvitationSerializer, CompetitionListSerializer
+from friendships.serializers import FriendRequestSerializer
+from users.serializers import ProfileSerializer
+from .services import SyncService
+
+SERIALIZERS = {
+    'friends': ProfileSerializer,
+    'friend_requests': FriendRequestSerializer,
+    'competition_invitations': CompetitionInvitationSerializer,
+    'competitions': CompetitionListSerializer,
+}
+
+@api_view(['GET'])
+@authentication_classes([TokenAuthentication])
+@permission_classes([IsAuthenticated])
+def sync(request):
+    """
+    Friends, friend requests, invitations and competitions changed since
+    ?cursor=. Without a cursor, or with one that is too old, everything is
+    returned with "reset": true. Repeat with the returned cursor while
+    "has_more" is true.
+    """
+    cursor = request.query_params.get('cursor')
+    if cursor is not None:
+        try:
+            cursor = int(cursor)
+        except ValueError:
+            return Response({"error": "Cursor must be an integer"}, status=status.HTTP_400_BAD_REQUEST)
+
+    result = SyncService.get_changes(request.user, cursor, settings.SYNC_PAGE_SIZE)
+
+    context = {'request': request, 'avatar_context': 'list'}
+    data = {'cursor': result['cursor'], 'reset': result['reset'], 'has_more': result['has_more']}
+    for entity, serializer_class in SERIALIZERS.items():
+        data[entity] = {
+            'upserted': serializer_class(result['upserted'][entity], many=True, context=context).data,
+            'deleted': result['deleted'][entity],
+        }
+    return Response(data, status=status.HTTP_200_OK)
@@ -0,0 +1,73 @@
+"""
+Avatar image processing, kept off the request path.
+
+Uploads are staged on local disk by ``AvatarService.stage_upload`` and
+handed to a background thread here, which decodes them once with Pillow,
+renders every size in AVATAR_SIZES and stores the variants.
+"""
+import io
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.db import close_old_connections, connections
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+EXTENSIONS = {'WEBP': 'webp', 'JPEG': 'jpg'}
+
+
+def render_variants(path, sizes, image_format='WEBP', quality=80):
+    """
+    Decode the image at path once and return {size: encoded bytes} of
+    square, center-cropped variants for each size.
+    """
+    from PIL import Image, ImageOps  # Pillow is only needed by the worker
+
+    with Image.open(path) as source:
+        largest = max(sizes)
+        # Let the JPEG decoder skip detail we are going to throw away anyway
+        source.draft('RGB', (largest, largest))
+        image = ImageOps.exif_transpose(source)
+        has_alpha = image_format == 'WEBP' and 'A' in image.getbands()
+        image = image.convert('RGBA' if has_alpha else 'RGB')
+
+    side = min(largest, *image.size)
+    current = ImageOps.fit(image, (side, side), Image.LANCZOS)
+    variants = {}
+    # Downscale progressively from the previous (larger) variant
+    for size in sorted(sizes, reverse=True):
+        if size < current.width:
+            current = current.resize((size, size), Image.LANCZOS)
+        buffer = io.BytesIO()
+        if image_format == 'WEBP':
+            current.save(buffer, 'WEBP', quality=quality, method=4)
+        else:
+            current.save(buffer, 'JPEG', quality=quality, optimize=True, progressive=True)
+        variants[size] = buffer.getvalue()
+    return variants
+
+
+def _run(upload_id):
+    from .services import AvatarService
+    close_old_connections()
+    try:
+        AvatarService.process_upload(upload_id)
+    except Exception:
+        logger.exception("Processing avatar upload %s failed", upload_id)
+    finally:
+        connections.close_all()
+
+
+def submit(upload_id):
+    """Queue an upload for processing on the background avatar thread"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.AVATAR_WORKER_THREADS, thread_name_prefix='avatar'
+            )
+    return _executor.submit(_run, upload_id)
@@ -0,0 +1,27 @@
+import time
+from django.core.management.base import BaseCommand
+from users.services import AvatarService
+
+
+class Command(BaseCommand):
+    help = (
+        "Process staged avatar uploads that are still pending, and render the "
+        "variants of avatars stored before variants existed"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help="Keep polling for new uploads")
+        parser.add_argument('--interval', type=float, default=5.0, help="Seconds between polls with --loop")
+        parser.add_argument('--backfill-batch', type=int, default=50,
+                            help="Avatars without variants to backfill per poll (0 disables)")
+
+    def handle(self, *args, **options):
+        while True:
+            processed = AvatarService.process_pending()
+            if options['backfill_batch']:
+                processed += AvatarService.backfill_variants(options['backfill_batch'])
+            for upload in processed:
+                self.stdout.write(f"Upload {upload.id}: {upload.status}")
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
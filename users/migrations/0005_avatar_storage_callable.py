@@ -0,0 +1,19 @@
+# Generated by Django 5.2 on 2026-10-19 17:07
+
+import users.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0004_remove_profile_avatarurl_profile_avatar'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='profile',
+            name='avatar',
+            field=models.ImageField(blank=True, storage=users.storage.avatar_storage, upload_to='avatars/'),
+        ),
+    ]
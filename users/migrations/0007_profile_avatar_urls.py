@@ -0,0 +1,29 @@
+# Generated by Django 5.2 on 2026-10-19 17:15
+
+from django.db import migrations, models
+
+
+def resolve_avatar_urls(apps, schema_editor):
+    from users.storage import avatar_storage
+    Profile = apps.get_model('users', 'Profile')
+    for profile in Profile.objects.exclude(avatar_variants={}):
+        profile.avatar_urls = {
+            size: avatar_storage().url(name) for size, name in profile.avatar_variants.items()
+        }
+        profile.save(update_fields=['avatar_urls'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0006_avatar_upload_pipeline'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='avatar_urls',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.RunPython(resolve_avatar_urls, migrations.RunPython.noop),
+    ]
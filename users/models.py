@@ -1,6 +1,6 @@
 from django.db import models
-from cloudinary_storage.storage import MediaCloudinaryStorage
 from django.contrib.auth.models import AbstractUser
+from .storage import avatar_storage
 
 class User(AbstractUser):
     email = models.EmailField(unique = True)
@@ -14,10 +14,34 @@ class Profile(models.Model):
     user = models.OneToOneField(User, on_delete = models.CASCADE, primary_key = True)
     name = models.CharField(max_length = 40)
     avatar = models.ImageField(
-        storage=MediaCloudinaryStorage(),
+        storage=avatar_storage,
         upload_to='avatars/',
         blank=True,
     )
+    # Storage names and public URLs of the resized avatar variants, keyed by
+    # size in pixels. URLs are resolved once at upload so serializing a
+    # profile never calls the storage backend.
+    avatar_variants = models.JSONField(default=dict, blank=True)
+    avatar_urls = models.JSONField(default=dict, blank=True)
 
     def __str__(self):
-        return f"{self.name}'s Profile"
\ No newline at end of file
+        return f"{self.name}'s Profile"
+
+class AvatarUpload(models.Model):
+    STATUS_CHOICES = (
+        ('pending', 'Pending'),
+        ('processing', 'Processing'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+        ('superseded', 'Superseded'),
+    )
+
+    profile = models.ForeignKey(Profile, on_delete=models.CASCADE, related_name='avatar_uploads')
+    staged_path = models.CharField(max_length=255)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Avatar upload for {self.profile.user} - {self.status}"
\ No newline at end of file
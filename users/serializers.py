@@ -1,3 +1,4 @@
+from django.conf import settings
 from rest_framework import serializers
 from .models import User, Profile
 
@@ -8,12 +9,38 @@ class UserSerializer(serializers.ModelSerializer):
         extra_kwargs = {'password': {'write_only': True}}
 
 class ProfileSerializer(serializers.ModelSerializer):
+    """
+    Profile with the URL of the avatar variant that fits the display size.
+
+    The size comes from the ?avatar_size= query parameter, else from the
+    'avatar_context' in the serializer context (see AVATAR_CONTEXT_SIZES).
+    """
     user = UserSerializer()
+    avatar = serializers.SerializerMethodField()
 
     class Meta:
         model = Profile
         fields = ['user', 'name', 'avatar']
 
+    def get_avatar_size(self):
+        request = self.context.get('request')
+        requested = request.query_params.get('avatar_size') if request is not None else None
+        if requested and requested.isdigit():
+            return int(requested)
+        avatar_context = self.context.get('avatar_context', 'profile')
+        return settings.AVATAR_CONTEXT_SIZES.get(avatar_context, max(settings.AVATAR_SIZES))
+
+    def get_avatar(self, obj):
+        urls = obj.avatar_urls
+        if not urls:
+            # Avatars uploaded before variants existed
+            return obj.avatar.url if obj.avatar else None
+        wanted = self.get_avatar_size()
+        sizes = sorted(int(size) for size in urls)
+        # Smallest variant at least as large as wanted, else the largest one
+        chosen = next((size for size in sizes if size >= wanted), sizes[-1])
+        return urls[str(chosen)]
+
 class LoginSerializer(serializers.Serializer):
     username = serializers.CharField()
     password = serializers.CharField()
\ No newline at end of file
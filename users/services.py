@@ -1,8 +1,20 @@
+import logging
+import os
+import uuid
+from datetime import timedelta
 from django.contrib.auth import authenticate
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.utils import timezone
 from rest_framework.authtoken.models import Token
-from .models import User, Profile
+from .models import User, Profile, AvatarUpload
+from .storage import avatar_storage
+from . import avatars
+from sync import changes
 from django.conf import settings
 
+logger = logging.getLogger(__name__)
+
 class UserService:
     @staticmethod
     def create_user(username, email, password):
@@ -74,14 +86,162 @@ class UserService:
         # Update profile fields if provided
         if name:
             profile.name = name
-        if avatar is not None:  # Check if a file was uploaded
-            profile.avatar = avatar
             
-        profile.save()
+        with transaction.atomic():
+            profile.save()
+            changes.record_profile_change(user.id)
+        if avatar is not None:  # Check if a file was uploaded
+            # Resized and stored in the background; the profile switches when done
+            AvatarService.stage_upload(profile, avatar)
         return True, profile
     
     @staticmethod
     def delete_user(user):
-        # Profile will be automatically deleted due to CASCADE
-        user.delete()
-        return True
\ No newline at end of file
+        with transaction.atomic():
+            changes.record_user_deletion(user)
+            # Profile will be automatically deleted due to CASCADE
+            user.delete()
+        return True
+
+class AvatarService:
+    @staticmethod
+    def stage_upload(profile, uploaded_file):
+        """Write an uploaded avatar to local staging and queue it for processing"""
+        upload = AvatarService._stage(profile, uploaded_file)
+        if settings.AVATAR_PROCESSING_MODE == 'inline':
+            AvatarService.process_upload(upload.pk)
+            upload.refresh_from_db()
+            profile.refresh_from_db(fields=['avatar', 'avatar_variants', 'avatar_urls'])
+        else:
+            transaction.on_commit(lambda: avatars.submit(upload.pk))
+        return upload
+
+    @staticmethod
+    def process_upload(upload_id):
+        """
+        Render and store the variants of a staged upload, then point the
+        profile at them. Returns the upload, or None if it was already claimed.
+        """
+        # Claim the upload so two workers never process it twice
+        claimed = AvatarUpload.objects.filter(
+            id=upload_id, status='pending'
+        ).update(status='processing', updated_at=timezone.now())
+        if not claimed:
+            return None
+        upload = AvatarUpload.objects.get(id=upload_id)
+
+        storage = avatar_storage()
+        image_format = settings.AVATAR_FORMAT
+        names = {}
+        try:
+            variants = avatars.render_variants(
+                upload.staged_path, settings.AVATAR_SIZES, image_format, settings.AVATAR_QUALITY
+            )
+            token = uuid.uuid4().hex[:12]
+            extension = avatars.EXTENSIONS[image_format]
+            for size, data in variants.items():
+                name = f'avatars/{upload.profile_id}/{token}_{size}.{extension}'
+                names[str(size)] = storage.save(name, ContentFile(data))
+        except Exception as exc:
+            logger.exception("Could not process avatar upload %s", upload.id)
+            AvatarService._delete_files(names.values())
+            upload.status = 'failed'
+            upload.error = str(exc)
+            upload.save()
+            AvatarService._discard_staged(upload)
+            return upload
+
+        old_names = []
+        with transaction.atomic():
+            profile = Profile.objects.select_for_update().get(pk=upload.profile_id)
+            superseded = AvatarUpload.objects.filter(
+                profile_id=upload.profile_id, id__gt=upload.id
+            ).exclude(status='failed').exists()
+            if superseded:
+                # A newer upload is on its way; don't overwrite it with this one
+                upload.status = 'superseded'
+                old_names = list(names.values())
+            else:
+                old_names = list(profile.avatar_variants.values())
+                if profile.avatar and profile.avatar.name not in old_names:
+                    old_names.append(profile.avatar.name)
+                profile.avatar = names[str(max(settings.AVATAR_SIZES))]
+                profile.avatar_variants = names
+                profile.avatar_urls = {size: storage.url(name) for size, name in names.items()}
+                profile.save(update_fields=['avatar', 'avatar_variants', 'avatar_urls'])
+                changes.record_profile_change(profile.user_id)
+                upload.status = 'done'
+            upload.save()
+
+        AvatarService._delete_files(old_names)
+        AvatarService._discard_staged(upload)
+        return upload
+
+    @staticmethod
+    def process_pending(stale_after=timedelta(minutes=10)):
+        """
+        Process uploads left pending, e.g. after a restart. Uploads stuck in
+        'processing' for longer than stale_after are retried.
+        """
+        AvatarUpload.objects.filter(
+            status='processing',
+            updated_at__lt=timezone.now() - stale_after
+        ).update(status='pending')
+        processed = []
+        for upload_id in AvatarUpload.objects.filter(status='pending').order_by('id').values_list('id', flat=True):
+            upload = AvatarService.process_upload(upload_id)
+            if upload:
+                processed.append(upload)
+        return processed
+
+    @staticmethod
+    def backfill_variants(limit=50):
+        """
+        Render the variants of up to limit avatars stored before variants
+        existed (an avatar, no variants and no upload), from the stored
+        original. Returns the uploads; an original that cannot be read gets
+        a failed upload so it is not retried.
+        """
+        storage = avatar_storage()
+        profiles = Profile.objects.exclude(avatar='').filter(
+            avatar_variants={}, avatar_uploads__isnull=True
+        ).order_by('pk')[:limit]
+        processed = []
+        for profile in profiles:
+            try:
+                with storage.open(profile.avatar.name) as original:
+                    upload = AvatarService._stage(profile, original)
+            except OSError as exc:
+                logger.warning("Could not read avatar %s of profile %s", profile.avatar.name, profile.pk)
+                processed.append(AvatarUpload.objects.create(profile=profile, status='failed', error=str(exc)))
+                continue
+            upload = AvatarService.process_upload(upload.pk)
+            if upload:
+                processed.append(upload)
+        return processed
+
+    @staticmethod
+    def _stage(profile, uploaded_file):
+        os.makedirs(settings.AVATAR_STAGING_DIR, exist_ok=True)
+        extension = os.path.splitext(uploaded_file.name or '')[1].lower()[:10]
+        staged_path = os.path.join(settings.AVATAR_STAGING_DIR, f'{profile.pk}-{uuid.uuid4().hex}{extension}')
+        with open(staged_path, 'wb') as staged:
+            for chunk in uploaded_file.chunks():
+                staged.write(chunk)
+        return AvatarUpload.objects.create(profile=profile, staged_path=staged_path)
+
+    @staticmethod
+    def _delete_files(names):
+        storage = avatar_storage()
+        for name in names:
+            try:
+                storage.delete(name)
+            except Exception:
+                logger.warning("Could not delete avatar file %s", name, exc_info=True)
+
+    @staticmethod
+    def _discard_staged(upload):
+        try:
+            os.remove(upload.staged_path)
+        except OSError:
+            pass
@@ -0,0 +1,29 @@
+from django.conf import settings
+from django.core.files.storage import storages
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.functional import LazyObject, empty
+
+
+class AvatarStorage(LazyObject):
+    """
+    Storage for profile avatars, resolved from STORAGES on first use so the
+    backend (Cloudinary in production) is not imported at startup.
+    """
+
+    def _setup(self):
+        self._wrapped = storages[settings.AVATAR_STORAGE_ALIAS]
+
+
+_avatar_storage = AvatarStorage()
+
+
+def avatar_storage():
+    """Callable used by Profile.avatar so migrations don't pin a backend"""
+    return _avatar_storage
+
+
+@receiver(setting_changed)
+def reset_avatar_storage(*, setting, **kwargs):
+    if setting in ('STORAGES', 'AVATAR_STORAGE_ALIAS'):
+        _avatar_storage._wrapped = empty
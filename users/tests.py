@@ -1,14 +1,47 @@
-from django.test import TestCase
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
 from django.urls import reverse
 from rest_framework.test import APITestCase, APIClient
 from rest_framework.authtoken.models import Token
 from rest_framework import status
-from .models import User, Profile
-from .services import UserService
+from unittest import mock
+from .models import User, Profile, AvatarUpload
+from .services import UserService, AvatarService
+from .serializers import ProfileSerializer
+from .storage import avatar_storage
+from friendships.models import FriendList, FriendRequest
+from monitoring.testing import QueryBudgetMixin, make_users
+import atexit
+import os
+import shutil
 import tempfile
 from PIL import Image
 import io
 
+# Local filesystem stand-in for the avatar storage, processed inline
+AVATAR_TEST_DIR = tempfile.mkdtemp()
+# Removed at exit rather than in tearDownModule: parallel test workers share it
+atexit.register(shutil.rmtree, AVATAR_TEST_DIR, ignore_errors=True)
+local_avatar_settings = override_settings(
+    STORAGES={
+        **settings.STORAGES,
+        'avatars': {
+            'BACKEND': 'django.core.files.storage.FileSystemStorage',
+            'OPTIONS': {'location': os.path.join(AVATAR_TEST_DIR, 'media')},
+        },
+    },
+    AVATAR_STAGING_DIR=os.path.join(AVATAR_TEST_DIR, 'staging'),
+    AVATAR_PROCESSING_MODE='inline',
+)
+
+def create_image_upload(size=(800, 600), name='test.jpg'):
+    image = Image.new('RGB', size, color='red')
+    buffer = io.BytesIO()
+    image.save(buffer, format='JPEG')
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/jpeg')
+
 class UserModelTest(TestCase):
     """Tests for the User model"""
     
@@ -214,6 +247,122 @@ class UserServiceTest(TestCase):
         self.assertFalse(User.objects.filter(id=user.id).exists())
         self.assertFalse(Profile.objects.filter(user_id=user.id).exists())
 
+@local_avatar_settings
+class AvatarServiceTest(TestCase):
+    """Tests for the staged avatar processing pipeline"""
+
+    def setUp(self):
+        self.user = UserService.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpassword123'
+        )
+        self.profile = UserService.create_profile(self.user)
+
+    def test_upload_is_resized_into_variants(self):
+        upload = AvatarService.stage_upload(self.profile, create_image_upload())
+
+        self.assertEqual(upload.status, 'done')
+        self.assertFalse(os.path.exists(upload.staged_path))
+        self.assertEqual(set(self.profile.avatar_variants), {str(size) for size in settings.AVATAR_SIZES})
+        self.assertEqual(self.profile.avatar.name, self.profile.avatar_variants['512'])
+        for size, name in self.profile.avatar_variants.items():
+            with avatar_storage().open(name) as stored, Image.open(stored) as image:
+                self.assertEqual(image.format, 'WEBP')
+                self.assertEqual(image.size, (int(size), int(size)))
+
+    def test_replacing_avatar_deletes_old_variants(self):
+        AvatarService.stage_upload(self.profile, create_image_upload())
+        old_names = list(self.profile.avatar_variants.values())
+
+        AvatarService.stage_upload(self.profile, create_image_upload())
+        for name in old_names:
+            self.assertFalse(avatar_storage().exists(name))
+        self.assertNotEqual(list(self.profile.avatar_variants.values()), old_names)
+
+    def test_small_images_are_not_upscaled(self):
+        AvatarService.stage_upload(self.profile, create_image_upload(size=(100, 80)))
+        with avatar_storage().open(self.profile.avatar_variants['512']) as stored, Image.open(stored) as image:
+            self.assertEqual(image.size, (80, 80))
+
+    def test_invalid_image_fails_without_touching_profile(self):
+        bogus = SimpleUploadedFile('avatar.jpg', b'not an image', content_type='image/jpeg')
+        with self.assertLogs('users.services', 'ERROR'):
+            upload = AvatarService.stage_upload(self.profile, bogus)
+        self.assertEqual(upload.status, 'failed')
+        self.assertFalse(self.profile.avatar)
+        self.assertEqual(self.profile.avatar_variants, {})
+
+    def test_older_upload_does_not_overwrite_newer(self):
+        with override_settings(AVATAR_PROCESSING_MODE='thread'), mock.patch('users.avatars.submit'):
+            older = AvatarService.stage_upload(self.profile, create_image_upload())
+            AvatarService.stage_upload(self.profile, create_image_upload())
+
+        older = AvatarService.process_upload(older.id)
+        self.assertEqual(older.status, 'superseded')
+        self.profile.refresh_from_db()
+        self.assertFalse(self.profile.avatar)
+
+        processed = AvatarService.process_pending()
+        self.assertEqual([upload.status for upload in processed], ['done'])
+
+    def store_legacy_avatar(self):
+        """An avatar saved as-is, the way uploads were stored before variants existed"""
+        name = avatar_storage().save('avatars/legacy.jpg', create_image_upload())
+        Profile.objects.filter(pk=self.profile.pk).update(avatar=name)
+        return name
+
+    def test_backfill_renders_variants_of_legacy_avatars(self):
+        name = self.store_legacy_avatar()
+
+        out = io.StringIO()
+        call_command('process_avatars', stdout=out)
+
+        self.profile.refresh_from_db()
+        self.assertEqual(set(self.profile.avatar_variants), {str(size) for size in settings.AVATAR_SIZES})
+        self.assertEqual(self.profile.avatar.name, self.profile.avatar_variants['512'])
+        self.assertFalse(avatar_storage().exists(name))
+        self.assertIn(': done', out.getvalue())
+        # Already backfilled
+        self.assertEqual(AvatarService.backfill_variants(), [])
+
+    def test_backfill_gives_up_on_missing_original(self):
+        name = self.store_legacy_avatar()
+        avatar_storage().delete(name)
+
+        with self.assertLogs('users.services', 'WARNING'):
+            [upload] = AvatarService.backfill_variants()
+        self.assertEqual(upload.status, 'failed')
+        self.assertEqual(AvatarService.backfill_variants(), [])
+
+    def test_variant_urls_are_stored(self):
+        AvatarService.stage_upload(self.profile, create_image_upload())
+        self.assertEqual(set(self.profile.avatar_urls), set(self.profile.avatar_variants))
+        for size, name in self.profile.avatar_variants.items():
+            self.assertEqual(self.profile.avatar_urls[size], avatar_storage().url(name))
+
+    def test_serializer_picks_size_by_context(self):
+        AvatarService.stage_upload(self.profile, create_image_upload())
+        urls = self.profile.avatar_urls
+
+        self.assertEqual(ProfileSerializer(self.profile).data['avatar'], urls['512'])
+        data = ProfileSerializer(self.profile, context={'avatar_context': 'leaderboard'}).data
+        self.assertEqual(data['avatar'], urls['64'])
+
+    def test_serializer_does_not_touch_storage(self):
+        AvatarService.stage_upload(self.profile, create_image_upload())
+        with mock.patch.object(avatar_storage(), 'url', side_effect=AssertionError('storage used')):
+            ProfileSerializer(self.profile, context={'avatar_context': 'list'}).data
+
+    def test_thread_mode_queues_after_commit(self):
+        with override_settings(AVATAR_PROCESSING_MODE='thread'), mock.patch('users.avatars.submit') as submit:
+            with self.captureOnCommitCallbacks(execute=True):
+                upload = AvatarService.stage_upload(self.profile, create_image_upload())
+                submit.assert_not_called()
+        submit.assert_called_once_with(upload.id)
+        self.assertEqual(AvatarUpload.objects.get(id=upload.id).status, 'pending')
+
+@local_avatar_settings
 class ViewTests(APITestCase):
     """Tests for the API views"""
     
@@ -351,6 +500,11 @@ class ViewTests(APITestCase):
         response = self.client.put(self.update_profile_url, data, format='multipart')
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertIsNotNone(response.data['avatar'])
+
+        # The avatar size can be requested explicitly
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        response = self.client.get(self.profile_url, {'avatar_size': 200})
+        self.assertEqual(response.data['avatar'], Profile.objects.get(user=user).avatar_urls['256'])
         
     def test_delete_user(self):
         # Create a user and get token
@@ -369,4 +523,47 @@ class ViewTests(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
         
         # Verify user is deleted
-        self.assertFalse(User.objects.filter(id=user.id).exists())
\ No newline at end of file
+        self.assertFalse(User.objects.filter(id=user.id).exists())
+
+
+class UserQueryBudgetTest(QueryBudgetMixin, APITestCase):
+    """User endpoints must run a constant number of queries"""
+
+    def setUp(self):
+        self.user = UserService.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpassword123'
+        )
+        UserService.create_profile(self.user, name='Test User')
+        token = UserService.create_auth_token(self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+
+    def add_friends(self, size):
+        """size friends and size pending friend requests"""
+        friends = make_users(size, 'friend')
+        FriendList.objects.create(user=self.user).friends.add(*friends)
+        FriendRequest.objects.bulk_create(
+            [FriendRequest(sender=sender, receiver=self.user) for sender in make_users(size, 'sender')]
+        )
+        return friends
+
+    def test_profile(self):
+        self.assertConstantQueries(self.add_friends, lambda state: self.client.get(reverse('profile')))
+
+    def test_update_profile(self):
+        self.assertConstantQueries(
+            self.add_friends,
+            lambda state: self.client.put(
+                reverse('update_profile'), {'name': 'Updated Name', 'username': 'updateduser'}, format='multipart'
+            ),
+        )
+
+    def test_login(self):
+        self.client.credentials()
+        self.assertConstantQueries(
+            self.add_friends,
+            lambda state: self.client.post(
+                reverse('login'), {'username': 'testuser', 'password': 'testpassword123'}, format='json'
+            ),
+        )
@@ -46,7 +46,7 @@ def login(request):
             token = UserService.get_or_create_auth_token(user)
             profile = UserService.get_user_profile(user)
             return Response(
-                {'token': token.key, 'user': ProfileSerializer(profile).data}, 
+                {'token': token.key, 'user': ProfileSerializer(profile, context={'request': request}).data}, 
                 status=status.HTTP_200_OK
             )
         return Response({'error': 'Invalid credentials'}, status=status.HTTP_401_UNAUTHORIZED)
@@ -66,7 +66,7 @@ def profile(request):
     profile = UserService.get_user_profile(request.user)
     if not profile:
         profile = UserService.create_profile(request.user)
-    serializer = ProfileSerializer(profile)
+    serializer = ProfileSerializer(profile, context={'request': request})
     print("Profile data: ", serializer.data)
     return Response(serializer.data, status=status.HTTP_200_OK)
 
@@ -92,7 +92,7 @@ def update_profile(request):
     )
     
     if success:
-        return Response(ProfileSerializer(result).data, status=status.HTTP_200_OK)
+        return Response(ProfileSerializer(result, context={'request': request}).data, status=status.HTTP_200_OK)
     else:
         return Response({'error': result}, status=status.HTTP_400_BAD_REQUEST)
 